@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""
+Export the frozen inference graph of a babbler, so later runs can skip building it.
+
+Call: conda run -n unirep scripts/export_graph.py {model_size} {model_path} [precision] [cell_states] [output_dir]
+
+model_path "None" uses (and downloads) the published weights. cell_states ("1") also
+exports the per-residue cell state output, which only hidden_and_cell rep requests use.
+The graph is written to output_dir, by default
+unirep.frozen_dir(model_path, precision, cell_states), where the inference daemon
+and workers pick it up instead of building the graph (see unirep.load_frozen).
+"""
+if __name__ == "__main__":
+    import sys
+    import os
+    from unirep_source.metrics import StageTimer
+
+    timer = StageTimer()
+    MODEL_SIZE = int(sys.argv[1])
+    MODEL_WEIGHT_PATH = sys.argv[2]
+    # float32, float16 or int8. Only the 1900 model supports reduced precision, the
+    # others raise.
+    PRECISION = sys.argv[3] if len(sys.argv) > 3 else "float32"
+    CELL_STATES = len(sys.argv) > 4 and sys.argv[4] == "1"
+
+    if MODEL_SIZE not in [64, 256, 1900]:
+        print("Invalid model size")
+        exit(1)
+
+    from unirep_source.serving import download_weights
+    from unirep_source.unirep import babbler64, babbler256, babbler1900, frozen_dir, load_frozen
+
+    os.chdir("/root")
+    with timer.stage("download_weights"):
+        if MODEL_WEIGHT_PATH == "None":
+            MODEL_WEIGHT_PATH = download_weights(MODEL_SIZE)
+    OUTPUT_DIR = sys.argv[5] if len(sys.argv) > 5 else frozen_dir(MODEL_WEIGHT_PATH, PRECISION, CELL_STATES)
+
+    babblers = {64: babbler64, 256: babbler256, 1900: babbler1900}
+    with timer.stage("model_build"):
+        b = babblers[MODEL_SIZE](batch_size=12, model_path=MODEL_WEIGHT_PATH,
+                                 cell_states=CELL_STATES, precision=PRECISION)
+    with timer.stage("export"):
+        b.export_frozen(OUTPUT_DIR)
+
+    # Check the export against the graph it came from
+    seq = "MKVLATCHEEK"
+    with timer.stage("load_frozen"):
+        frozen = load_frozen(OUTPUT_DIR)
+    for expected, got in zip(b.get_rep(seq), frozen.get_rep(seq)):
+        if not abs(expected - got).max() < 1e-4:
+            print("The exported graph does not reproduce the model's reps")
+            exit(1)
+    for name, total in timer.totals().items():
+        print("{}: {:.2f}s".format(name, total["wall_s"]))
+    print("Exported to {}".format(OUTPUT_DIR))
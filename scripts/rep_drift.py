@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+Measure how far the representations of the reduced precision 1900 models drift from
+the float32 model on a reference set of sequences.
+
+Call: conda run -n unirep scripts/rep_drift.py {model_path} {seqs_path} {output_json} [precision ...]
+
+seqs_path is a csv of seq,name rows (see data_utils.read_seqs_csv). The
+output json holds, per precision and per representation (avg_hidden, final_hidden,
+final_cell), the mean and worst cosine similarity, the mean relative L2 error and the
+max absolute error against float32, plus the seconds per sequence.
+"""
+import json
+import sys
+import time
+
+import numpy as np
+
+from unirep_source.data_utils import read_seqs_csv
+
+REPS = ["avg_hidden", "final_hidden", "final_cell"]
+
+
+def get_reps(model_path, seqs, precision):
+    import tensorflow as tf
+    from unirep_source.unirep import babbler1900
+
+    # A fresh graph per model so the variables of the different precisions do not clash
+    with tf.Graph().as_default():
+        b = babbler1900(model_path=model_path, batch_size=1, precision=precision)
+        start = time.time()
+        reps = [b.get_rep(seq) for seq in seqs]
+        seconds = (time.time() - start) / max(len(seqs), 1)
+    # [rep kind, sequence, rnn_size]
+    return np.array(reps).transpose(1, 0, 2), seconds
+
+
+def drift(reference, reps):
+    cosine = np.sum(reference * reps, axis=1) / (
+        np.linalg.norm(reference, axis=1) * np.linalg.norm(reps, axis=1)
+    )
+    relative = np.linalg.norm(reference - reps, axis=1) / np.linalg.norm(reference, axis=1)
+    return {
+        "mean_cosine": float(cosine.mean()),
+        "min_cosine": float(cosine.min()),
+        "mean_relative_l2": float(relative.mean()),
+        "max_abs_error": float(np.abs(reference - reps).max()),
+    }
+
+
+if __name__ == "__main__":
+    MODEL_PATH = sys.argv[1]
+    SEQS_PATH = sys.argv[2]
+    OUTPUT_PATH = sys.argv[3]
+    PRECISIONS = sys.argv[4:] or ["float16", "int8"]
+
+    seqs = [row[0] for row in read_seqs_csv(SEQS_PATH)]
+
+    reference, reference_seconds = get_reps(MODEL_PATH, seqs, "float32")
+    results = {"num_seqs": len(seqs), "float32": {"seconds_per_seq": reference_seconds}}
+    for precision in PRECISIONS:
+        reps, seconds = get_reps(MODEL_PATH, seqs, precision)
+        results[precision] = {"seconds_per_seq": seconds}
+        for i, rep in enumerate(REPS):
+            results[precision][rep] = drift(reference[i], reps[i])
+
+    with open(OUTPUT_PATH, "w") as f:
+        json.dump(results, f, indent=2)
+    print(json.dumps(results, indent=2))
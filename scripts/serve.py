@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+Long-lived local inference daemon for the babblers.
+
+Call: conda run --no-capture-output -n unirep scripts/serve.py [socket_path] [max_batch] [max_wait_ms]
+
+Listens on a Unix socket (default $UNIREP_SOCKET or /tmp/unirep.sock) for framing
+messages in the format of unirep_source/serving.py. Models stay loaded between
+requests. Requests that arrive within max_wait_ms of each other (up to max_batch
+sequences) and ask for the same op, model and parameters are merged and run as one
+batch, then the results are split back per request. Any number of requests can be
+sent over one connection. At most $UNIREP_MAX_MODELS (default 4) models stay loaded,
+the least recently used one is closed to make room for a new one.
+"""
+import json
+import os
+import queue
+import socketserver
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from unirep_source.framing import read_message, write_message
+from unirep_source.serving import ModelPool, handle, split_response
+
+DEFAULT_SOCKET = os.environ.get("UNIREP_SOCKET", "/tmp/unirep.sock")
+
+
+class Pending():
+    """
+    A request waiting for the batcher, and the response once it is done.
+    """
+
+    def __init__(self, header, arrays):
+        self.header = header
+        self.arrays = arrays
+        self.count = len(arrays.get("seq_lengths", []))
+        self.key = json.dumps(
+            {k: header.get(k) for k in ["op", "model_size", "model_path", "precision", "params"]},
+            sort_keys=True)
+        self.response = None
+        self.done = threading.Event()
+
+
+def run_group(pool, group):
+    header = group[0].header
+    arrays = {
+        "seqs": np.concatenate([p.arrays["seqs"] for p in group]),
+        "seq_lengths": np.concatenate([p.arrays["seq_lengths"] for p in group]),
+    }
+    response_header, response_arrays = handle(pool, header, arrays)
+    if response_header["ok"]:
+        responses = split_response(response_header, response_arrays, [p.count for p in group])
+    else:
+        responses = [(response_header, {})] * len(group)
+    for p, response in zip(group, responses):
+        p.response = response
+        p.done.set()
+
+
+def batch_loop(pool, requests, max_batch, max_wait):
+    """
+    Collect requests until max_batch sequences are waiting or max_wait seconds have
+    passed since the first one, then run every group of compatible requests together.
+    """
+    while True:
+        batch = [requests.get()]
+        count = batch[0].count
+        deadline = time.time() + max_wait
+        while count < max_batch:
+            timeout = deadline - time.time()
+            if timeout <= 0:
+                break
+            try:
+                pending = requests.get(timeout=timeout)
+            except queue.Empty:
+                break
+            batch.append(pending)
+            count += pending.count
+        groups = OrderedDict()
+        for pending in batch:
+            groups.setdefault(pending.key, []).append(pending)
+        for group in groups.values():
+            run_group(pool, group)
+
+
+def make_handler(requests):
+
+    class Handler(socketserver.StreamRequestHandler):
+
+        def handle(self):
+            while True:
+                message = read_message(self.rfile)
+                if message is None:
+                    return
+                pending = Pending(*message)
+                requests.put(pending)
+                pending.done.wait()
+                write_message(self.wfile, *pending.response)
+
+    return Handler
+
+
+if __name__ == "__main__":
+    SOCKET_PATH = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_SOCKET
+    MAX_BATCH = int(sys.argv[2]) if len(sys.argv) > 2 else 64
+    MAX_WAIT = (float(sys.argv[3]) if len(sys.argv) > 3 else 20) / 1000
+
+    if os.path.exists(SOCKET_PATH):
+        os.unlink(SOCKET_PATH)
+    requests = queue.Queue()
+    # Opt-in op-level traces, as for the worker (see babbler.enable_profiling)
+    trace_every = int(os.environ.get("UNIREP_TRACE_EVERY", 0))
+    pool = ModelPool(
+        batch_size=MAX_BATCH,
+        trace_dir=os.environ.get("UNIREP_TRACE_DIR", "/root/outputs/traces"),
+        trace_every=trace_every,
+        max_models=int(os.environ.get("UNIREP_MAX_MODELS", 4)),
+    )
+    threading.Thread(
+        target=batch_loop, args=(pool, requests, MAX_BATCH, MAX_WAIT), daemon=True
+    ).start()
+
+    server = socketserver.ThreadingUnixStreamServer(SOCKET_PATH, make_handler(requests))
+    server.daemon_threads = True
+    print("Serving on {}".format(SOCKET_PATH), flush=True)
+    try:
+        server.serve_forever()
+    finally:
+        os.unlink(SOCKET_PATH)
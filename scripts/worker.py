@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Inference worker for a single workflow task.
+
+Call: conda run --no-capture-output -n unirep scripts/worker.py {output_dir} [batch_size]
+
+Reads framing messages (see unirep_source/serving.py) from stdin and answers each one
+on stdout, in order, until stdin is closed or a request fails. The task streams its
+sequences in as batches and writes the outputs itself from the result arrays, so
+nothing goes through an intermediate csv. On exit the worker's own timings are written to
+{output_dir}/script_metrics.json, and with UNIREP_TRACE_EVERY set the sampled traces go
+to {output_dir}/traces.
+"""
+if __name__ == "__main__":
+    import sys
+    from unirep_source.metrics import StageTimer, SCRIPT_METRICS_FILE
+
+    timer = StageTimer()
+    import os
+
+    # Keep stdout for the protocol only: anything printed (by tensorflow or by us)
+    # goes to stderr instead
+    protocol_out = os.fdopen(os.dup(sys.stdout.fileno()), "wb")
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+    sys.stdout = sys.stderr
+    protocol_in = sys.stdin.buffer
+
+    from unirep_source.framing import read_message, write_message
+    from unirep_source.serving import ModelPool, handle, model_args
+
+    OUTPUT_DIR = sys.argv[1]
+    # Upper bound on the rows of a batch, the token budget decides (see plan_batches)
+    BATCH_SIZE = int(sys.argv[2]) if len(sys.argv) > 2 else 256
+
+    os.chdir("/root")
+    pool = ModelPool(
+        batch_size=BATCH_SIZE,
+        trace_dir=os.path.join(OUTPUT_DIR, "traces"),
+        trace_every=int(os.environ.get("UNIREP_TRACE_EVERY", 0)),
+        timer=timer,
+    )
+    while True:
+        with timer.stage("read_request"):
+            message = read_message(protocol_in)
+        if message is None:
+            break
+        header, arrays = message
+        # Build the model first so the build is not counted as inference, a failure
+        # is reported by handle below
+        try:
+            pool.get(*model_args(header))
+        except Exception:
+            pass
+        with timer.stage("inference", op=header.get("op")) as record:
+            response = handle(pool, header, arrays)
+            record["residues"] = int(response[1]["lengths"].sum()) if response[0]["ok"] else 0
+        with timer.stage("write_response"):
+            write_message(protocol_out, *response)
+        if not response[0]["ok"]:
+            print(response[0]["error"])
+            model_path = header.get("model_path", "None")
+            if model_path != "None" and model_path.split("/")[-1] != "{}_weights".format(header["model_size"]):
+                print(
+                    "Good chance that the model weights you uploaded were for the wrong model size. Please try again."
+                )
+            exit(1)
+
+    timer.write(os.path.join(OUTPUT_DIR, SCRIPT_METRICS_FILE))
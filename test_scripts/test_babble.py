@@ -11,7 +11,7 @@ import shutil
 
 sys.path.append('../wf')
 from wf import babble_task, Application, ModelSize
-from scripts.babble import pkl_to_model
+from unirep_source.weights import pkl_to_model
 
 
 cas9 = "MKRNYILGLDIGITSVGYGIIDYETRDVIDAGVRLFKEANVENNEGRRSKRGARRLKRRRRHRIQRVKKLLFDYNLLTDHSELSGINPYEARVKGLSQKLSEEEFSAALLHLAKRRGVHNVNEVEEDTGNELSTKEQISRNSKALEEKYVAELQLERLKKDGEVRGSINRFKTSDYVKEAKQLLKVQKAYHQLDQSFIDTYIDLLETRRTYYEGPGEGSPFGWKDIKEWYEMLMGHCTYFPEELRSVKYAYNADLYNALNDLNNLVITRDENEKLEYYEKFQIIENVFKQKKKPTLKQIAKEILVNEEDIKGYRVTSTGKPEFTNLKVYHDIKDITARKEIIENAELLDQIAKILTIYQSSEDIQEELTNLNSELTQEEIEQISNLKGYTGTHNLSLKAINLILDELWHTNDNQIAIFNRLKLVPKKVDLSQQKEIPTTLVDDFILSPVVKRSFIQSIKVINAIIKKYGLPNDIIIELAREKNSKDAQKMINEMQKRNRQTNERIEEIIRTTGKENAKYLIEKIKLHDMQEGKCLYSLEAIPLEDLLNNPFNYEVDHIIPRSVSFDNSFNNKVLVKQEENSKKGNRTPFQYLSSSDSKISYETFKKHILNLAKGKGRISKTKKEYLLEERDINRFSVQKDFINRNLVDTRYATRGLMNLLRSYFRVNNLDVKVKSINGGFTSFLRRKWKFKKERNKGYKHHAEDALIIANADFIFKEWKKLDKAKKVMENQMFEEKQAESMPEIETEQEYKEIFITPHQIKHIKDFKDYKYSHRVDKKPNRELINDTLYSTRKDDKGNTLIVNNLNGLYDKDNDKLKKLINKSPEKLLMYHHDPQTYQKLKLIMEQYGDEKNPLYKYYEETGNYLTKYSKKDNGPVIKKIKYYGNKLNAHLDITDDYPNSRNKVVKLSLKPYRFDVYLDNGVYKFVTVKNLDVIKKENYYEVNSKCYEEAKKLKKISNQAEFIASFYNNDLIKINGELYRVIGVNNDLLNRIEVNMIDITYREYLENMNDKRPPRIIKTIASKTQSIKKYSTDILGNLYEVKSKKHPQIIKKG"
@@ -86,6 +86,23 @@ class TestBabble(unittest.TestCase):
         )
         validate_babble(self, length, run_name)
 
+    def test_num_samples(self):
+        run_name = "babble num samples test"
+        length = 12
+        test_babble(
+                seqs_and_names=[['LATCH', 'seqs_protein1'], ['MKV', 'seqs_protein2']],
+                model_size=ModelSize.small,
+                model_params=None,
+                run_name=run_name,
+                length=length,
+                temp=1,
+                num_samples=3,
+        )
+        with open(Path(f"/root/outputs/{run_name}") / 'babble_results.csv', 'r') as f:
+            rows = [line.strip().split(',') for line in f.readlines()[1:]]
+        self.assertEqual([row[0] for row in rows], ['seqs_protein1'] * 3 + ['seqs_protein2'] * 3)
+        self.assertTrue(all(len(row[2]) == length for row in rows))
+
     def test_invalid_amino_acids(self):
         protein = 'LATCHBIO'
         run_name = "invalid amino acids test"
@@ -0,0 +1,155 @@
+# Imports
+from tempfile import TemporaryDirectory
+import sys, os
+import unittest
+import numpy as np
+
+sys.path.append('../')
+from unirep_source.data_utils import (
+    aa_seq_to_int,
+    aas_to_int_seq,
+    adaptive_bucket_bounds,
+    bucket_stats,
+    BucketBatcher,
+    encode_batch,
+    fasta_to_input_format,
+    fasta_to_token_dataset,
+    plan_token_batches,
+    read_seqs_csv,
+    tokenize,
+    token_budget,
+    TokenDataset,
+    write_token_dataset,
+)
+
+fasta = ">protein1\nLAT\nCH\n>protein2\nBIO\n>protein3\nMKV\n"
+
+
+class TestTokenize(unittest.TestCase):
+
+    def test_matches_dict_lookup(self):
+        seq = 'MRHKDESTNQCUGPAVIFYWLOXZBJ'
+        self.assertEqual(tokenize(seq).tolist(), aa_seq_to_int(seq))
+
+    def test_no_start_stop(self):
+        self.assertEqual(tokenize('LATCH', start=False, stop=False).tolist(), aa_seq_to_int('LATCH')[1:-1])
+
+    def test_invalid_is_pad(self):
+        self.assertEqual(tokenize('L1', start=False, stop=False).tolist(), [21, 0])
+
+    def test_int_seq_string(self):
+        self.assertEqual(aas_to_int_seq('MR'), '24,1,2,25')
+
+
+class TestEncodeBatch(unittest.TestCase):
+
+    def test_mask_and_tokens(self):
+        seqs = ['MKV', 'LATCHBIO', 'LATCH', 'MK1']
+        valid, batch, lengths = encode_batch(seqs)
+        self.assertEqual(valid.tolist(), [True, False, True, False])
+        self.assertEqual(lengths.tolist(), [4, 0, 6, 0])
+        self.assertEqual(batch.shape, (4, 6))
+        self.assertEqual(batch[0, :4].tolist(), aa_seq_to_int('MKV')[:-1])
+        self.assertEqual(batch[2].tolist(), aa_seq_to_int('LATCH')[:-1])
+        self.assertFalse(batch[1].any())
+
+    def test_stop_and_max_len(self):
+        valid, batch, lengths = encode_batch(['MK', 'LATCH'], max_len=5, stop=True)
+        self.assertEqual(valid.tolist(), [True, False])
+        self.assertEqual(batch.tolist(), [aa_seq_to_int('MK'), [0, 0, 0, 0]])
+
+    def test_empty(self):
+        valid, batch, lengths = encode_batch([])
+        self.assertEqual(batch.shape, (0, 0))
+
+
+class TestFastaConversion(unittest.TestCase):
+
+    def test_input_format_keeps_last_record(self):
+        with TemporaryDirectory() as d:
+            with open(os.path.join(d, 'seqs.fasta'), 'w') as f:
+                f.write(fasta)
+            fasta_to_input_format(os.path.join(d, 'seqs.fasta'), os.path.join(d, 'seqs.txt'))
+            with open(os.path.join(d, 'seqs.txt')) as f:
+                lines = f.read().splitlines()
+        self.assertEqual(lines, [aas_to_int_seq(s) for s in ['LATCH', 'BIO', 'MKV']])
+
+    def test_token_dataset_roundtrip(self):
+        with TemporaryDirectory() as d:
+            with open(os.path.join(d, 'seqs.fasta'), 'w') as f:
+                f.write(fasta)
+            path = os.path.join(d, 'seqs.tokens')
+            self.assertEqual(fasta_to_token_dataset(os.path.join(d, 'seqs.fasta'), path), 3)
+            ds = TokenDataset(path)
+            self.assertEqual(len(ds), 3)
+            self.assertEqual(ds.lengths.tolist(), [7, 5, 5])
+            self.assertEqual(ds[0].tolist(), aa_seq_to_int('LATCH'))
+            self.assertEqual(ds.seq(2), 'MKV')
+
+    def test_empty_token_dataset(self):
+        with TemporaryDirectory() as d:
+            path = os.path.join(d, 'empty.tokens')
+            write_token_dataset([], path)
+            self.assertEqual(len(TokenDataset(path)), 0)
+
+    def test_seqs_csv_quoted_names(self):
+        with TemporaryDirectory() as d:
+            with open(os.path.join(d, 'seqs.csv'), 'w') as f:
+                f.write('MKV,plain\nLATCH,"a, b"\n\n')
+            seqs = read_seqs_csv(os.path.join(d, 'seqs.csv'))
+        self.assertEqual(seqs, [['MKV', 'plain'], ['LATCH', 'a, b']])
+
+
+class TestAdaptiveBuckets(unittest.TestCase):
+
+    def test_splits_length_clusters(self):
+        lengths = [50] * 5 + [51] * 3 + [400] * 5 + [402] * 3
+        bounds = adaptive_bucket_bounds(lengths, batch_size=8)
+        self.assertEqual(bounds, [52])
+        stats = bucket_stats(lengths, bounds, batch_size=8)
+        self.assertEqual(stats['counts'], [8, 8])
+        self.assertEqual(stats['num_batches'], [1, 1])
+        self.assertLess(stats['padding_ratio'], 0.01)
+
+    def test_single_length(self):
+        self.assertEqual(adaptive_bucket_bounds([10, 10, 10], batch_size=2), [])
+
+    def test_epoch_has_no_duplicates(self):
+        with TemporaryDirectory() as d:
+            path = os.path.join(d, 'seqs.tokens')
+            write_token_dataset(['MK', 'MKV', 'LATCHLATCH', 'A', 'MKVV', 'LATCHLAT'], path)
+            ds = TokenDataset(path)
+            batcher = BucketBatcher(ds, [6], batch_size=2, seed=0)
+            seen = [i for batch in batcher.plan_epoch() for i in batch]
+            self.assertEqual(sorted(seen), list(range(len(ds))))
+            batch = batcher.next_batch()
+            self.assertEqual(batch.dtype, np.int32)
+            self.assertLessEqual(len(batch), 2)
+
+
+
+class TestTokenBatches(unittest.TestCase):
+
+    def test_longest_first_under_budget(self):
+        lengths = np.array([10, 1800, 12, 11, 300, 10, 290])
+        batches = plan_token_batches(lengths, max_tokens=900)
+        # The 1800 residue protein runs alone, first
+        self.assertEqual([b.tolist() for b in batches], [[1], [4, 6, 2], [3, 0, 5]])
+        for b in batches[1:]:
+            self.assertLessEqual(len(b) * lengths[b].max(), 900)
+            self.assertEqual(lengths[b[0]], lengths[b].max())
+
+    def test_max_batch_and_oversized(self):
+        batches = plan_token_batches([5] * 10, max_tokens=1000, max_batch=4)
+        self.assertEqual([len(b) for b in batches], [4, 4, 2])
+        self.assertEqual(plan_token_batches([3000], max_tokens=1000)[0].tolist(), [0])
+        self.assertEqual(plan_token_batches([], max_tokens=1000), [])
+
+    def test_budget(self):
+        gb = 1024 ** 3
+        self.assertGreater(token_budget(64, available=gb), token_budget(1900, available=gb))
+        self.assertEqual(token_budget(1900, available=1), 2000)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,50 @@
+# Imports
+import sys
+import unittest
+import numpy as np
+
+sys.path.append('../wf')
+from wf.dedup import cluster_sequences, cluster_weights, jaccard_threshold, minhash_signatures, representatives
+
+rng = np.random.RandomState(0)
+aas = np.array(list('ACDEFGHIKLMNPQRSTVWY'))
+
+
+def mutate(seq, rate):
+    seq = np.array(list(seq))
+    sites = rng.rand(len(seq)) < rate
+    seq[sites] = rng.choice(aas, sites.sum())
+    return ''.join(seq)
+
+
+class TestDedup(unittest.TestCase):
+
+    def test_signature_similarity(self):
+        a = ''.join(rng.choice(aas, 300))
+        b = ''.join(rng.choice(aas, 300))
+        sigs = minhash_signatures([a, a, mutate(a, 0.02), b], num_hashes=128)
+        self.assertTrue((sigs[0] == sigs[1]).all())
+        self.assertGreater((sigs[0] == sigs[2]).mean(), jaccard_threshold(0.95, 3))
+        self.assertLess((sigs[0] == sigs[3]).mean(), 0.2)
+
+    def test_families(self):
+        families = [''.join(rng.choice(aas, 200)) for _ in range(20)]
+        seqs = [mutate(f, 0.01) for f in families for _ in range(5)] + ['MK', 'MK']
+        assignment = cluster_sequences(seqs, identity=0.9)
+        reps, sizes = representatives(assignment)
+        # Never merged across families, and short sequences still get a cluster
+        for i, rep in enumerate(assignment[:100]):
+            self.assertEqual(rep // 5, i // 5)
+        self.assertEqual(assignment[-1], assignment[-2])
+        self.assertLessEqual(len(reps), 30)
+        np.testing.assert_allclose(cluster_weights(sizes).mean(), 1.0, rtol=1e-6)
+
+    def test_identity_one_keeps_distinct(self):
+        seqs = ['MKVLATCH', 'MKVLATCH', 'MKVLATCHEE', 'LATCH']
+        assignment = cluster_sequences(seqs, identity=1.0)
+        self.assertEqual(len(np.unique(assignment)), 3)
+        self.assertEqual(len(cluster_sequences([], identity=0.9)), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
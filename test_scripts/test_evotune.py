@@ -0,0 +1,141 @@
+# Imports
+from pathlib import Path
+from tempfile import TemporaryDirectory
+import sys
+import unittest
+import numpy as np
+
+sys.path.append('../wf')
+from wf.evotuning import (TokenSequences, compile_cache_dir, enable_compile_cache,
+                          epoch_batches, fixed_batches, latest_checkpoint, load_checkpoint, prefetch,
+                          compiled_call, run_config, save_checkpoint, shard_batch)
+from unirep_source.data_utils import write_token_dataset
+
+seqs = ['LATCH', 'BIO', 'LATCHBIO', 'MKT', 'LATCG', 'MKV', 'MKVLATCH']
+
+
+class TestEpochBatches(unittest.TestCase):
+
+    def test_covers_every_sequence_once(self):
+        batches = epoch_batches(seqs, batch_size=2, seed=42, epoch=0)
+        self.assertEqual(sorted(i for b in batches for i in b), list(range(len(seqs))))
+
+    def test_batches_are_single_length(self):
+        for b in epoch_batches(seqs, batch_size=2, seed=42, epoch=0):
+            self.assertEqual(len(set(len(seqs[i]) for i in b)), 1)
+            self.assertLessEqual(len(b), 2)
+
+    def test_order_is_reproducible(self):
+        self.assertEqual(
+            epoch_batches(seqs, batch_size=2, seed=42, epoch=3),
+            epoch_batches(seqs, batch_size=2, seed=42, epoch=3),
+        )
+
+    def test_token_dataset_gives_same_batches(self):
+        with TemporaryDirectory() as d:
+            path = str(Path(d) / 'seqs.tokens')
+            write_token_dataset(seqs, path)
+            view = TokenSequences(path)
+            self.assertEqual(view[0], 'LATCH')
+            np.testing.assert_array_equal(view.lengths, [len(s) for s in seqs])
+            self.assertEqual(
+                epoch_batches(view, batch_size=2, seed=42, epoch=1),
+                epoch_batches(seqs, batch_size=2, seed=42, epoch=1),
+            )
+            subset = TokenSequences(path, [2, 6])
+            self.assertEqual(subset[0:2], ['LATCHJIO', 'MKVLATCH'])
+
+    def test_fixed_batches(self):
+        lengths = [len(s) for s in seqs]
+        batches = fixed_batches(lengths, batch_size=2)
+        self.assertEqual(batches, fixed_batches(lengths, batch_size=2))
+        self.assertEqual(sorted(i for b in batches for i in b), list(range(len(seqs))))
+        for b in batches:
+            self.assertEqual(len(set(lengths[i] for i in b)), 1)
+            self.assertLessEqual(len(b), 2)
+
+
+class TestPrefetch(unittest.TestCase):
+
+    def test_keeps_order(self):
+        self.assertEqual(list(prefetch(iter(range(10)), size=2)), list(range(10)))
+
+    def test_raises_producer_errors(self):
+        def items():
+            yield 1
+            raise KeyError('bad batch')
+        with self.assertRaises(KeyError):
+            list(prefetch(items()))
+
+
+class TestShardBatch(unittest.TestCase):
+
+    def test_pads_with_zero_weights(self):
+        xs, ys = np.arange(5 * 3).reshape(5, 3), np.arange(5 * 2).reshape(5, 2)
+        sx, sy, w = shard_batch(xs, ys, n_devices=4)
+        self.assertEqual(sx.shape, (4, 2, 3))
+        self.assertEqual(sy.shape, (4, 2, 2))
+        self.assertEqual(w.sum(), 5)
+        np.testing.assert_array_equal(sx.reshape(-1, 3)[:5], xs)
+
+
+class TestCheckpoints(unittest.TestCase):
+
+    def test_no_checkpoint(self):
+        with TemporaryDirectory() as d:
+            self.assertIsNone(latest_checkpoint(Path(d) / 'checkpoints'))
+
+    def test_latest_and_pruning(self):
+        with TemporaryDirectory() as d:
+            for step in [100, 200, 300]:
+                save_checkpoint(d, {'step': step, 'epoch': 0, 'batch': step}, keep=2)
+            self.assertEqual(len(list(Path(d).glob('ckpt_*.pkl'))), 2)
+            self.assertEqual(load_checkpoint(latest_checkpoint(d))['step'], 300)
+
+    def test_untagged_checkpoint_is_rejected(self):
+        import pickle
+        with TemporaryDirectory() as d:
+            path = Path(d) / 'ckpt_00000001.pkl'
+            with open(path, 'wb') as f:
+                pickle.dump({'step': 1}, f)
+            with self.assertRaises(ValueError):
+                load_checkpoint(path)
+
+    def test_run_config_tells_runs_apart(self):
+        params = [np.zeros((26, 10)), {'wx': np.zeros((10, 256))}]
+        config = run_config(seqs, params, seed=42, batch_size=25, step_size=1e-4)
+        self.assertEqual(config, run_config(list(seqs), params, 42, 25, 1e-4))
+        bigger = [np.zeros((26, 10)), {'wx': np.zeros((10, 1900))}]
+        self.assertNotEqual(config['param_shapes'], run_config(seqs, bigger, 42, 25, 1e-4)['param_shapes'])
+        self.assertNotEqual(config['batch_size'], run_config(seqs, params, 42, 50, 1e-4)['batch_size'])
+        self.assertNotEqual(config['lengths'], run_config(seqs[::-1], params, 42, 25, 1e-4)['lengths'])
+
+
+class TestCompileCache(unittest.TestCase):
+
+    def test_one_directory_per_model_size(self):
+        self.assertNotEqual(compile_cache_dir(64), compile_cache_dir(1900))
+        self.assertEqual(compile_cache_dir(256).name, 'mlstm256')
+
+    def test_compile_time_recorded_once_per_key(self):
+        from jax import jit, numpy as jnp
+        from unirep_source.metrics import StageTimer
+        timer, compiled = StageTimer(), {}
+        double = jit(lambda a: a * 2)
+        for _ in range(3):
+            out = compiled_call(timer, compiled, (3,), double, jnp.ones(3), shape=[3])
+        np.testing.assert_array_equal(out, 2 * np.ones(3))
+        stages = [r for r in timer.stages if r['name'] == 'compile']
+        # Only jax versions with ahead-of-time lowering time the compilation
+        self.assertEqual(len(stages), 1 if hasattr(double, 'lower') else 0)
+        self.assertGreaterEqual(stages[0]['wall_s'], 0)
+
+    def test_enable_creates_directory(self):
+        with TemporaryDirectory() as d:
+            cache_dir = Path(d) / 'mlstm64'
+            self.assertIsInstance(enable_compile_cache(cache_dir), bool)
+            self.assertTrue(cache_dir.is_dir())
+
+
+if __name__ == "__main__":
+    unittest.main()
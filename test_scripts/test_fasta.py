@@ -0,0 +1,81 @@
+# Imports
+from pathlib import Path
+from tempfile import TemporaryDirectory
+import gzip
+import sys
+import unittest
+import numpy as np
+
+sys.path.append('../wf')
+from wf.fasta import file_stem, format_suffix, is_fasta, read_fasta, record_ranges
+
+rng = np.random.RandomState(0)
+aas = np.array(list('ACDEFGHIKLMNPQRSTVWY'))
+records = [(f'protein{i}', ''.join(rng.choice(aas, rng.randint(1, 200)))) for i in range(500)]
+
+
+def write_fasta(path):
+    with open(path, 'w') as f:
+        for name, seq in records:
+            f.write(f'>{name} some description\n')
+            for start in range(0, len(seq), 60):
+                f.write(seq[start:start + 60] + '\n')
+
+
+class TestFasta(unittest.TestCase):
+
+    def test_suffixes(self):
+        self.assertTrue(is_fasta(Path('seqs.faa')))
+        self.assertTrue(is_fasta(Path('seqs.fa.gz')))
+        self.assertFalse(is_fasta(Path('seqs.txt.gz')))
+        self.assertEqual(format_suffix(Path('seqs.txt.gz')), '.txt')
+        self.assertEqual(file_stem(Path('seqs.fasta.gz')), 'seqs')
+
+    def test_sequential(self):
+        with TemporaryDirectory() as d:
+            path = Path(d) / 'seqs.fa'
+            write_fasta(path)
+            self.assertEqual(list(read_fasta(path, processes=1)), records)
+
+    def test_gzip(self):
+        with TemporaryDirectory() as d:
+            path = Path(d) / 'seqs.fa'
+            write_fasta(path)
+            with open(path, 'rb') as f, gzip.open(str(path) + '.gz', 'wb') as g:
+                g.write(f.read())
+            self.assertEqual(list(read_fasta(Path(str(path) + '.gz'))), records)
+
+    def test_ranges_start_at_records(self):
+        with TemporaryDirectory() as d:
+            path = Path(d) / 'seqs.fa'
+            write_fasta(path)
+            ranges = record_ranges(path, chunk_bytes=1000)
+            self.assertGreater(len(ranges), 10)
+            data = path.read_bytes()
+            self.assertEqual(ranges[-1][1], len(data))
+            for (start, end), (next_start, _) in zip(ranges, ranges[1:]):
+                self.assertEqual(end, next_start)
+                self.assertEqual(data[next_start:next_start + 1], b'>')
+
+    def test_parallel_matches_sequential(self):
+        with TemporaryDirectory() as d:
+            path = Path(d) / 'seqs.fa'
+            write_fasta(path)
+            parsed = read_fasta(path, processes=3, chunk_bytes=1000, min_parallel_bytes=0)
+            self.assertEqual(list(parsed), records)
+
+    def test_same_names_on_both_paths(self):
+        with TemporaryDirectory() as d:
+            path = Path(d) / 'seqs.fa'
+            with open(path, 'wb') as f:
+                for i in range(50):
+                    f.write('>prot\u00e9ine{}\xff desc\r\nMKV\r\nLAT\r\n'.format(i).encode('utf-8'))
+                    f.write(b'>bad\xff\n' + b'MKV\n')
+            sequential = list(read_fasta(path, processes=1))
+            parallel = list(read_fasta(path, processes=2, chunk_bytes=100, min_parallel_bytes=0))
+            self.assertEqual(parallel, sequential)
+            self.assertEqual(sequential[0], ('prot\u00e9ine0\xff', 'MKVLAT'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,94 @@
+# Imports
+from io import BytesIO
+import sys
+import unittest
+import numpy as np
+
+sys.path.append('../')
+from unirep_source.framing import pack_strings, read_message, unpack_strings, write_message
+from unirep_source.serving import ModelPool, model_args, split_response
+
+
+class TestFraming(unittest.TestCase):
+
+    def test_roundtrip(self):
+        stream = BytesIO()
+        arrays = {'reps': np.arange(12, dtype=np.float32).reshape(2, 3, 2),
+                  'babbles': np.array([[b'MKV', b'MKL']]),
+                  'empty': np.zeros((0, 20), dtype=np.float32)}
+        write_message(stream, {'op': 'rep'}, arrays)
+        write_message(stream, {'op': 'score'})
+        stream.seek(0)
+        header, got = read_message(stream)
+        self.assertEqual(header, {'op': 'rep'})
+        for name, a in arrays.items():
+            np.testing.assert_array_equal(got[name], a)
+            self.assertEqual(got[name].dtype, a.dtype)
+        self.assertEqual(read_message(stream), ({'op': 'score'}, {}))
+        self.assertIsNone(read_message(stream))
+
+    def test_truncated(self):
+        stream = BytesIO()
+        write_message(stream, {'op': 'rep'}, {'a': np.ones(4)})
+        with self.assertRaises(EOFError):
+            read_message(BytesIO(stream.getvalue()[:-1]))
+
+    def test_strings(self):
+        strings = ['MKV', '', 'name,with,commas\nand newline']
+        self.assertEqual(unpack_strings(*pack_strings(strings)), strings)
+
+    def test_split_response(self):
+        # Three requests of 2, 1 and 2 sequences, the fourth sequence invalid
+        lengths = np.array([3, 2, 4, 0, 1])
+        arrays = {'valid': lengths > 0, 'lengths': lengths,
+                  'log_likelihood': np.arange(5.0),
+                  'position_log_likelihood': np.arange(10.0)}
+        header = {'ok': True, 'residue_arrays': ['position_log_likelihood']}
+        responses = split_response(header, arrays, [2, 1, 2])
+        self.assertEqual([r[1]['log_likelihood'].tolist() for r in responses],
+                         [[0, 1], [2], [3, 4]])
+        self.assertEqual([r[1]['position_log_likelihood'].tolist() for r in responses],
+                         [[0, 1, 2, 3, 4], [5, 6, 7, 8], [9]])
+        self.assertEqual(responses[2][1]['valid'].tolist(), [False, True])
+
+
+class FakeModel():
+
+    def __init__(self, key):
+        self.key = key
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class FakePool(ModelPool):
+
+    def _load(self, *key):
+        return FakeModel(key)
+
+
+class TestModelPool(unittest.TestCase):
+
+    def test_least_recently_used_is_closed(self):
+        pool = FakePool(max_models=2)
+        a = pool.get(64, '/tmp/a')
+        b = pool.get(64, '/tmp/b')
+        self.assertIs(pool.get(64, '/tmp/a'), a)
+        c = pool.get(64, '/tmp/c')
+        self.assertEqual(len(pool), 2)
+        self.assertTrue(b.closed)
+        self.assertFalse(a.closed or c.closed)
+        self.assertIsNot(pool.get(64, '/tmp/b'), b)
+
+    def test_cell_states_only_for_hidden_and_cell_reps(self):
+        header = {'op': 'rep', 'model_size': 64, 'params': {'residue_states': 'hidden'}}
+        self.assertEqual(model_args(header), (64, 'None', 'float32', False))
+        header['params']['residue_states'] = 'hidden_and_cell'
+        self.assertEqual(model_args(header), (64, 'None', 'float32', True))
+        header['op'] = 'score'
+        self.assertFalse(model_args(header)[3])
+
+
+if __name__ == '__main__':
+    unittest.main()
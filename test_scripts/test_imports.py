@@ -0,0 +1,51 @@
+# Imports
+from pathlib import Path
+import subprocess
+import sys
+import time
+import unittest
+
+root = str(Path(__file__).resolve().parents[1])
+
+# Modules that are imported for input checks, tokenization and by the workflow, and so
+# must not pull in tensorflow
+LIGHT_MODULES = [
+    'unirep_source.data_utils',
+    'unirep_source.sampling',
+    'unirep_source.rep_store',
+    'unirep_source.metrics',
+    'unirep_source.framing',
+    'unirep_source.serving',
+    'unirep_source.outputs',
+    'unirep_source.weights',
+]
+# Generous bound on the import time of all of them, in seconds
+MAX_IMPORT_SECONDS = 2.0
+
+
+def import_in_subprocess(modules):
+    code = (
+        'import sys, time; start = time.time()\n'
+        + ''.join(f'import {m}\n' for m in modules)
+        + 'print(time.time() - start, "tensorflow" in sys.modules)'
+    )
+    out = subprocess.run([sys.executable, '-c', code], cwd=root, check=True, stdout=subprocess.PIPE)
+    seconds, tf_loaded = out.stdout.decode().split()
+    return float(seconds), tf_loaded == 'True'
+
+
+class TestImports(unittest.TestCase):
+
+    def test_no_tensorflow(self):
+        for module in LIGHT_MODULES:
+            _, tf_loaded = import_in_subprocess([module])
+            self.assertFalse(tf_loaded, f'{module} imports tensorflow')
+
+    def test_import_time(self):
+        seconds, _ = import_in_subprocess(LIGHT_MODULES)
+        print(f'Imported {len(LIGHT_MODULES)} modules in {seconds:.3f}s')
+        self.assertLess(seconds, MAX_IMPORT_SECONDS)
+
+
+if __name__ == "__main__":
+    unittest.main()
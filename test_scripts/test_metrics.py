@@ -0,0 +1,41 @@
+# Imports
+from tempfile import TemporaryDirectory
+import sys, os
+import time
+import unittest
+
+sys.path.append('../')
+from unirep_source.metrics import StageTimer, format_summary, load_metrics
+
+
+class TestStageTimer(unittest.TestCase):
+
+    def test_stages_and_totals(self):
+        timer = StageTimer()
+        for n in [10, 30]:
+            with timer.stage("inference", residues=n):
+                time.sleep(0.01)
+        with timer.stage("write_outputs") as record:
+            record["files"] = 2
+        totals = timer.totals()
+        self.assertEqual(totals["inference"]["count"], 2)
+        self.assertEqual(totals["inference"]["residues"], 40)
+        self.assertGreater(totals["inference"]["residues_per_s"], 0)
+        self.assertNotIn("residues_per_s", totals["write_outputs"])
+        self.assertEqual(timer.stages[-1]["files"], 2)
+        self.assertGreater(timer.stages[0]["peak_rss_mb"], 0)
+
+    def test_write_and_load(self):
+        timer = StageTimer()
+        timer.add("conda_run_startup", 1.5)
+        with TemporaryDirectory() as d:
+            path = os.path.join(d, "metrics.json")
+            self.assertIsNone(load_metrics(path))
+            timer.write(path)
+            summary = load_metrics(path)
+        self.assertEqual(summary["totals"]["conda_run_startup"]["wall_s"], 1.5)
+        self.assertIn("conda_run_startup: 1.50s wall", format_summary(summary))
+
+
+if __name__ == "__main__":
+    unittest.main()
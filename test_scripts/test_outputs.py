@@ -0,0 +1,42 @@
+# Imports
+from pathlib import Path
+from tempfile import TemporaryDirectory
+import csv
+import sys
+import unittest
+
+import numpy as np
+
+sys.path.append('../')
+from unirep_source.outputs import score_row, write_babbles
+
+
+class TestWriteBabbles(unittest.TestCase):
+
+    def test_appended_batches_stay_on_their_own_lines(self):
+        with TemporaryDirectory() as d:
+            write_babbles(d, 5, [['MKV', 'seq1', ['MKVLA', 'MKVLL']]])
+            write_babbles(d, 5, [['MKV', 'seq1', ['MKVAA']]])
+            lines = (Path(d) / 'seq1' / 'babble5.txt').read_text().splitlines()
+            self.assertEqual(lines, ['MKVLA', 'MKVLL', 'MKVAA'])
+            rows = (Path(d) / 'babble_results.csv').read_text().splitlines()
+            self.assertEqual(rows[1:], ['seq1,MKV,MKVLA', 'seq1,MKV,MKVLL', 'seq1,MKV,MKVAA'])
+
+    def test_comma_in_name_is_quoted(self):
+        with TemporaryDirectory() as d:
+            write_babbles(d, 3, [['MKV', 'sp|P1|a, b', ['MKV']]])
+            with open(Path(d) / 'babble_results.csv', newline='') as f:
+                rows = list(csv.reader(f))
+        self.assertEqual(rows, [['name', 'seq', 'babble'], ['sp|P1|a, b', 'MKV', 'MKV']])
+
+
+class TestScoreRow(unittest.TestCase):
+
+    def test_comma_in_name_is_quoted(self):
+        row = score_row('a, "b"', 'MK', np.array([-1.0, -2.0]))
+        self.assertEqual(next(csv.reader([row])), ['a, "b"', 'MK', '2', '-3.000000', '-1.500000'])
+        self.assertEqual(next(csv.reader([score_row('a,b', 'MK', None)]))[0], 'a,b')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,46 @@
+# Imports
+from tempfile import TemporaryDirectory
+import sys, os
+import unittest
+import numpy as np
+
+sys.path.append('../')
+from unirep_source.rep_store import RaggedStore, RaggedStoreWriter
+
+
+class TestRaggedStore(unittest.TestCase):
+
+    def test_roundtrip(self):
+        rng = np.random.RandomState(0)
+        arrays = [(name, rng.rand(n, 4), rng.rand(n, 4)) for name, n in [('a', 3), ('b', 1), ('c', 5)]]
+        with TemporaryDirectory() as d:
+            path = os.path.join(d, 'residue_states')
+            with RaggedStoreWriter(path, {'hidden': 4, 'cell': 4}) as store:
+                for name, hs, cs in arrays:
+                    store.append(name, hidden=hs, cell=cs)
+            store = RaggedStore(path)
+            self.assertEqual(len(store), 3)
+            self.assertEqual(store.lengths.tolist(), [3, 1, 5])
+            self.assertEqual(sorted(store.kinds), ['cell', 'hidden'])
+            for i, (name, hs, cs) in enumerate(arrays):
+                np.testing.assert_allclose(store.get(i), hs.astype(np.float32))
+                np.testing.assert_allclose(store[name]['cell'], cs.astype(np.float32))
+            np.testing.assert_allclose(store.get(-1), arrays[-1][1].astype(np.float32))
+            del store
+
+    def test_shape_checks(self):
+        with TemporaryDirectory() as d:
+            with RaggedStoreWriter(d, {'hidden': 4}) as store:
+                with self.assertRaises(ValueError):
+                    store.append('a', hidden=np.zeros((3, 5)))
+                with self.assertRaises(ValueError):
+                    store.append('a', cell=np.zeros((3, 4)))
+
+    def test_empty(self):
+        with TemporaryDirectory() as d:
+            RaggedStoreWriter(d, {'hidden': 4}).close()
+            self.assertEqual(len(RaggedStore(d)), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,57 @@
+# Imports
+import sys
+import unittest
+import numpy as np
+
+sys.path.append('../')
+from unirep_source.sampling import filter_logits, sample_next, sample_rng
+
+logits = np.log(np.array([[0.5, 0.3, 0.15, 0.05], [0.05, 0.15, 0.3, 0.5]]))
+
+
+class TestFilterLogits(unittest.TestCase):
+
+    def test_top_k(self):
+        kept = np.isfinite(filter_logits(logits, top_k=2))
+        self.assertEqual(kept.tolist(), [[True, True, False, False], [False, False, True, True]])
+
+    def test_top_p(self):
+        kept = np.isfinite(filter_logits(logits, top_p=0.7))
+        self.assertEqual(kept.tolist(), [[True, True, False, False], [False, False, True, True]])
+        # The most likely token survives any top_p
+        self.assertEqual(np.isfinite(filter_logits(logits, top_p=0.01)).sum(axis=1).tolist(), [1, 1])
+
+    def test_temperature(self):
+        np.testing.assert_allclose(filter_logits(logits, temp=0.5), logits * 2)
+
+
+class TestSampleNext(unittest.TestCase):
+
+    def test_only_samples_kept_tokens(self):
+        rngs = [np.random.RandomState(i) for i in range(2)]
+        for _ in range(50):
+            self.assertEqual(sample_next(logits, rngs, top_k=1).tolist(), [0, 3])
+
+    def test_independent_of_batch(self):
+        alone = sample_next(logits[1:], [np.random.RandomState(7)])
+        batched = sample_next(logits, [np.random.RandomState(0), np.random.RandomState(7)])
+        self.assertEqual(alone[0], batched[1])
+
+    def test_frequencies(self):
+        rngs = [np.random.RandomState(i) for i in range(4000)]
+        samples = sample_next(np.repeat(logits[:1], 4000, axis=0), rngs)
+        np.testing.assert_allclose(np.bincount(samples, minlength=4) / 4000, [0.5, 0.3, 0.15, 0.05], atol=0.03)
+
+
+class TestSampleRng(unittest.TestCase):
+
+    def test_streams(self):
+        draw = lambda seq, i, seed=42: sample_rng(seq, i, seed).random_sample()
+        self.assertEqual(draw('LATCH', 3), draw('LATCH', 3))
+        self.assertNotEqual(draw('LATCH', 3), draw('LATCH', 4))
+        self.assertNotEqual(draw('LATCH', 3), draw('BIO', 3))
+        self.assertNotEqual(draw('LATCH', 3), draw('LATCH', 3, seed=0))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,83 @@
+# Imports
+from pathlib import Path
+import numpy as np
+import sys, os
+import unittest
+
+sys.path.append('../wf')
+from wf import score_task, ModelSize
+from unirep_source.rep_store import RaggedStore
+
+# Get the underlying functions (forgoes the @task)
+test_score_task = score_task.__wrapped__
+
+
+def read_scores(run_name):
+    with open(f'/root/outputs/{run_name}/scores.csv') as f:
+        return [line.split(',') for line in f.read().splitlines()[1:]]
+
+
+class TestScore(unittest.TestCase):
+
+    def test_scores_and_positions(self):
+        run_name = "small score test"
+        test_score_task(
+            seqs_and_names = [['LATCH', 'protein1'], ['MKV', 'protein2'], ['LATCH', 'protein3']],
+            model_size = ModelSize.small,
+            model_params = None,
+            run_name = run_name,
+        )
+        rows = read_scores(run_name)
+        self.assertEqual([row[0] for row in rows], ['protein1', 'protein2', 'protein3'])
+        # Identical sequences get identical scores, and all log-likelihoods are negative
+        self.assertEqual(rows[0][3], rows[2][3])
+        self.assertTrue(all(float(row[3]) < 0 for row in rows))
+
+        store = RaggedStore(f'/root/outputs/{run_name}/position_log_likelihoods')
+        self.assertEqual(store.lengths.tolist(), [5, 3, 5])
+        np.testing.assert_allclose(store.get('protein2', 'log_likelihood').sum(), float(rows[1][3]), rtol=1e-4)
+
+    def test_invalid_sequence(self):
+        run_name = "invalid score test"
+        test_score_task(
+            seqs_and_names = [['LATCH', 'protein1'], ['BIO', 'protein2']],
+            model_size = ModelSize.small,
+            model_params = None,
+            run_name = run_name,
+        )
+        rows = read_scores(run_name)
+        self.assertEqual(rows[1][3], 'invalid sequence')
+        self.assertEqual(len(RaggedStore(f'/root/outputs/{run_name}/position_log_likelihoods')), 1)
+
+    def test_substitutions(self):
+        run_name = "substitution score test"
+        test_score_task(
+            seqs_and_names = [['MKV', 'protein1']],
+            model_size = ModelSize.small,
+            model_params = None,
+            run_name = run_name,
+            substitutions = True,
+        )
+        with open(f'/root/outputs/{run_name}/protein1/substitutions.csv') as f:
+            rows = [line.split(',') for line in f.read().splitlines()]
+        self.assertEqual(len(rows), 4)
+        self.assertEqual([row[1] for row in rows[1:]], ['M', 'K', 'V'])
+        # The wild type entries add up to the sequence log-likelihood
+        wild_type = sum(float(row[rows[0].index(row[1])]) for row in rows[1:])
+        np.testing.assert_allclose(wild_type, float(read_scores(run_name)[0][3]), rtol=1e-4)
+
+    def test_substitutions_empty_sequence(self):
+        run_name = "empty substitution score test"
+        test_score_task(
+            seqs_and_names = [['', 'protein1'], ['MKV', 'protein2']],
+            model_size = ModelSize.small,
+            model_params = None,
+            run_name = run_name,
+            substitutions = True,
+        )
+        with open(f'/root/outputs/{run_name}/protein2/substitutions.csv') as f:
+            self.assertEqual(len(f.read().splitlines()), 4)
+
+
+if __name__ == "__main__":
+    unittest.main()
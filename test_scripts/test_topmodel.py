@@ -0,0 +1,75 @@
+# Imports
+from pathlib import Path
+from tempfile import TemporaryDirectory
+import sys
+import unittest
+import numpy as np
+
+sys.path.append('../wf')
+from wf.topmodel import (
+    RepCollector, cross_validate, fit_ridge_cv, predict, read_labels, ridge_path)
+
+rng = np.random.RandomState(0)
+X = rng.randn(60, 8)
+w = rng.randn(8)
+y = X @ w + 3 + 0.01 * rng.randn(60)
+
+
+class TestRidge(unittest.TestCase):
+
+    def test_path_matches_normal_equations(self):
+        alphas = np.array([0.1, 10.0])
+        path = ridge_path(X, y, alphas)
+        Xc, yc = X - X.mean(axis=0), y - y.mean()
+        for alpha, coef in zip(alphas, path['coefs']):
+            expected = np.linalg.solve(Xc.T @ Xc + alpha * np.eye(8), Xc.T @ yc)
+            np.testing.assert_allclose(coef, expected, rtol=1e-8)
+
+    def test_cv_prefers_small_alpha_on_clean_data(self):
+        alphas = np.array([1e-3, 1e3])
+        cv_mse = cross_validate(X, y, alphas)
+        self.assertLess(cv_mse[0], cv_mse[1])
+        model = fit_ridge_cv(X, y, alphas)
+        self.assertEqual(model['alpha'], 1e-3)
+        np.testing.assert_allclose(predict(model, X), y, atol=0.1)
+
+
+class TestInputs(unittest.TestCase):
+
+    def test_rep_collector(self):
+        reps = RepCollector(3)
+        for start, valid in [(0, [True, False]), (2, [True])]:
+            batch = np.arange(start, start + len(valid), dtype=np.float32)
+            arrays = {'reps': np.tile(batch[:, None, None], (1, 3, 4)), 'valid': np.array(valid)}
+            reps.write([['MKV', 'x']] * len(valid), {'residue_arrays': []}, arrays)
+        reps.close()
+        self.assertEqual(reps.found.tolist(), [True, False, True])
+        self.assertEqual(reps.reps.shape, (3, 4))
+        self.assertEqual(reps.reps[:, 0].tolist(), [0, 0, 2])
+
+    def test_read_labels(self):
+        with TemporaryDirectory() as d:
+            with open(Path(d) / 'labels.csv', 'w') as f:
+                f.write('sequence,label\nmkv,0.5\nLATCH,-1\n')
+            seqs, labels = read_labels(Path(d) / 'labels.csv')
+        self.assertEqual(seqs, ['MKV', 'LATCH'])
+        self.assertEqual(labels.tolist(), [0.5, -1.0])
+
+    def test_read_labels_quoted_columns(self):
+        with TemporaryDirectory() as d:
+            with open(Path(d) / 'labels.csv', 'w') as f:
+                f.write('label,note,sequence\n0.5,"a, b",MKV\n\n-1,,LATCH\n')
+            seqs, labels = read_labels(Path(d) / 'labels.csv')
+        self.assertEqual(seqs, ['MKV', 'LATCH'])
+        self.assertEqual(labels.tolist(), [0.5, -1.0])
+
+    def test_read_labels_needs_header(self):
+        with TemporaryDirectory() as d:
+            with open(Path(d) / 'labels.csv', 'w') as f:
+                f.write('MKV,1\nLATCH,2\n')
+            with self.assertRaises(ValueError):
+                read_labels(Path(d) / 'labels.csv')
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,33 @@
+# Imports
+from tempfile import TemporaryDirectory
+import pickle
+import sys
+import unittest
+import numpy as np
+
+sys.path.append('../')
+from unirep_source.weights import PARAMS_FILE, save_params, unwrap_params
+
+params = [np.zeros(3), {'wx': np.ones(2)}, (np.ones(2), np.zeros(1))]
+
+
+class TestParamsFile(unittest.TestCase):
+
+    def test_saved_params_are_unwrapped(self):
+        with TemporaryDirectory() as d:
+            path = save_params(d, params, step=7, holdout_loss=0.5)
+            self.assertEqual(path.name, PARAMS_FILE)
+            with open(path, 'rb') as f:
+                loaded = pickle.load(f)
+        self.assertEqual((loaded['step'], loaded['holdout_loss']), (7, 0.5))
+        self.assertIs(unwrap_params(loaded), loaded['params'])
+        np.testing.assert_array_equal(unwrap_params(loaded)[1]['wx'], np.ones(2))
+
+    def test_untagged_files_are_used_as_they_are(self):
+        self.assertIs(unwrap_params(params), params)
+        pair = (0, params)
+        self.assertIs(unwrap_params(pair), pair)
+
+
+if __name__ == '__main__':
+    unittest.main()
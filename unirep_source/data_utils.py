@@ -1,8 +1,12 @@
 """
 Utilities for data processing.
+
+Only the numpy helpers are needed to validate and tokenize sequences, so tensorflow
+is imported inside the functions that build tf.data pipelines. Checking inputs does
+not pay for loading tensorflow.
 """
 
-import tensorflow as tf
+import csv
 import numpy as np
 import os
 
@@ -46,6 +50,9 @@ aa_to_int = {
 
 int_to_aa = {value:key for key, value in aa_to_int.items()}
 
+# The 20 standard amino acids, columns of babbler.get_substitution_matrix
+SUBSTITUTION_AAS = "ACDEFGHIKLMNPQRSTVWY"
+
 def get_aa_to_int():
     """
     Get the lookup table (for easy import)
@@ -76,12 +83,14 @@ def tf_str_len(s):
     """
     Returns length of tf.string s
     """
+    import tensorflow as tf
     return tf.size(tf.string_split([s],""))
 
 def tf_rank1_tensor_len(t):
     """
     Returns the length of a rank 1 tensor t as rank 0 int32
     """
+    import tensorflow as tf
     l = tf.reduce_sum(tf.sign(tf.abs(t)), 0)
     return tf.cast(l, tf.int32)
 
@@ -91,14 +100,18 @@ def tf_seq_to_tensor(s):
     Input a tf.string of comma seperated integers.
     Returns Rank 1 tensor the length of the input sequence of type int32
     """
+    import tensorflow as tf
     return tf.string_to_number(
         tf.sparse_tensor_to_dense(tf.string_split([s],","), default_value='0'), out_type=tf.int32
     )[0]
 
-def smart_length(length, bucket_bounds=tf.constant([128, 256])):
+def smart_length(length, bucket_bounds=None):
     """
-    Hash the given length into the windows given by bucket bounds. 
+    Hash the given length into the windows given by bucket bounds (default [128, 256]).
     """
+    import tensorflow as tf
+    if bucket_bounds is None:
+        bucket_bounds = tf.constant([128, 256])
     # num_buckets = tf_len(bucket_bounds) + tf.constant(1)
     # Subtract length so that smaller bins are negative, then take sign
     # Eg: len is 129, sign = [-1,1]    
@@ -123,33 +136,178 @@ def pad_batch(ds, batch_size, padding=None, padded_shapes=([None])):
                           )
 
 def aas_to_int_seq(aa_seq):
-    int_seq = ""
-    for aa in aa_seq:
-        int_seq += str(aa_to_int[aa]) + ","
-    return str(aa_to_int['start']) + "," + int_seq + str(aa_to_int['stop'])
+    """
+    Return the comma seperated int string (with start and stop) for a string of amino acids.
+    """
+    return ",".join(str(i) for i in tokenize(aa_seq))
+
+def read_fasta_seqs(source):
+    """
+    Yield the sequences in a fasta file one at a time, so the file is never fully loaded.
+    """
+    lines = []
+    with open(source, 'r') as f:
+        for line in f:
+            if line[0] == '>':
+                if lines:
+                    yield "".join(lines)
+                lines = []
+            else:
+                lines.append(line.strip())
+    if lines:
+        yield "".join(lines)
+
+def read_seqs_csv(source):
+    """
+    Read a seqs csv of sequence,name rows into a list of [seq, name] pairs. The csv
+    module handles quoting, so names may hold commas. Blank lines are skipped.
+    """
+    with open(source, 'r', newline='') as f:
+        return [row for row in csv.reader(f) if row]
 
 # Preprocessing in python
 def fasta_to_input_format(source, destination):
-    # I don't know exactly how to do this in tf, so resorting to python.
-    # Should go line by line so everything is not loaded into memory
-    
-    sourcefile = os.path.join(source)
-    destination = os.path.join(destiation)
-    with open(sourcefile, 'r') as f:
-        with open(destination, 'w') as dest:
-            seq = ""
-            for line in f:
-                if line[0] == '>' and not seq == "":
-                    dest.write(aas_to_int_seq(seq) + '\n')
-                    seq = ""
-                elif not line[0] == '>':
-                    seq += line.replace("\n","")
+    """
+    Write the sequences in the fasta file source to destination in the
+    comma seperated int format (see note at the top).
+    """
+    with open(destination, 'w') as dest:
+        for seq in read_fasta_seqs(source):
+            dest.write(aas_to_int_seq(seq) + '\n')
+
+# Binary token datasets
+"""
+A token dataset is a flat uint8 buffer with every sequence tokenized (start and
+stop included) back to back, plus an int64 offsets index with one more entry than
+there are sequences, so sequence i is tokens[offsets[i]:offsets[i + 1]].
+Both are memory-mappable, so nothing has to be parsed or loaded up front.
+"""
+TOKENS_SUFFIX = ".tokens"
+OFFSETS_SUFFIX = ".offsets.npy"
+
+# 256-entry byte -> token lookup table. Anything that is not an amino acid maps to 0 (pad).
+aa_to_int_table = np.zeros(256, dtype=np.uint8)
+for aa, i in aa_to_int.items():
+    if len(aa) == 1:
+        aa_to_int_table[ord(aa)] = i
+
+# Inverse of aa_to_int_table, for decoding whole token arrays at once. The ambiguous
+# residues all share token 23 and decode as int_to_aa does, tokens without a residue
+# decode as '?'.
+int_to_aa_table = np.full(256, ord('?'), dtype=np.uint8)
+for i, aa in int_to_aa.items():
+    if len(aa) == 1:
+        int_to_aa_table[i] = ord(aa)
+
+def tokenize(seq, start=True, stop=True):
+    """
+    Return the uint8 tokens for a string of amino acids, translated with one
+    numpy lookup rather than per residue in python.
+    """
+    tokens = aa_to_int_table[np.frombuffer(seq.encode('ascii', 'replace'), dtype=np.uint8)]
+    head = [aa_to_int['start']] if start else []
+    tail = [aa_to_int['stop']] if stop else []
+    return np.concatenate([np.array(head, np.uint8), tokens, np.array(tail, np.uint8)])
+
+# Residues the babblers accept, see babbler1900.is_valid_seq
+valid_aas = "MRHKDESTNQCUGPAVIFYWLO"
+valid_aa_table = np.zeros(256, dtype=bool)
+valid_aa_table[np.frombuffer(valid_aas.encode('ascii'), dtype=np.uint8)] = True
+
+def encode_batch(seqs, max_len=2000, start=True, stop=False, valid_table=valid_aa_table):
+    """
+    Validate and tokenize a whole list of sequences at once. The sequences are joined
+    into one byte buffer and validated and translated with numpy lookups, so there is
+    no per-residue python work.
+    A sequence is valid if it is shorter than max_len and all of its residues are
+    allowed by valid_table (256 entry bool lookup).
+    Returns the validity mask, an int32 [len(seqs), longest valid + start + stop] array
+    with the tokens of the valid sequences (rows of invalid ones are all zero pad) and
+    the token count of each row.
+    """
+    lengths = np.array([len(seq) for seq in seqs], dtype=np.int64)
+    offsets = np.concatenate([[0], np.cumsum(lengths)])
+    codes = np.frombuffer("".join(seqs).encode('ascii', 'replace'), dtype=np.uint8)
+
+    # Count invalid residues per sequence with a cumulative sum over the buffer
+    invalid_cumsum = np.concatenate([[0], np.cumsum(~valid_table[codes])])
+    valid = (invalid_cumsum[offsets[1:]] == invalid_cumsum[offsets[:-1]]) & (lengths < max_len)
+
+    extra = int(start) + int(stop)
+    token_lengths = np.where(valid, lengths + extra, 0)
+    batch = np.zeros((len(seqs), token_lengths.max() if len(seqs) else 0), dtype=np.int32)
+    if not valid.any():
+        return valid, batch, token_lengths
+    # Scatter every residue of a valid sequence to its (row, column)
+    rows = np.repeat(np.arange(len(seqs)), lengths)
+    keep = valid[rows]
+    cols = np.arange(len(codes)) - np.repeat(offsets[:-1], lengths) + int(start)
+    batch[rows[keep], cols[keep]] = aa_to_int_table[codes[keep]]
+    if start:
+        batch[valid, 0] = aa_to_int['start']
+    if stop:
+        batch[np.where(valid)[0], token_lengths[valid] - 1] = aa_to_int['stop']
+    return valid, batch, token_lengths
+
+def write_token_dataset(seqs, path):
+    """
+    Tokenize the iterable of amino acid strings seqs into the token dataset at path
+    (which should end in .tokens). Sequences are streamed to disk, only the offsets are
+    kept in memory. Returns the number of sequences written.
+    """
+    offsets = [0]
+    with open(path, 'wb') as f:
+        for seq in seqs:
+            tokens = tokenize(seq)
+            f.write(tokens.tobytes())
+            offsets.append(offsets[-1] + len(tokens))
+    np.save(path + OFFSETS_SUFFIX, np.array(offsets, dtype=np.int64))
+    return len(offsets) - 1
+
+def fasta_to_token_dataset(source, destination):
+    """
+    Binary counterpart of fasta_to_input_format.
+    """
+    return write_token_dataset(read_fasta_seqs(source), destination)
+
+class TokenDataset():
+    """
+    Read only, memory mapped view of a token dataset written by write_token_dataset.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.offsets = np.load(path + OFFSETS_SUFFIX, mmap_mode='r')
+        if self.offsets[-1] > 0:
+            self.tokens = np.memmap(path, dtype=np.uint8, mode='r')
+        else:
+            # np.memmap can not map an empty file
+            self.tokens = np.zeros(0, dtype=np.uint8)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        return self.tokens[self.offsets[i]:self.offsets[i + 1]]
+
+    @property
+    def lengths(self):
+        """
+        Token count (start and stop included) of every sequence.
+        """
+        return np.diff(self.offsets)
+
+    def seq(self, i):
+        """
+        The amino acid string of sequence i.
+        """
+        return int_to_aa_table[self[i][1:-1]].tobytes().decode('ascii')
 
 # Real data pipelines
 
 def bucketbatchpad(
         batch_size=256,
-        path_to_data=os.path.join("./data/SwissProt/sprot_ints.fasta"), # Preprocessed- see note
+        path_to_data=os.path.join("./data/SwissProt/sprot_ints.fasta"), # Preprocessed- see note, or a .tokens dataset
         compressed="", # See tf.contrib.data.TextLineDataset init args
         bounds=[128,256], # Default buckets of < 128, 128><256, >256
         # Unclear exactly what this does, should proly equal batchsize
@@ -162,18 +320,20 @@ def bucketbatchpad(
 
 ):
     """
-    Streams data from path_to_data that is correctly preprocessed.
+    Streams data from path_to_data that is correctly preprocessed, either in the text
+    format or as a token dataset (see write_token_dataset).
     Divides into buckets given by bounds and pads to full length.
     Returns a dataset which will return a padded batch of batchsize
     with iteration.
     """
+    import tensorflow as tf
     batch_size=tf.constant(batch_size, tf.int64)
     bounds=tf.constant(bounds)
     window_size=tf.constant(window_size, tf.int64)
     
     path_to_data = os.path.join(path_to_data)
-    # Parse strings to tensors
-    dataset = tf.contrib.data.TextLineDataset(path_to_data).map(tf_seq_to_tensor)
+    # Parse strings (or slice tokens) to tensors
+    dataset = sequence_dataset(path_to_data)
     if filt is not None:
         dataset = dataset.filter(filt)
 
@@ -193,6 +353,245 @@ def bucketbatchpad(
         
     return grouped_dataset
 
+def pad_sequences(seqs, dtype=np.int32):
+    """
+    Stack a list of rank 1 arrays into a [len(seqs), longest] array, right padded with 0.
+    """
+    lengths = [len(seq) for seq in seqs]
+    batch = np.zeros((len(seqs), max(lengths) if lengths else 0), dtype=dtype)
+    for i, seq in enumerate(seqs):
+        batch[i, :lengths[i]] = seq
+    return batch
+
+def token_dataset(path_to_data):
+    """
+    Stream the sequences of a token dataset as rank 1 int32 tensors. The tokens are
+    sliced out of the memory mapped buffer, no string parsing involved.
+    """
+    import tensorflow as tf
+    ds = TokenDataset(path_to_data)
+    starts = np.asarray(ds.offsets[:-1])
+    ends = np.asarray(ds.offsets[1:])
+
+    def load(start, end):
+        return ds.tokens[start:end].astype(np.int32)
+
+    def to_tensor(start, end):
+        seq = tf.py_func(load, [start, end], tf.int32, stateful=False)
+        seq.set_shape([None])
+        return seq
+
+    return tf.contrib.data.Dataset.from_tensor_slices((starts, ends)).map(to_tensor)
+
+def sequence_dataset(path_to_data):
+    """
+    Rank 1 int32 tensor per sequence, from either a token dataset (path ends in .tokens)
+    or a text file in the comma seperated format.
+    """
+    import tensorflow as tf
+    if path_to_data.endswith(TOKENS_SUFFIX):
+        return token_dataset(path_to_data)
+    return tf.contrib.data.TextLineDataset(path_to_data).map(tf_seq_to_tensor)
+
+# Adaptive bucketing
+
+def adaptive_bucket_bounds(lengths, batch_size, max_buckets=32):
+    """
+    Choose bucket bounds from the length distribution that minimize the expected
+    number of wasted tokens for the given batch size.
+    A bucket holding lengths up to L costs the padding of every sequence in it up to L,
+    plus the empty slots of its last, partially filled batch (batch_size - remainder
+    rows of length L). Few wide buckets waste padding, many narrow ones waste partial
+    batches; the optimum over contiguous length ranges (at most max_buckets of them) is
+    found by dynamic programming over the sorted distinct lengths.
+    Returns bounds in the format of bucketbatchpad: a sequence of length l goes to the
+    bucket numbered by how many bounds are <= l.
+    """
+    distinct, counts = np.unique(np.asarray(lengths, dtype=np.int64), return_counts=True)
+    if len(distinct) == 0:
+        return []
+    n_distinct = len(distinct)
+    count_prefix = np.concatenate([[0], np.cumsum(counts)])
+    length_prefix = np.concatenate([[0], np.cumsum(counts * distinct)])
+
+    # cost[j][i]: cost of one bucket holding distinct[i..j]
+    costs = []
+    for j in range(n_distinct):
+        n = count_prefix[j + 1] - count_prefix[:j + 1]
+        padding = n * distinct[j] - (length_prefix[j + 1] - length_prefix[:j + 1])
+        remainder = n % batch_size
+        empty_slots = np.where(remainder > 0, batch_size - remainder, 0)
+        costs.append(padding + empty_slots * distinct[j])
+
+    # best[k][j]: cheapest split of distinct[:j] into k buckets, start[k][j] its last bucket start
+    best = [np.concatenate([[0.], np.full(n_distinct, np.inf)])]
+    start = [None]
+    for k in range(1, min(max_buckets, n_distinct) + 1):
+        best_k = np.full(n_distinct + 1, np.inf)
+        start_k = np.zeros(n_distinct + 1, dtype=np.int64)
+        for j in range(n_distinct):
+            total = best[k - 1][:j + 1] + costs[j]
+            start_k[j + 1] = np.argmin(total)
+            best_k[j + 1] = total[start_k[j + 1]]
+        best.append(best_k)
+        start.append(start_k)
+
+    # Fewest buckets among the cheapest splits, then walk back through the bucket starts
+    k = int(np.argmin([b[n_distinct] for b in best[1:]])) + 1
+    upper_lengths = []
+    j = n_distinct
+    while k > 0:
+        upper_lengths.append(int(distinct[j - 1]))
+        j = start[k][j]
+        k -= 1
+    return sorted(l + 1 for l in upper_lengths)[:-1]
+
+def bucket_ids(lengths, bounds):
+    """
+    Bucket number of each length, consistent with smart_length.
+    """
+    return np.searchsorted(np.asarray(bounds, dtype=np.int64), lengths, side='right')
+
+def bucket_stats(lengths, bounds, batch_size):
+    """
+    Per-bucket sequence counts plus the padding ratio (padding tokens over all tokens
+    fed), assuming every batch of a bucket is padded to the bucket's longest sequence.
+    As batches are padded to their own longest sequence this is an upper bound.
+    """
+    lengths = np.asarray(lengths, dtype=np.int64)
+    ids = bucket_ids(lengths, bounds)
+    counts, max_lengths, num_batches = [], [], []
+    padded = 0
+    for b in range(len(bounds) + 1):
+        in_bucket = lengths[ids == b]
+        counts.append(len(in_bucket))
+        max_lengths.append(int(in_bucket.max()) if len(in_bucket) else 0)
+        num_batches.append(-(-len(in_bucket) // batch_size))
+        padded += len(in_bucket) * max_lengths[-1]
+    return {
+        'bounds': [int(b) for b in bounds],
+        'counts': counts,
+        'max_lengths': max_lengths,
+        'num_batches': num_batches,
+        'padding_ratio': float(1 - lengths.sum() / padded) if padded else 0.,
+    }
+
+class BucketBatcher():
+    """
+    Serves padded batches from a TokenDataset where every batch comes from a single
+    bucket. Each epoch visits every sequence exactly once: the last batch of a bucket
+    is simply smaller, rather than filled up with repeated sequences.
+    """
+
+    def __init__(self, dataset, bounds, batch_size, shuffle=True, seed=None):
+        self._dataset = dataset
+        self._bucket_ids = bucket_ids(dataset.lengths, bounds)
+        self._num_buckets = len(bounds) + 1
+        self._batch_size = batch_size
+        self._shuffle = shuffle
+        self._rng = np.random.RandomState(seed)
+        self._queue = []
+
+    def plan_epoch(self):
+        """
+        Lists of dataset indices, one per batch, covering the dataset once.
+        """
+        batches = []
+        for b in range(self._num_buckets):
+            idxs = np.where(self._bucket_ids == b)[0]
+            if self._shuffle:
+                idxs = self._rng.permutation(idxs)
+            batches += [idxs[i:i + self._batch_size] for i in range(0, len(idxs), self._batch_size)]
+        if self._shuffle:
+            batches = [batches[i] for i in self._rng.permutation(len(batches))]
+        return batches
+
+    def next_batch(self):
+        if not self._queue:
+            self._queue = self.plan_epoch()[::-1]
+        return pad_sequences([self._dataset[i] for i in self._queue.pop()])
+
+# Token budget batching for inference
+
+# Rough bytes held per token and hidden unit during a forward pass: the [hidden, cell]
+# outputs, the step activations of the mLSTM gates and their float32 temporaries
+BYTES_PER_TOKEN_UNIT = 64
+
+def available_memory():
+    """
+    Bytes of memory available to new allocations (MemAvailable), or None if unknown.
+    """
+    try:
+        with open("/proc/meminfo", "r") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+def token_budget(rnn_size, memory_fraction=0.25, available=None, min_tokens=2000, max_tokens=1000000):
+    """
+    Largest batch x padded length to run at once so one forward pass of a model with
+    rnn_size units stays within memory_fraction of the available memory. Never below
+    min_tokens, so the longest valid sequence always fits in a batch of its own.
+    """
+    if available is None:
+        available = available_memory() or 4 * 1024 ** 3
+    budget = int(available * memory_fraction / (BYTES_PER_TOKEN_UNIT * rnn_size))
+    return int(min(max(budget, min_tokens), max_tokens))
+
+def plan_token_batches(lengths, max_tokens, max_batch=None):
+    """
+    Split sequences into batches for inference. Sequences are sorted longest first and
+    packed greedily, so every batch is padded to the length of its first (longest)
+    sequence and has at most max_tokens tokens including padding (and at most max_batch
+    rows). Sorting keeps the padding small, and the longest batches run first so a long
+    protein never ends up alone at the tail of a run.
+    Returns a list of index arrays into lengths.
+    """
+    lengths = np.asarray(lengths, dtype=np.int64)
+    order = np.argsort(-lengths, kind='stable')
+    batches = []
+    start = 0
+    while start < len(order):
+        n = max(1, max_tokens // max(int(lengths[order[start]]), 1))
+        if max_batch is not None:
+            n = min(n, max_batch)
+        batches.append(order[start:start + n])
+        start += n
+    return batches
+
+def adaptive_bucketbatchpad(
+        batch_size=256,
+        path_to_data="./data/SwissProt/sprot_ints.tokens", # A token dataset, see write_token_dataset
+        max_buckets=32,
+        shuffle=True,
+        repeat=1,
+        seed=None
+):
+    """
+    Like bucketbatchpad, but the bucket bounds are chosen from the length histogram of the
+    dataset (see adaptive_bucket_bounds) and batches never contain duplicated filler.
+    Returns the dataset and the bucket_stats of the chosen bounds.
+    """
+    import tensorflow as tf
+    if not path_to_data.endswith(TOKENS_SUFFIX):
+        raise ValueError("Adaptive bucketing needs a token dataset, see write_token_dataset")
+    ds = TokenDataset(path_to_data)
+    bounds = adaptive_bucket_bounds(ds.lengths, batch_size, max_buckets=max_buckets)
+    stats = bucket_stats(ds.lengths, bounds, batch_size)
+    batcher = BucketBatcher(ds, bounds, batch_size, shuffle=shuffle, seed=seed)
+
+    def next_batch(_):
+        batch = tf.py_func(batcher.next_batch, [], tf.int32, stateful=True)
+        batch.set_shape([None, None])
+        return batch
+
+    batches_per_epoch = sum(stats['num_batches'])
+    dataset = tf.contrib.data.Dataset.range(batches_per_epoch).repeat(count=repeat).map(next_batch)
+    return dataset, stats
+
 def shufflebatch(
         batch_size=256,
         shuffle_buffer=None,
@@ -205,8 +604,8 @@ def shufflebatch(
     """
     
     path_to_data = os.path.join(path_to_data)
-    # Parse strings to tensors
-    dataset = tf.contrib.data.TextLineDataset(path_to_data).map(tf_seq_to_tensor)
+    # Parse strings (or slice tokens) to tensors
+    dataset = sequence_dataset(path_to_data)
     if shuffle_buffer:
         # Stream elements uniformly randomly from a buffer
         dataset = dataset.shuffle(buffer_size=shuffle_buffer)
@@ -0,0 +1,80 @@
+"""
+Length-prefixed binary messages between the workflow and the model processes.
+
+A message is a little-endian uint32 header length, a JSON header, and the raw bytes of
+its numpy arrays in the order the header lists them (name, dtype and shape of each).
+Sequences travel as one uint8 buffer plus their lengths, so nothing has to be escaped
+and a comma or newline in a name cannot corrupt a record. Works on any binary file
+object: pipes, sockets (via makefile) or files.
+"""
+import json
+import struct
+
+import numpy as np
+
+HEADER_LENGTH = struct.Struct("<I")
+
+
+def write_message(stream, header, arrays=None):
+    arrays = {} if arrays is None else arrays
+    arrays = {name: np.ascontiguousarray(a) for name, a in arrays.items()}
+    header = dict(header)
+    header["arrays"] = [
+        {"name": name, "dtype": a.dtype.str, "shape": list(a.shape)} for name, a in arrays.items()
+    ]
+    body = json.dumps(header).encode("utf-8")
+    stream.write(HEADER_LENGTH.pack(len(body)))
+    stream.write(body)
+    for a in arrays.values():
+        stream.write(a.tobytes())
+    stream.flush()
+
+
+def _read_exact(stream, n):
+    data = stream.read(n)
+    if data is None or len(data) != n:
+        raise EOFError("Stream ended in the middle of a message")
+    return data
+
+
+def read_message(stream):
+    """
+    Returns (header, arrays), or None if the stream ended before a new message.
+    """
+    prefix = stream.read(HEADER_LENGTH.size)
+    if not prefix:
+        return None
+    if len(prefix) != HEADER_LENGTH.size:
+        raise EOFError("Stream ended in the middle of a message")
+    (length,) = HEADER_LENGTH.unpack(prefix)
+    header = json.loads(_read_exact(stream, length).decode("utf-8"))
+    arrays = {}
+    for spec in header.pop("arrays"):
+        dtype = np.dtype(spec["dtype"])
+        count = int(np.prod(spec["shape"], dtype=np.int64))
+        data = _read_exact(stream, count * dtype.itemsize) if count else b""
+        arrays[spec["name"]] = np.frombuffer(data, dtype=dtype).reshape(spec["shape"])
+    return header, arrays
+
+
+def pack_strings(strings):
+    """
+    Pack strings into a uint8 buffer and an int64 array of their byte lengths.
+    """
+    encoded = [s.encode("utf-8") for s in strings]
+    data = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+    return data, np.array([len(e) for e in encoded], dtype=np.int64)
+
+
+def unpack_strings(data, lengths):
+    raw = np.asarray(data, dtype=np.uint8).tobytes()
+    offsets = np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64)
+    return [raw[offsets[i]:offsets[i + 1]].decode("utf-8") for i in range(len(lengths))]
+
+
+def split_ragged(flat, lengths):
+    """
+    Split the rows of flat into consecutive pieces of the given lengths.
+    """
+    offsets = np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64)
+    return [flat[offsets[i]:offsets[i + 1]] for i in range(len(lengths))]
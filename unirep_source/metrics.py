@@ -0,0 +1,122 @@
+"""
+Lightweight per-stage timing for the scripts and workflow tasks.
+
+    timer = StageTimer()
+    with timer.stage("graph_build"):
+        b = babbler(...)
+    with timer.stage("inference", residues=len(seq)):
+        b.get_rep(seq)
+    timer.write(os.path.join(OUTPUT_DIR, "metrics.json"))
+
+Every stage records its wall time, CPU time and the peak RSS of the process so far.
+Stages with the same name (e.g. one per batch) are also summed into totals, with
+residues/sec where residues were given. Only the standard library is used so the
+module imports in both the unirep and the workflow environments.
+"""
+import json
+import os
+import resource
+import sys
+import time
+from contextlib import contextmanager
+
+# Written to the output directory by the scripts, merged into METRICS_FILE by the task
+SCRIPT_METRICS_FILE = "script_metrics.json"
+METRICS_FILE = "metrics.json"
+
+
+def peak_rss_mb(children=False):
+    """
+    Peak resident set size of this process (or of its finished children) in MB.
+    """
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF)
+    # ru_maxrss is in bytes on macOS and in KB everywhere else
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return usage.ru_maxrss / scale
+
+
+class StageTimer():
+
+    def __init__(self):
+        self.start = time.time()
+        self.stages = []
+
+    @contextmanager
+    def stage(self, name, residues=0, **extra):
+        """
+        Time the body of the with block as stage name. The yielded dict is the record,
+        so residues (or anything else) can be filled in once known.
+        """
+        record = {"name": name, "residues": residues}
+        record.update(extra)
+        wall, cpu = time.time(), time.process_time()
+        try:
+            yield record
+        finally:
+            record["wall_s"] = time.time() - wall
+            record["cpu_s"] = time.process_time() - cpu
+            record["peak_rss_mb"] = peak_rss_mb()
+            self.stages.append(record)
+
+    def add(self, name, wall_s, **extra):
+        """
+        Record a stage that was timed elsewhere, e.g. reported by a subprocess.
+        """
+        record = {"name": name, "wall_s": wall_s, "cpu_s": None, "residues": 0}
+        record.update(extra)
+        self.stages.append(record)
+
+    def totals(self):
+        totals = {}
+        for record in self.stages:
+            total = totals.setdefault(
+                record["name"], {"count": 0, "wall_s": 0.0, "cpu_s": 0.0, "residues": 0})
+            total["count"] += 1
+            total["wall_s"] += record["wall_s"]
+            total["cpu_s"] += record["cpu_s"] or 0.0
+            total["residues"] += record["residues"]
+        for total in totals.values():
+            if total["residues"] and total["wall_s"] > 0:
+                total["residues_per_s"] = total["residues"] / total["wall_s"]
+        return totals
+
+    def summary(self):
+        return {
+            "wall_s": time.time() - self.start,
+            "peak_rss_mb": peak_rss_mb(),
+            "peak_rss_children_mb": peak_rss_mb(children=True),
+            "totals": self.totals(),
+            "stages": self.stages,
+        }
+
+    def write(self, path):
+        summary = self.summary()
+        with open(path, "w") as f:
+            json.dump(summary, f, indent=2)
+        return summary
+
+
+def load_metrics(path):
+    """
+    Metrics written by StageTimer.write, or None if there are none.
+    """
+    if not os.path.exists(path):
+        return None
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def format_summary(summary, limit=8):
+    """
+    One line per stage total, slowest first, for a log or message body.
+    """
+    lines = ["Total {:.1f}s, peak RSS {:.0f} MB".format(
+        summary["wall_s"], max(summary["peak_rss_mb"], summary.get("peak_rss_children_mb", 0)))]
+    totals = sorted(summary["totals"].items(), key=lambda kv: -kv[1]["wall_s"])
+    for name, total in totals[:limit]:
+        line = "{}: {:.2f}s wall, {:.2f}s CPU over {} call(s)".format(
+            name, total["wall_s"], total["cpu_s"], total["count"])
+        if "residues_per_s" in total:
+            line += ", {:.0f} residues/s".format(total["residues_per_s"])
+        lines.append(line)
+    return "\n".join(lines)
@@ -0,0 +1,98 @@
+"""
+Writers for the output files of the rep, babble and scoring applications.
+
+Used by the workflow tasks when the results come back from the inference daemon or
+worker, so both paths produce exactly the same files. csv rows go through
+the csv module, so a name holding a comma or a quote is quoted instead of splitting
+the row.
+"""
+import csv
+import io
+import os
+
+import numpy as np
+
+from unirep_source.data_utils import SUBSTITUTION_AAS
+from unirep_source.rep_store import RaggedStoreWriter
+
+SCORES_HEADER = "name,seq,length,log_likelihood,mean_log_likelihood\n"
+INVALID = "invalid sequence"
+
+
+def csv_row(*fields):
+    """
+    One newline-terminated csv line of fields, quoted where needed.
+    """
+    line = io.StringIO()
+    csv.writer(line, lineterminator="\n").writerow(fields)
+    return line.getvalue()
+
+
+def write_rep(output_dir, name, avg_hidden, final_hidden, final_cell):
+    """
+    {name}_unirep.npy holds avg_hidden, {name}_unirep_fusion.npy all three reps.
+    """
+    np.save(os.path.join(output_dir, f"{name}_unirep"), avg_hidden)
+    np.save(
+        os.path.join(output_dir, f"{name}_unirep_fusion"),
+        np.stack((avg_hidden, final_hidden, final_cell)),
+    )
+
+
+def residue_state_store(output_dir, kinds, rnn_size):
+    return RaggedStoreWriter(
+        os.path.join(output_dir, "residue_states"), {k: rnn_size for k in kinds}
+    )
+
+
+def write_babbles(output_dir, length, outputs):
+    """
+    Write [seq, name, babbles] outputs to babble_results.csv (one row per babble) and
+    {name}/babble{length}.txt (one babble per line), appending to existing files. Every
+    line ends in a newline, so later appends start on a line of their own.
+    """
+    babble_outputs_path = os.path.join(output_dir, "babble_results.csv")
+    if not os.path.exists(babble_outputs_path):
+        with open(babble_outputs_path, "w") as f:
+            f.write("name,seq,babble\n")
+    with open(babble_outputs_path, "a", newline="") as f:
+        writer = csv.writer(f, lineterminator="\n")
+        for seq, name, babbles in outputs:
+            for babble in babbles:
+                writer.writerow([name, seq, babble])
+
+    for seq, name, babbles in outputs:
+        os.makedirs(os.path.join(output_dir, name), exist_ok=True)
+        with open(os.path.join(output_dir, name, f"babble{length}.txt"), "a") as f:
+            f.write("".join(babble + "\n" for babble in babbles))
+        with open(os.path.join(output_dir, name, "original_seq.txt"), "w") as f:
+            f.write(seq)
+
+
+def score_row(name, seq, ll):
+    """
+    Row of scores.csv for per-position log-likelihoods ll (None if seq is invalid).
+    """
+    if ll is None:
+        return csv_row(name, seq, len(seq), INVALID, INVALID)
+    total = float(np.sum(ll))
+    mean = total / max(len(ll), 1)
+    return csv_row(name, seq, len(seq), f"{total:.6f}", f"{mean:.6f}")
+
+
+def position_store(output_dir):
+    return RaggedStoreWriter(
+        os.path.join(output_dir, "position_log_likelihoods"), {"log_likelihood": 1}
+    )
+
+
+def write_substitutions(output_dir, name, seq, log_probs):
+    """
+    {name}/substitutions.csv: per position, the wild type and the log-probability of
+    every amino acid there.
+    """
+    os.makedirs(os.path.join(output_dir, name), exist_ok=True)
+    with open(os.path.join(output_dir, name, "substitutions.csv"), "w") as f:
+        f.write("position,wild_type," + ",".join(SUBSTITUTION_AAS) + "\n")
+        for i, (aa, row) in enumerate(zip(seq.strip(), log_probs)):
+            f.write(f"{i + 1},{aa}," + ",".join(f"{x:.6f}" for x in row) + "\n")
@@ -0,0 +1,122 @@
+"""
+Ragged on-disk store for per-residue representations.
+
+A store is a directory holding, for every array kind (e.g. "hidden", "cell"), one raw
+`{kind}.bin` file with the rows of all sequences back to back, plus an `offsets.npy`
+index (sequence i is rows offsets[i]:offsets[i + 1]), a `names.txt` file and a
+`meta.json` file with the dtype and width of every kind.
+
+The writer appends each sequence to the open files as soon as it is computed, so
+memory use does not depend on the number of sequences. The reader memory-maps the
+files, so slicing one protein only reads that protein's rows from disk.
+"""
+import json
+import os
+
+import numpy as np
+
+META_FILE = "meta.json"
+OFFSETS_FILE = "offsets.npy"
+NAMES_FILE = "names.txt"
+BIN_SUFFIX = ".bin"
+
+
+class RaggedStoreWriter():
+    """
+    Write a ragged store to path, one sequence at a time:
+
+        with RaggedStoreWriter(path, {"hidden": 1900, "cell": 1900}) as store:
+            store.append(name, hidden=hs, cell=cs)
+    """
+
+    def __init__(self, path, dims, dtype="float32"):
+        self._path = path
+        self._dims = dict(dims)
+        self._dtype = np.dtype(dtype)
+        os.makedirs(path, exist_ok=True)
+        self._files = {
+            kind: open(os.path.join(path, kind + BIN_SUFFIX), "wb") for kind in self._dims
+        }
+        self._names = open(os.path.join(path, NAMES_FILE), "w")
+        self._offsets = [0]
+
+    def append(self, name, **arrays):
+        if set(arrays) != set(self._dims):
+            raise ValueError("Expected arrays {}, got {}".format(sorted(self._dims), sorted(arrays)))
+        length = None
+        for kind, array in arrays.items():
+            array = np.ascontiguousarray(array, dtype=self._dtype)
+            if array.ndim != 2 or array.shape[1] != self._dims[kind]:
+                raise ValueError("{} must have shape [length, {}], got {}".format(
+                    kind, self._dims[kind], array.shape))
+            if length is not None and array.shape[0] != length:
+                raise ValueError("All arrays of {} must have the same length".format(name))
+            length = array.shape[0]
+            self._files[kind].write(array.tobytes())
+        self._names.write(name + "\n")
+        self._offsets.append(self._offsets[-1] + length)
+
+    def close(self):
+        for f in self._files.values():
+            f.close()
+        self._names.close()
+        np.save(os.path.join(self._path, OFFSETS_FILE), np.array(self._offsets, dtype=np.int64))
+        with open(os.path.join(self._path, META_FILE), "w") as f:
+            json.dump({"dtype": self._dtype.name, "dims": self._dims}, f)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class RaggedStore():
+    """
+    Read a store written by RaggedStoreWriter. store[i] or store[name] returns a dict
+    of [length, dim] memory-mapped arrays; store.get(i, kind) returns just one of them.
+    """
+
+    def __init__(self, path):
+        with open(os.path.join(path, META_FILE)) as f:
+            meta = json.load(f)
+        self.offsets = np.load(os.path.join(path, OFFSETS_FILE))
+        with open(os.path.join(path, NAMES_FILE)) as f:
+            self.names = f.read().splitlines()
+        self._index = {name: i for i, name in enumerate(self.names)}
+        total = int(self.offsets[-1])
+        self._arrays = {}
+        for kind, dim in meta["dims"].items():
+            if total == 0:
+                self._arrays[kind] = np.zeros((0, dim), dtype=meta["dtype"])
+            else:
+                self._arrays[kind] = np.memmap(
+                    os.path.join(path, kind + BIN_SUFFIX), dtype=meta["dtype"],
+                    mode="r", shape=(total, dim))
+
+    @property
+    def kinds(self):
+        return list(self._arrays)
+
+    @property
+    def lengths(self):
+        return np.diff(self.offsets)
+
+    def __len__(self):
+        return len(self.names)
+
+    def _position(self, key):
+        if isinstance(key, str):
+            return self._index[key]
+        if key < 0:
+            key += len(self)
+        if not 0 <= key < len(self):
+            raise IndexError(key)
+        return key
+
+    def get(self, key, kind="hidden"):
+        i = self._position(key)
+        return self._arrays[kind][self.offsets[i]:self.offsets[i + 1]]
+
+    def __getitem__(self, key):
+        return {kind: self.get(key, kind) for kind in self._arrays}
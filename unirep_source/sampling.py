@@ -0,0 +1,63 @@
+"""
+Host-side sampling of the next token for a batch of sequences.
+
+The model only hands back the logits of the last position, [batch, vocab], and all
+filtering and sampling is done here with vectorized numpy, so the cost of a step does
+not depend on how long the sequences already are. Every sequence draws from its own
+RandomState, so a sequence's sample does not depend on what else is in its batch.
+"""
+import hashlib
+
+import numpy as np
+
+STRATEGIES = ["temperature", "top_k", "top_p"]
+
+
+def filter_logits(logits, temp=1.0, top_k=0, top_p=1.0):
+    """
+    Temperature-scale [batch, vocab] logits and mask (to -inf) everything outside the
+    top_k highest logits (if top_k > 0) and outside the smallest set of tokens whose
+    probability adds up to top_p (if top_p < 1). The most likely token is always kept.
+    """
+    logits = np.asarray(logits, dtype=np.float64) / max(temp, 1e-8)
+    vocab = logits.shape[-1]
+    if 0 < top_k < vocab:
+        kth = np.partition(logits, vocab - top_k, axis=-1)[:, vocab - top_k, None]
+        logits = np.where(logits < kth, -np.inf, logits)
+    if top_p < 1.0:
+        order = np.argsort(-logits, axis=-1)
+        sorted_probs = softmax(np.take_along_axis(logits, order, axis=-1))
+        # Probability mass of the tokens strictly more likely than each token
+        mass_before = np.cumsum(sorted_probs, axis=-1) - sorted_probs
+        drop = np.zeros_like(logits, dtype=bool)
+        np.put_along_axis(drop, order, mass_before >= top_p, axis=-1)
+        logits = np.where(drop, -np.inf, logits)
+    return logits
+
+
+def softmax(logits):
+    logits = logits - logits.max(axis=-1, keepdims=True)
+    e = np.exp(logits)
+    return e / e.sum(axis=-1, keepdims=True)
+
+
+def sample_next(logits, rngs, temp=1.0, top_k=0, top_p=1.0):
+    """
+    Sample one index per row of [batch, vocab] logits, row i using rngs[i].
+    """
+    probs = softmax(filter_logits(logits, temp, top_k, top_p))
+    u = np.array([rng.random_sample() for rng in rngs])
+    cdf = np.cumsum(probs, axis=-1)
+    # First index whose cdf exceeds u, clipped against float round-off at the top
+    return np.minimum((cdf < u[:, None] * cdf[:, -1:]).sum(axis=-1), probs.shape[-1] - 1)
+
+
+def sample_rng(seq, index, seed=42):
+    """
+    RandomState for sample `index` of the seed sequence seq. It only depends on
+    (seq, index, seed), so a sample is the same however the seeds are batched or split
+    across runs.
+    """
+    digest = hashlib.sha256(seq.encode("utf-8")).digest()
+    return np.random.RandomState(
+        list(np.frombuffer(digest[:8], dtype=np.uint32)) + [seed, index])
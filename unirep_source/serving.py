@@ -0,0 +1,205 @@
+"""
+Run rep / babble / score requests against loaded babblers.
+
+Shared by the inference daemon (scripts/serve.py) and the stdin/stdout worker
+(scripts/worker.py), both of which receive requests as framing messages:
+
+    header: {"op": "rep" | "babble" | "score", "model_size": 64 | 256 | 1900,
+             "model_path": path or "None", "precision": "float32", "params": {...}}
+    arrays: {"seqs": uint8 buffer, "seq_lengths": int64} (see framing.pack_strings)
+
+and answer with {"ok": True, "residue_arrays": [...]} and arrays that either have one
+row per sequence ("valid", "reps", "babbles", "log_likelihood") or one row per residue
+of the valid sequences ("hidden", "cell", "position_log_likelihood", "substitutions",
+listed in residue_arrays) with "lengths" giving the residues of every sequence.
+tensorflow is only imported when the first model is loaded.
+"""
+import os
+import subprocess
+from collections import OrderedDict
+
+import numpy as np
+
+from unirep_source.data_utils import encode_batch
+from unirep_source.framing import split_ragged, unpack_strings
+
+OPS = ["rep", "babble", "score"]
+
+
+def download_weights(model_size, root="/root"):
+    """
+    Sync the published weights of model_size to {root}/{model_size}_weights.
+    """
+    path = os.path.join(root, "{}_weights".format(model_size))
+    subprocess.run(
+        [
+            "aws",
+            "s3",
+            "sync",
+            "--no-sign-request",
+            "--quiet",
+            "s3://unirep-public/{}_weights/".format(model_size),
+            path,
+        ]
+    )
+    return path
+
+
+class ModelPool():
+    """
+    Babblers keyed by (model_size, model_path, precision, cell_states), each in its own graph,
+    built on first use and kept loaded. At most max_models are kept: loading another
+    one closes the least recently used, so a long-lived daemon that sees a new
+    model_path per run (custom or evotuned params) does not grow without bound. With a
+    StageTimer, every build is recorded as a "model_build" stage.
+    """
+
+    def __init__(self, batch_size=64, trace_dir=None, trace_every=0, timer=None, max_models=4):
+        self._batch_size = batch_size
+        self._trace_dir = trace_dir
+        self._trace_every = trace_every
+        self._timer = timer
+        self._max_models = max_models
+        self._models = OrderedDict()
+
+    def __len__(self):
+        return len(self._models)
+
+    def get(self, model_size, model_path="None", precision="float32", cell_states=False):
+        key = (int(model_size), model_path, precision, bool(cell_states))
+        if key in self._models:
+            self._models.move_to_end(key)
+            return self._models[key]
+        while len(self._models) >= max(self._max_models, 1):
+            _, evicted = self._models.popitem(last=False)
+            evicted.close()
+        if self._timer is None:
+            self._models[key] = self._load(*key)
+        else:
+            with self._timer.stage("model_build", model_size=key[0]):
+                self._models[key] = self._load(*key)
+        return self._models[key]
+
+    def _load(self, model_size, model_path, precision, cell_states):
+        import tensorflow as tf
+        from unirep_source.unirep import (
+            FROZEN_GRAPH, babbler64, babbler256, babbler1900, frozen_dir, load_frozen)
+
+        babblers = {64: babbler64, 256: babbler256, 1900: babbler1900}
+        if model_size not in babblers:
+            raise ValueError("Invalid model size: {}".format(model_size))
+        if model_path == "None":
+            model_path = download_weights(model_size)
+        # A graph exported by scripts/export_graph.py is a single import, otherwise
+        # the graph is built in python
+        frozen = frozen_dir(model_path, precision, cell_states)
+        if os.path.exists(os.path.join(frozen, FROZEN_GRAPH)):
+            b = load_frozen(frozen, batch_size=self._batch_size)
+        else:
+            with tf.Graph().as_default():
+                b = babblers[model_size](batch_size=self._batch_size, model_path=model_path,
+                                         cell_states=cell_states, precision=precision)
+        b._session()
+        if self._trace_dir is not None and self._trace_every:
+            b.enable_profiling(
+                os.path.join(self._trace_dir, "{}_{}".format(model_size, precision)),
+                every=self._trace_every)
+        return b
+
+
+def model_args(header):
+    """
+    The ModelPool.get arguments of a request. Only rep requests for per-residue cell
+    states need the babbler that builds them.
+    """
+    cell_states = (header.get("op") == "rep"
+                   and header.get("params", {}).get("residue_states") == "hidden_and_cell")
+    return (header["model_size"], header.get("model_path", "None"),
+            header.get("precision", "float32"), cell_states)
+
+
+def request_seqs(arrays):
+    return unpack_strings(arrays["seqs"], arrays["seq_lengths"])
+
+
+def run_op(b, op, seqs, params):
+    """
+    Run op on seqs with babbler b. Returns the response (header, arrays).
+    """
+    seqs = [s.strip() for s in seqs]
+    valid, _, _ = encode_batch(seqs)
+    idxs = np.flatnonzero(valid)
+    valid_seqs = [seqs[i] for i in idxs]
+    lengths = np.array([len(s) if v else 0 for s, v in zip(seqs, valid)], dtype=np.int64)
+    arrays = {"valid": valid, "lengths": lengths}
+    residue_arrays = []
+    rnn_size = b._rnn_size
+
+    def flat(rows, width):
+        return np.concatenate(rows) if rows else np.zeros((0, width), dtype=np.float32)
+
+    if op == "rep":
+        residue_states = params.get("residue_states", "none")
+        reps = b.get_reps(valid_seqs, states=residue_states != "none",
+                          cells=residue_states == "hidden_and_cell") if valid_seqs else []
+        arrays["reps"] = np.zeros((len(seqs), 3, rnn_size), dtype=np.float32)
+        for i, rep in zip(idxs, reps):
+            arrays["reps"][i] = np.stack(rep[:3])
+        if residue_states != "none":
+            arrays["hidden"] = flat([rep[3] for rep in reps], rnn_size)
+            residue_arrays.append("hidden")
+        if residue_states == "hidden_and_cell":
+            arrays["cell"] = flat([rep[4] for rep in reps], rnn_size)
+            residue_arrays.append("cell")
+    elif op == "babble":
+        num_samples = int(params.get("num_samples", 1))
+        babbles = [["invalid sequence"] * num_samples for _ in seqs]
+        if valid_seqs:
+            results = b.get_babbles(
+                valid_seqs, params["length"], params["temp"], top_k=params.get("top_k", 0),
+                top_p=params.get("top_p", 1.0), num_samples=num_samples,
+                random_seed=params.get("random_seed", 42))
+            for i, samples in zip(idxs, results):
+                babbles[i] = samples
+        arrays["babbles"] = np.array(
+            [[s.encode("ascii") for s in samples] for samples in babbles], dtype=bytes
+        ).reshape(len(seqs), num_samples)
+    elif op == "score":
+        _, scores = b.get_log_likelihoods(valid_seqs) if valid_seqs else (None, [])
+        arrays["log_likelihood"] = np.full(len(seqs), np.nan, dtype=np.float64)
+        arrays["log_likelihood"][idxs] = [ll.sum() for ll in scores]
+        arrays["position_log_likelihood"] = flat(scores, 0).reshape(-1)
+        residue_arrays.append("position_log_likelihood")
+        if params.get("substitutions"):
+            arrays["substitutions"] = flat([b.get_substitution_matrix(s) for s in valid_seqs], 20)
+            residue_arrays.append("substitutions")
+    else:
+        raise ValueError("Unknown op: {}".format(op))
+    return {"ok": True, "residue_arrays": residue_arrays}, arrays
+
+
+def split_response(header, arrays, counts):
+    """
+    Split the response to a merged request back into one response per original
+    request, where request i had counts[i] sequences.
+    """
+    starts = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+    residue_counts = [int(arrays["lengths"][starts[i]:starts[i + 1]].sum()) for i in range(len(counts))]
+    pieces = {}
+    for name, a in arrays.items():
+        if name in header["residue_arrays"]:
+            pieces[name] = split_ragged(a, residue_counts)
+        else:
+            pieces[name] = split_ragged(a, counts)
+    return [(header, {name: pieces[name][i] for name in arrays}) for i in range(len(counts))]
+
+
+def handle(pool, header, arrays):
+    """
+    Answer one request message, turning failures into an error response.
+    """
+    try:
+        b = pool.get(*model_args(header))
+        return run_op(b, header["op"], request_seqs(arrays), header.get("params", {}))
+    except Exception as e:
+        return {"ok": False, "error": "{}: {}".format(type(e).__name__, e)}, {}
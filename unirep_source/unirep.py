@@ -3,12 +3,19 @@ The trained 1900-dimensional mLSTM babbler.
 """
 
 import tensorflow as tf
+from tensorflow.python.util import nest
 import numpy as np
-import pandas as pd
-import sys
-sys.path.append('../')
-from unirep_source.data_utils import aa_seq_to_int, int_to_aa, bucketbatchpad
+from unirep_source.data_utils import aa_seq_to_int, aa_to_int, int_to_aa, bucketbatchpad, adaptive_bucketbatchpad, encode_batch, SUBSTITUTION_AAS
+from unirep_source.data_utils import pad_sequences, plan_token_batches, token_budget
+from unirep_source.sampling import sample_next, sample_rng
 import os
+import json
+
+# Files written by babbler.export_frozen, see load_frozen. The version is bumped when
+# the graph changes, so older exports are not picked up.
+FROZEN_GRAPH = "graph.pb"
+FROZEN_ENDPOINTS = "endpoints.json"
+FROZEN_VERSION = 5
 
 # Helpers
 def tf_get_shape(tensor):
@@ -28,6 +35,25 @@ def sample_with_temp(logits, t):
     # Make a categorical distribution from the softmax and sample
     return tf.distributions.Categorical(probs=softed).sample()
 
+def last_position_logits(last_output, logits_flat):
+    """
+    Apply the fully_connected layer that produced logits_flat to the output at the last
+    position of every sequence only, [batch, rnn_size] -> [batch, vocab - 1].
+    """
+    scope = logits_flat.op.name.rsplit('/', 1)[0]
+    with tf.variable_scope(scope, reuse=True):
+        weights = tf.get_variable("weights")
+        biases = tf.get_variable("biases")
+    return tf.matmul(last_output, weights) + biases
+
+def repeat_state(state, n):
+    """
+    Repeat every row of a (possibly nested) tuple of [batch, ...] state arrays n times.
+    """
+    if isinstance(state, tuple):
+        return tuple(repeat_state(s, n) for s in state)
+    return np.repeat(state, n, axis=0)
+
 def initialize_uninitialized(sess):
     """
     from https://stackoverflow.com/questions/35164529/in-tensorflow-is-there-any-way-to-just-initialize-uninitialised-variables
@@ -39,6 +65,32 @@ def initialize_uninitialized(sess):
         sess.run(tf.variables_initializer(not_initialized_vars))
 
 
+def quantize_per_channel(w):
+    """
+    Symmetric int8 quantization of a 2D weight matrix with one scale per output
+    column. Returns the int8 matrix and the float32 scales, w ~= q * scale.
+    """
+    scale = np.abs(w).max(axis=0) / 127.
+    scale = np.where(scale > 0, scale, 1.).astype(np.float32)
+    q = np.clip(np.round(w / scale), -127, 127).astype(np.int8)
+    return q, scale
+
+def weight_normalize(w, g):
+    """
+    Numpy version of tf.nn.l2_normalize(w, dim=0) * g.
+    """
+    return w / np.sqrt(np.maximum(np.sum(w ** 2, axis=0, keepdims=True), 1e-12)) * g
+
+PRECISIONS = ["float32", "float16", "int8"]
+
+
+def check_full_precision(precision):
+    """
+    The stacked models only have float32 weights.
+    """
+    if precision != "float32":
+        raise ValueError("Only the 1900 model supports {} weights".format(precision))
+
 # Setup to initialize from the correctly named model files.
 class mLSTMCell1900(tf.nn.rnn_cell.RNNCell):
 
@@ -48,14 +100,50 @@ class mLSTMCell1900(tf.nn.rnn_cell.RNNCell):
                  wn=True,
                  scope='mlstm',
                  var_device='cpu:0',
+                 precision="float32",
+                 emit_cell_state=False,
                  ):
         # Really not sure if I should reuse here
         super(mLSTMCell1900, self).__init__()
         self._num_units = num_units
+        self._emit_cell_state = emit_cell_state
         self._model_path = model_path
         self._wn = wn
         self._scope = scope
         self._var_device = var_device
+        if precision not in PRECISIONS:
+            raise ValueError("precision must be one of {}".format(PRECISIONS))
+        self._precision = precision
+        if precision != "float32":
+            self._weights = self._reduced_precision_weights()
+
+    def _load(self, name):
+        return np.load(os.path.join(self._model_path, "rnn_mlstm_mlstm_{}:0.npy".format(name)))
+
+    def _reduced_precision_weights(self):
+        """
+        Inference only. The weight normalization is folded into wx, wh, wmx and wmh
+        once on the host, and the result is stored in float16 or per-channel int8.
+        They are dequantized here, outside of the recurrent loop, so the float32 copies
+        are made once per session run and every step reads float32 weights exactly as
+        the float32 model does. The reduced precisions only shrink the weights kept
+        between runs (variables and exported frozen graphs); a run is no faster and its
+        peak memory is that of float32.
+        """
+        weights = {}
+        with tf.variable_scope(self._scope + "_" + self._precision):
+            for name, g in [("wx", "gx"), ("wh", "gh"), ("wmx", "gmx"), ("wmh", "gmh")]:
+                w = self._load(name)
+                if self._wn:
+                    w = weight_normalize(w, self._load(g))
+                if self._precision == "float16":
+                    stored = tf.get_variable(name, initializer=w.astype(np.float16), trainable=False)
+                    weights[name] = tf.cast(stored, tf.float32)
+                else:
+                    q, scale = quantize_per_channel(w)
+                    stored = tf.get_variable(name, initializer=q, trainable=False)
+                    weights[name] = tf.cast(stored, tf.float32) * tf.constant(scale)
+        return weights
 
     @property
     def state_size(self):
@@ -64,7 +152,9 @@ class mLSTMCell1900(tf.nn.rnn_cell.RNNCell):
 
     @property
     def output_size(self):
-        # The output is h
+        # The output is h, or [h, c] if emit_cell_state
+        if self._emit_cell_state:
+            return 2 * self._num_units
         return (self._num_units)
 
     def zero_state(self, batch_size, dtype):
@@ -79,41 +169,47 @@ class mLSTMCell1900(tf.nn.rnn_cell.RNNCell):
 
         # Unpack the state tuple
         c_prev, h_prev = state
-        with tf.variable_scope(self._scope):
-            wx_init = np.load(os.path.join(self._model_path, "rnn_mlstm_mlstm_wx:0.npy"))
-            wh_init = np.load(os.path.join(self._model_path, "rnn_mlstm_mlstm_wh:0.npy"))
-            wmx_init = np.load(os.path.join(self._model_path, "rnn_mlstm_mlstm_wmx:0.npy"))
-            wmh_init = np.load(os.path.join(self._model_path, "rnn_mlstm_mlstm_wmh:0.npy"))
-            b_init = np.load(os.path.join(self._model_path, "rnn_mlstm_mlstm_b:0.npy"))
-            gx_init = np.load(os.path.join(self._model_path, "rnn_mlstm_mlstm_gx:0.npy"))
-            gh_init = np.load(os.path.join(self._model_path, "rnn_mlstm_mlstm_gh:0.npy"))
-            gmx_init = np.load(os.path.join(self._model_path, "rnn_mlstm_mlstm_gmx:0.npy"))
-            gmh_init = np.load(os.path.join(self._model_path, "rnn_mlstm_mlstm_gmh:0.npy"))
-            wx = tf.get_variable(
-                "wx", initializer=wx_init)
-            wh = tf.get_variable(
-                "wh", initializer=wh_init)
-            wmx = tf.get_variable(
-                "wmx", initializer=wmx_init)
-            wmh = tf.get_variable(
-                "wmh", initializer=wmh_init)
-            b = tf.get_variable(
-                "b", initializer=b_init)
-            if self._wn:
-                gx = tf.get_variable(
-                    "gx", initializer=gx_init)
-                gh = tf.get_variable(
-                    "gh", initializer=gh_init)
-                gmx = tf.get_variable(
-                    "gmx", initializer=gmx_init)
-                gmh = tf.get_variable(
-                    "gmh", initializer=gmh_init)
+        if self._precision != "float32":
+            with tf.variable_scope(self._scope):
+                b = tf.get_variable(
+                    "b", initializer=self._load("b"))
+            wx, wh, wmx, wmh = [self._weights[n] for n in ["wx", "wh", "wmx", "wmh"]]
+        else:
+            with tf.variable_scope(self._scope):
+                wx_init = np.load(os.path.join(self._model_path, "rnn_mlstm_mlstm_wx:0.npy"))
+                wh_init = np.load(os.path.join(self._model_path, "rnn_mlstm_mlstm_wh:0.npy"))
+                wmx_init = np.load(os.path.join(self._model_path, "rnn_mlstm_mlstm_wmx:0.npy"))
+                wmh_init = np.load(os.path.join(self._model_path, "rnn_mlstm_mlstm_wmh:0.npy"))
+                b_init = np.load(os.path.join(self._model_path, "rnn_mlstm_mlstm_b:0.npy"))
+                gx_init = np.load(os.path.join(self._model_path, "rnn_mlstm_mlstm_gx:0.npy"))
+                gh_init = np.load(os.path.join(self._model_path, "rnn_mlstm_mlstm_gh:0.npy"))
+                gmx_init = np.load(os.path.join(self._model_path, "rnn_mlstm_mlstm_gmx:0.npy"))
+                gmh_init = np.load(os.path.join(self._model_path, "rnn_mlstm_mlstm_gmh:0.npy"))
+                wx = tf.get_variable(
+                    "wx", initializer=wx_init)
+                wh = tf.get_variable(
+                    "wh", initializer=wh_init)
+                wmx = tf.get_variable(
+                    "wmx", initializer=wmx_init)
+                wmh = tf.get_variable(
+                    "wmh", initializer=wmh_init)
+                b = tf.get_variable(
+                    "b", initializer=b_init)
+                if self._wn:
+                    gx = tf.get_variable(
+                        "gx", initializer=gx_init)
+                    gh = tf.get_variable(
+                        "gh", initializer=gh_init)
+                    gmx = tf.get_variable(
+                        "gmx", initializer=gmx_init)
+                    gmh = tf.get_variable(
+                        "gmh", initializer=gmh_init)
 
-        if self._wn:
-            wx = tf.nn.l2_normalize(wx, dim=0) * gx
-            wh = tf.nn.l2_normalize(wh, dim=0) * gh
-            wmx = tf.nn.l2_normalize(wmx, dim=0) * gmx
-            wmh = tf.nn.l2_normalize(wmh, dim=0) * gmh
+            if self._wn:
+                wx = tf.nn.l2_normalize(wx, dim=0) * gx
+                wh = tf.nn.l2_normalize(wh, dim=0) * gh
+                wmx = tf.nn.l2_normalize(wmx, dim=0) * gmx
+                wmh = tf.nn.l2_normalize(wmh, dim=0) * gmh
         m = tf.matmul(inputs, wmx) * tf.matmul(h_prev, wmh)
         z = tf.matmul(inputs, wx) + tf.matmul(m, wh) + b
         i, f, o, u = tf.split(z, 4, 1)
@@ -123,6 +219,8 @@ class mLSTMCell1900(tf.nn.rnn_cell.RNNCell):
         u = tf.tanh(u)
         c = f * c_prev + i * u
         h = o * tf.tanh(c)
+        if self._emit_cell_state:
+            return tf.concat([h, c], 1), (c, h)
         return h, (c, h)
 
 class mLSTMCell(tf.nn.rnn_cell.RNNCell):
@@ -227,11 +325,13 @@ class mLSTMCellStackNPY(tf.nn.rnn_cell.RNNCell):
                  wn=True,
                  scope='mlstm_stack',
                  var_device='cpu:0',
-                 model_path="./"
+                 model_path="./",
+                 emit_cell_state=False
                  ):
         # Really not sure if I should reuse here
         super(mLSTMCellStackNPY, self).__init__()
         self._model_path=model_path
+        self._emit_cell_state = emit_cell_state
         self._num_units = num_units
         self._num_layers = num_layers
         self._dropout = dropout
@@ -272,7 +372,9 @@ class mLSTMCellStackNPY(tf.nn.rnn_cell.RNNCell):
 
     @property
     def output_size(self):
-        # The output is h
+        # The output is h, or [h, c of the last layer] if emit_cell_state
+        if self._emit_cell_state:
+            return 2 * self._num_units
         return (self._num_units)
 
     def zero_state(self, batch_size, dtype):
@@ -306,6 +408,8 @@ class mLSTMCellStackNPY(tf.nn.rnn_cell.RNNCell):
         else:
             final_output = new_outputs[-1]
 
+        if self._emit_cell_state:
+            final_output = tf.concat([final_output, new_cs[-1]], 1)
         return final_output, (tuple(new_cs), tuple(new_hs))
 
 
@@ -313,14 +417,26 @@ class babbler1900():
 
     def __init__(self,
                  model_path="./pbab_weights",
-                 batch_size=256
+                 batch_size=256,
+                 precision="float32",
+                 cell_states=False
                  ):
+        """
+        precision is one of "float32", "float16" or "int8". The reduced precisions store
+        the recurrent weights in float16 / per-channel int8 between runs and dequantize
+        them once per run, so they save stored weight memory only, not time, see
+        mLSTMCell1900._reduced_precision_weights. They are meant for inference only.
+        cell_states also builds the per-residue cell state output, which doubles the
+        activations the rnn keeps per step; only get_reps(cells=True) and
+        get_rep_with_states need it.
+        """
         self._rnn_size = 1900
         self._vocab_size = 26
         self._embed_dim = 10
         self._wn = True
         self._shuffle_buffer = 10000
         self._model_path = model_path
+        self._precision = precision
         self._batch_size = batch_size
         self._batch_size_placeholder = tf.placeholder(tf.int32, shape=[], name="batch_size")
         self._minibatch_x_placeholder = tf.placeholder(
@@ -335,12 +451,18 @@ class babbler1900():
         # Lengths of the input sequence batch. Used to index into
         # The final_hidden output and select the stop codon -1
         # final hidden for the graph operation.
-        self._seq_length_placeholder = tf.placeholder(
-            tf.int32, shape=[None], name="seq_len")
+        # Defaults to the full padded length. Feeding it for a batch of mixed lengths
+        # also stops the rnn at the end of every sequence (outputs past it are zero).
+        self._seq_length_placeholder = tf.placeholder_with_default(
+            tf.fill([tf.shape(self._minibatch_x_placeholder)[0]],
+                    tf.shape(self._minibatch_x_placeholder)[1]),
+            shape=[None], name="seq_len")
         self._temp_placeholder = tf.placeholder(tf.float32, shape=[], name="temp")
         rnn = mLSTMCell1900(self._rnn_size,
                     model_path=model_path,
-                        wn=self._wn)
+                        wn=self._wn,
+                        precision=precision,
+                        emit_cell_state=cell_states)
         zero_state = rnn.zero_state(self._batch_size, tf.float32)
         single_zero = rnn.zero_state(1, tf.float32)
         mask = tf.sign(self._minibatch_y_placeholder)  # 1 for nonpad, zero for pad
@@ -354,13 +476,21 @@ class babbler1900():
             "embed_matrix", dtype=tf.float32, initializer=np.load(os.path.join(self._model_path, "embed_matrix:0.npy"))
         )
         embed_cell = tf.nn.embedding_lookup(embed_matrix, self._minibatch_x_placeholder)
-        self._output, self._final_state = tf.nn.dynamic_rnn(
+        outputs, self._final_state = tf.nn.dynamic_rnn(
             rnn,
             embed_cell,
             initial_state=self._initial_state_placeholder,
+            sequence_length=self._seq_length_placeholder,
             swap_memory=True,
             parallel_iterations=1
         )
+        # With cell_states the cell emits [hidden, cell] at every step
+        if cell_states:
+            self._output = outputs[:, :, :self._rnn_size]
+            self._cell_output = outputs[:, :, self._rnn_size:]
+        else:
+            self._output = outputs
+            self._cell_output = None
 
         # If we are training a model on top of the rep model, we need to access
         # the final_hidden rep from output. Recall we are padding these sequences
@@ -378,7 +508,8 @@ class babbler1900():
             weights_initializer=tf.constant_initializer(np.load(os.path.join(self._model_path, "fully_connected_weights:0.npy"))),
             biases_initializer=tf.constant_initializer(np.load(os.path.join(self._model_path, "fully_connected_biases:0.npy"))))
         self._logits = tf.reshape(
-            logits_flat, [batch_size, tf_get_shape(self._minibatch_x_placeholder)[1], self._vocab_size - 1])
+            logits_flat, tf_get_shape(self._minibatch_x_placeholder) + [self._vocab_size - 1])
+        self._last_logits = last_position_logits(self._top_final_hidden, logits_flat)
         batch_losses = tf.contrib.seq2seq.sequence_loss(
             self._logits,
             tf.cast(pad_adjusted_targets, tf.int32),
@@ -386,10 +517,17 @@ class babbler1900():
             average_across_batch=False
         )
         self._loss = tf.reduce_mean(batch_losses)
+        # Log-likelihood of every target token, zero at padding
+        self._token_log_likelihood = -tf.nn.sparse_softmax_cross_entropy_with_logits(
+            labels=tf.cast(pad_adjusted_targets, tf.int32), logits=self._logits
+        ) * tf.cast(mask, tf.float32)
         self._sample = sample_with_temp(self._logits, self._temp_placeholder)
         with tf.Session() as sess:
             self._zero_state = sess.run(zero_state)
             self._single_zero = sess.run(single_zero)
+        self._graph = tf.get_default_graph()
+        self._sess = None
+        self._trace_dir = None
 
 
     def get_rep(self,seq):
@@ -399,18 +537,16 @@ class babbler1900():
         Unfortunately, this method accepts one sequence at a time and is as such quite
         slow.
         """
-        with tf.Session() as sess:
-            initialize_uninitialized(sess)
-            # Strip any whitespace and convert to integers with the correct coding
-            int_seq = aa_seq_to_int(seq.strip())[:-1]
-            # Final state is a cell_state, hidden_state tuple. Output is
-            # all hidden states
-            final_state_, hs = sess.run(
-                [self._final_state, self._output], feed_dict={
-                    self._batch_size_placeholder: 1,
-                    self._minibatch_x_placeholder: [int_seq],
-                    self._initial_state_placeholder: self._zero_state}
-            )
+        # Strip any whitespace and convert to integers with the correct coding
+        int_seq = aa_seq_to_int(seq.strip())[:-1]
+        # Final state is a cell_state, hidden_state tuple. Output is
+        # all hidden states
+        final_state_, hs = self._run(
+            [self._final_state, self._output], feed_dict={
+                self._batch_size_placeholder: 1,
+                self._minibatch_x_placeholder: [int_seq],
+                self._initial_state_placeholder: self._single_zero}
+        )
 
         final_cell, final_hidden = final_state_
         # Drop the batch dimension so it is just seq len by
@@ -421,47 +557,376 @@ class babbler1900():
         avg_hidden = np.mean(hs, axis=0)
         return avg_hidden, final_hidden, final_cell
 
-    def get_babble(self, seed, length=250, temp=1):
+    def get_babble(self, seed, length=250, temp=1, top_k=0, top_p=1.0, random_seed=42):
         """
         Return a babble at temperature temp (on (0,1] with 1 being the noisiest)
         starting with seed and continuing to length length.
-        Unfortunately, this method accepts one sequence at a time and is as such quite
-        slow.
-
+        If top_k > 0 only the top_k most likely amino acids are sampled from at each
+        step, and if top_p < 1 only the most likely ones adding up to probability top_p.
+        Use get_babbles to babble from many seeds, or many times from one seed, at once.
         """
-        with tf.Session() as sess:
-            initialize_uninitialized(sess)
-            int_seed = aa_seq_to_int(seed.strip())[:-1]
+        return self.get_babbles([seed], length, temp, top_k, top_p, random_seed=random_seed)[0][0]
 
-            # No need for padding because this is a single element
-            seed_samples, final_state_ = sess.run(
-                [self._sample, self._final_state],
+    def get_babbles(self, seeds, length=250, temp=1, top_k=0, top_p=1.0, num_samples=1, random_seed=42):
+        """
+        Return num_samples babbles for every seed in seeds (a list of lists), see
+        get_babble. Each seed is read once: the state after the seed is replicated
+        num_samples times and all samples are extended together, one token per step for
+        the whole batch. Seeds are batched by plan_batches, and a batch runs until its
+        shortest seed is complete, every babble being cut at length.
+        Only the logits of the last position are computed and sampling happens on the
+        host (see sampling.py). Sample j of a seed draws from sample_rng(seed, j,
+        random_seed), so it is the same however the seeds are batched.
+        """
+        seeds = [s.strip() for s in seeds]
+        babbles = [[s] * num_samples for s in seeds]
+        seed_lengths = np.array([len(s) for s in seeds], dtype=np.int64)
+        todo = np.flatnonzero(seed_lengths < length)
+        # Seeds are read with the start token
+        plan = self.plan_batches(seed_lengths[todo] + 1, max_batch=max(1, self._batch_size // num_samples))
+        for batch in plan:
+            chunk = todo[batch]
+            n_new = length - seed_lengths[chunk]
+            rngs = [sample_rng(seeds[i], j, random_seed) for i in chunk for j in range(num_samples)]
+            # Read the seeds once, then replicate the state and logits per sample
+            logits, state = self._run(
+                [self._last_logits, self._final_state],
                 feed_dict={
-                    self._minibatch_x_placeholder: [int_seed],
-                    self._initial_state_placeholder: self._zero_state,
-                    self._batch_size_placeholder: 1,
-                    self._temp_placeholder: temp
+                    self._minibatch_x_placeholder: pad_sequences([aa_seq_to_int(seeds[i])[:-1] for i in chunk]),
+                    self._seq_length_placeholder: seed_lengths[chunk] + 1,
+                    self._initial_state_placeholder: self._batch_zero(len(chunk)),
+                    self._batch_size_placeholder: len(chunk)
                 }
             )
-            # Just the actual character prediction
-            pred_int = seed_samples[0, -1] + 1
-            # Matthew Nemeth EDIT - check first to make sure length > len(seed) before adding
-            if length > len(seed):
-                seed = seed + int_to_aa[pred_int]
-
-            for i in range(length - len(seed)):
-                pred_int, final_state_ = sess.run(
-                    [self._sample, self._final_state],
-                    feed_dict={
-                        self._minibatch_x_placeholder: [[pred_int]],
-                        self._initial_state_placeholder: final_state_,
-                        self._batch_size_placeholder: 1,
-                        self._temp_placeholder: temp
-                    }
-                )
-                pred_int = pred_int[0, 0] + 1
-                seed = seed + int_to_aa[pred_int]
-        return seed
+            logits = np.repeat(logits, num_samples, axis=0)
+            state = repeat_state(state, num_samples)
+            new_tokens = []
+            for step in range(n_new.max()):
+                if step > 0:
+                    logits, state = self._run(
+                        [self._last_logits, self._final_state],
+                        feed_dict={
+                            self._minibatch_x_placeholder: pred[:, None],
+                            self._initial_state_placeholder: state,
+                            self._batch_size_placeholder: len(rngs)
+                        }
+                    )
+                pred = sample_next(logits, rngs, temp, top_k, top_p) + 1
+                new_tokens.append(pred)
+            samples = np.stack(new_tokens, axis=1).reshape(len(chunk), num_samples, -1)
+            for i, n, seed_samples in zip(chunk, n_new, samples):
+                babbles[i] = [
+                    seeds[i] + "".join(int_to_aa[int(t)] for t in tokens[:n])
+                    for tokens in seed_samples
+                ]
+        return babbles
+
+    def get_reps(self, seqs, states=False, cells=False):
+        """
+        Batched get_rep for valid sequences, in the batches of plan_batches. Every
+        sequence's rnn stops at its own end, so the padding of a batch does not change
+        its reps. states adds the per-residue hidden states and cells the per-residue
+        cell states as well (which needs a babbler built with cell_states).
+        Returns a list with the tuple of representations of every sequence.
+        """
+        if cells:
+            self._check_cell_states()
+        seqs = [s.strip() for s in seqs]
+        fetches = [self._final_state, self._output] + ([self._cell_output] if cells else [])
+        # Start token + residues
+        lengths = np.array([len(s) + 1 for s in seqs], dtype=np.int64)
+        reps = [None] * len(seqs)
+        for chunk in self.plan_batches(lengths):
+            results = self._run(fetches, feed_dict={
+                self._batch_size_placeholder: len(chunk),
+                self._minibatch_x_placeholder: pad_sequences([aa_seq_to_int(seqs[i])[:-1] for i in chunk]),
+                self._seq_length_placeholder: lengths[chunk],
+                self._initial_state_placeholder: self._batch_zero(len(chunk))}
+            )
+            (final_cell, final_hidden), hs = results[0], results[1]
+            if isinstance(final_cell, tuple):
+                # Deep model, take the last layer
+                final_cell = final_cell[-1]
+                final_hidden = final_hidden[-1]
+            for row, i in enumerate(chunk):
+                n = lengths[i]
+                reps[i] = (hs[row, :n].mean(axis=0), final_hidden[row], final_cell[row])
+                if states:
+                    reps[i] += (hs[row, 1:n],)
+                if cells:
+                    reps[i] += (results[2][row, 1:n],)
+        return reps
+
+    def _check_cell_states(self):
+        if self._cell_output is None:
+            raise ValueError("Per-residue cell states need a babbler built with cell_states=True")
+
+    def get_rep_with_states(self, seq):
+        """
+        Like get_rep, but additionally returns the per-residue hidden and cell states,
+        each a [len(seq), rnn_size] array where row i is the state after reading
+        residue i (for the stacked models, the cell state of the last layer).
+        Needs a babbler built with cell_states.
+        """
+        self._check_cell_states()
+        int_seq = aa_seq_to_int(seq.strip())[:-1]
+        final_state_, hs, cs = self._run(
+            [self._final_state, self._output, self._cell_output], feed_dict={
+                self._batch_size_placeholder: 1,
+                self._minibatch_x_placeholder: [int_seq],
+                self._initial_state_placeholder: self._single_zero}
+        )
+        final_cell, final_hidden = final_state_
+        if isinstance(final_cell, tuple):
+            # Deep model, take the last layer
+            final_cell = final_cell[-1]
+            final_hidden = final_hidden[-1]
+        hs = hs[0]
+        avg_hidden = np.mean(hs, axis=0)
+        # Drop the state after the start token so rows line up with residues
+        return avg_hidden, final_hidden[0], final_cell[0], hs[1:], cs[0][1:]
+
+    def get_log_likelihoods(self, seqs, max_len=2000):
+        """
+        Score seqs under the model. Sequences are batched by plan_batches and each batch
+        is scored in one forward pass.
+        Returns the validity mask and a list holding, for every sequence, a float32
+        array with the log-likelihood of each residue given the ones before it
+        (None for invalid sequences). Sum it for the sequence log-likelihood.
+        """
+        valid, batch, lengths = self.format_seqs(seqs, max_len=max_len)
+        scores = [None] * len(seqs)
+        # Inputs are start + residues[:-1], targets are the residues
+        n_inputs = lengths - 1
+        idxs = np.flatnonzero(valid)
+        for i in idxs[n_inputs[idxs] < 1]:
+            # Nothing to score after the start token
+            scores[i] = np.zeros(0, dtype=np.float32)
+        idxs = idxs[n_inputs[idxs] >= 1]
+        for plan_batch in self.plan_batches(n_inputs[idxs]):
+            chunk = idxs[plan_batch]
+            tokens = batch[chunk, :n_inputs[chunk].max() + 1]
+            ll = self._run(self._token_log_likelihood, feed_dict={
+                self._minibatch_x_placeholder: tokens[:, :-1],
+                self._minibatch_y_placeholder: tokens[:, 1:],
+                self._seq_length_placeholder: n_inputs[chunk],
+                self._batch_size_placeholder: len(chunk),
+                self._initial_state_placeholder: self._batch_zero(len(chunk))}
+            )
+            for i, row in zip(chunk, ll):
+                scores[i] = row[:n_inputs[i]].astype(np.float32)
+        return valid, scores
+
+    def get_substitution_matrix(self, parent):
+        """
+        Log-probability of each of the 20 standard amino acids (SUBSTITUTION_AAS order)
+        at every position of parent, as an [L, 20] array, from a single forward pass.
+        The logits at position i - 1 are the model's prediction for residue i, so row i
+        scores every substitution at i given the parent's residues before it. The
+        effect of a point mutant is row[mutant] - row[wild type].
+        An empty parent gives a [0, 20] array, an invalid one raises a ValueError.
+        """
+        parent = parent.strip()
+        if len(parent) == 0:
+            return np.zeros((0, len(SUBSTITUTION_AAS)), dtype=np.float32)
+        if not self.is_valid_seq(parent, max_len=len(parent) + 1):
+            raise ValueError("Invalid sequence for get_substitution_matrix: {}".format(parent))
+        # Start token + all residues but the last, so there is one prediction per residue
+        int_seq = aa_seq_to_int(parent)[:-2]
+        logits = self._run(self._logits, feed_dict={
+            self._batch_size_placeholder: 1,
+            self._minibatch_x_placeholder: [int_seq],
+            self._initial_state_placeholder: self._single_zero}
+        )[0]
+        # log_softmax over the full vocabulary, then keep the standard amino acids
+        logits = logits - logits.max(axis=1, keepdims=True)
+        log_probs = logits - np.log(np.exp(logits).sum(axis=1, keepdims=True))
+        columns = [aa_to_int[aa] - 1 for aa in SUBSTITUTION_AAS]
+        return log_probs[:, columns]
+
+    def set_max_tokens(self, max_tokens):
+        """
+        Token budget (batch x padded length) of plan_batches. By default it is derived
+        from the memory available when the first batch is planned, see token_budget.
+        """
+        self._max_tokens = max_tokens
+
+    def plan_batches(self, lengths, max_batch=None):
+        """
+        Batches (index arrays into lengths) for running sequences of the given token
+        lengths: longest first, each under the token budget and at most max_batch (by
+        default batch_size) rows. See data_utils.plan_token_batches.
+        """
+        if getattr(self, "_max_tokens", None) is None:
+            self._max_tokens = token_budget(self._rnn_size)
+        return plan_token_batches(lengths, self._max_tokens, max_batch or self._batch_size)
+
+    def _batch_zero(self, n):
+        """
+        Zero state for a batch of n sequences.
+        """
+        return repeat_state(self._single_zero, n)
+
+    def enable_profiling(self, trace_dir, every=50, max_traces=10):
+        """
+        Trace every `every`-th model run (at most max_traces of them) with full
+        RunMetadata. Each traced run is written to trace_dir as a Chrome trace
+        (open in chrome://tracing), and op_summary.json accumulates the time spent
+        per op type over all traced runs. Untraced runs are not slowed down.
+        """
+        os.makedirs(trace_dir, exist_ok=True)
+        self._trace_dir = trace_dir
+        self._trace_every = max(int(every), 1)
+        self._max_traces = max_traces
+        self._num_runs = 0
+        self._num_traces = 0
+        self._op_micros = {}
+
+    def _run(self, fetches, feed_dict):
+        """
+        sess.run on the model's session, tracing the run if profiling is enabled and
+        it is sampled.
+        """
+        sess = self._session()
+        if self._trace_dir is None:
+            return sess.run(fetches, feed_dict=feed_dict)
+        self._num_runs += 1
+        if self._num_traces >= self._max_traces or (self._num_runs - 1) % self._trace_every != 0:
+            return sess.run(fetches, feed_dict=feed_dict)
+
+        from tensorflow.python.client import timeline
+        run_metadata = tf.RunMetadata()
+        result = sess.run(
+            fetches, feed_dict=feed_dict,
+            options=tf.RunOptions(trace_level=tf.RunOptions.FULL_TRACE),
+            run_metadata=run_metadata)
+        trace = timeline.Timeline(run_metadata.step_stats).generate_chrome_trace_format()
+        with open(os.path.join(self._trace_dir, "trace_{:05d}.json".format(self._num_runs)), "w") as f:
+            f.write(trace)
+        # Op type is the part of the timeline label before the inputs, eg "MatMul"
+        for device in run_metadata.step_stats.dev_stats:
+            for node in device.node_stats:
+                op = node.timeline_label.split("(")[0].split(" = ")[-1] or node.node_name
+                self._op_micros[op] = self._op_micros.get(op, 0) + node.all_end_rel_micros
+        self._num_traces += 1
+        with open(os.path.join(self._trace_dir, "op_summary.json"), "w") as f:
+            json.dump({
+                "traced_runs": self._num_traces,
+                "total_runs": self._num_runs,
+                "op_micros": dict(sorted(self._op_micros.items(), key=lambda kv: -kv[1])),
+            }, f, indent=2)
+        return result
+
+    def _session(self):
+        """
+        Session with the model's variables initialized. It is created on first use and
+        kept, so the weights are only loaded once rather than on every call.
+        """
+        if self._sess is None:
+            self._sess = tf.Session(graph=self._graph)
+            with self._graph.as_default():
+                initialize_uninitialized(self._sess)
+        return self._sess
+
+    def close(self):
+        """
+        Close the session and free the weights it holds. The next call opens a new one.
+        """
+        if self._sess is not None:
+            self._sess.close()
+            self._sess = None
+
+    def _endpoints(self):
+        """
+        The tensors the inference methods feed and fetch, by endpoint name.
+        States are flattened to lists.
+        """
+        endpoints = {
+            "batch_size": [self._batch_size_placeholder],
+            "minibatch_x": [self._minibatch_x_placeholder],
+            "minibatch_y": [self._minibatch_y_placeholder],
+            "seq_len": [self._seq_length_placeholder],
+            "temp": [self._temp_placeholder],
+            "initial_state": nest.flatten(self._initial_state_placeholder),
+            "final_state": nest.flatten(self._final_state),
+            "output": [self._output],
+            "top_final_hidden": [self._top_final_hidden],
+            "logits": [self._logits],
+            "last_logits": [self._last_logits],
+            "token_log_likelihood": [self._token_log_likelihood],
+            "loss": [self._loss],
+            "sample": [self._sample],
+        }
+        if self._cell_output is not None:
+            endpoints["cell_output"] = [self._cell_output]
+        return endpoints
+
+    def export_frozen(self, path):
+        """
+        Write the inference graph to path with the weights baked in as constants
+        (graph.pb), plus the tensor name of every endpoint (endpoints.json).
+        load_frozen then restores the babbler with a single graph import instead of
+        rebuilding it in python. Training ops (bucket_batch_pad etc.) are not exported.
+        """
+        endpoints = {name: [t.name for t in ts] for name, ts in self._endpoints().items()}
+        ops = sorted({name.split(":")[0] for names in endpoints.values() for name in names})
+        sess = self._session()
+        frozen = tf.graph_util.convert_variables_to_constants(
+            sess, self._graph.as_graph_def(), ops)
+        os.makedirs(path, exist_ok=True)
+        with open(os.path.join(path, FROZEN_GRAPH), "wb") as f:
+            f.write(frozen.SerializeToString())
+        with open(os.path.join(path, FROZEN_ENDPOINTS), "w") as f:
+            json.dump({
+                "model_size": self._rnn_size,
+                "num_layers": getattr(self, "_num_layers", None),
+                "precision": getattr(self, "_precision", "float32"),
+                "batch_size": self._batch_size,
+                "endpoints": endpoints,
+            }, f, indent=2)
+
+    def _bind_frozen(self, graph, meta, batch_size):
+        """
+        Set the attributes __init__ would have set from an imported frozen graph.
+        """
+        self._rnn_size = meta["model_size"]
+        self._vocab_size = 26
+        self._embed_dim = 10
+        self._wn = True
+        self._model_path = None
+        self._precision = meta["precision"]
+        self._batch_size = batch_size or meta["batch_size"]
+        if meta["num_layers"] is not None:
+            self._num_layers = meta["num_layers"]
+        endpoints = {name: [graph.get_tensor_by_name(t) for t in names]
+                     for name, names in meta["endpoints"].items()}
+        # States have the structure of the cell's: (c, h) for the 1900 model and
+        # (c_layers, h_layers) for the stacks
+        if meta["num_layers"] is None:
+            structure = (0, 0)
+        else:
+            structure = tuple(tuple(range(meta["num_layers"])) for _ in range(2))
+        self._batch_size_placeholder, = endpoints["batch_size"]
+        self._minibatch_x_placeholder, = endpoints["minibatch_x"]
+        self._minibatch_y_placeholder, = endpoints["minibatch_y"]
+        self._seq_length_placeholder, = endpoints["seq_len"]
+        self._temp_placeholder, = endpoints["temp"]
+        self._initial_state_placeholder = nest.pack_sequence_as(structure, endpoints["initial_state"])
+        self._final_state = nest.pack_sequence_as(structure, endpoints["final_state"])
+        self._output, = endpoints["output"]
+        self._cell_output, = endpoints.get("cell_output", [None])
+        self._top_final_hidden, = endpoints["top_final_hidden"]
+        self._logits, = endpoints["logits"]
+        self._last_logits, = endpoints["last_logits"]
+        self._token_log_likelihood, = endpoints["token_log_likelihood"]
+        self._loss, = endpoints["loss"]
+        self._sample, = endpoints["sample"]
+        zero = np.zeros((1, self._rnn_size), dtype=np.float32)
+        self._single_zero = nest.pack_sequence_as(structure, [zero] * len(nest.flatten(structure)))
+        self._zero_state = repeat_state(self._single_zero, self._batch_size)
+        self._graph = graph
+        self._sess = None
+        self._trace_dir = None
 
     def get_rep_ops(self):
         """
@@ -510,17 +975,37 @@ class babbler1900():
         return int_seq
 
 
-    def bucket_batch_pad(self,filepath, upper=2000, lower=50, interval=10):
+    def bucket_batch_pad(self,filepath, upper=2000, lower=50, interval=10, adaptive=False, max_buckets=32):
         """
         Read sequences from a filepath, batch them into buckets of similar lengths, and
         pad out to the longest sequence.
+        filepath is either a text file of comma seperated ints (see data_utils) or, to skip
+        string parsing every epoch, a token dataset written by data_utils.write_token_dataset.
         Upper, lower and interval define how the buckets are created.
         Any sequence shorter than lower will be grouped together, as with any greater
         than upper. Interval defines the "walls" of all the other buckets.
         WARNING: Define large intervals for small datasets because the default behavior
         is to repeat the same sequence to fill a batch. If there is only one sequence
         within a bucket, it will be repeated batch_size -1 times to fill the batch.
+        With adaptive=True (token datasets only) upper, lower and interval are ignored:
+        at most max_buckets bounds are chosen from the length histogram to minimize
+        padding, batches are never filled with repeated sequences, and the per-bucket
+        counts and padding ratio are kept in self._bucket_stats.
         """
+        if adaptive:
+            dataset, self._bucket_stats = adaptive_bucketbatchpad(
+                batch_size=self._batch_size,
+                path_to_data=filepath,
+                max_buckets=max_buckets,
+                repeat=None
+            )
+            self._bucket = self._bucket_stats['bounds']
+            print("Bucket bounds: {}".format(self._bucket))
+            print("Sequences per bucket: {}".format(self._bucket_stats['counts']))
+            print("Padding ratio: {:.3f}".format(self._bucket_stats['padding_ratio']))
+            self._bucket_batch = dataset.make_one_shot_iterator().get_next()
+            return self._bucket_batch
+
         self._bucket_upper = upper
         self._bucket_lower = lower
         self._bucket_interval = interval
@@ -574,6 +1059,16 @@ class babbler1900():
         else:
             return False
 
+    def format_seqs(self, seqs, stop=False, max_len=2000):
+        """
+        Batch counterpart of is_valid_seq and format_seq. Validates and formats all of
+        seqs in one vectorized pass.
+        Returns a boolean validity mask, a zero padded int32 [len(seqs), max length]
+        array in the codex of the babbler (invalid sequences are left as padding) and
+        the length of every row.
+        """
+        return encode_batch([seq.strip() for seq in seqs], max_len=max_len, stop=stop)
+
 class babbler256(babbler1900):
     """
     Tested get_rep and get_rep_ops, assumed rest was unaffected by subclassing.
@@ -581,8 +1076,16 @@ class babbler256(babbler1900):
 
     def __init__(self,
                  model_path="./256_weights/",
-                 batch_size=256
+                 batch_size=256,
+                 cell_states=False,
+                 precision="float32"
                  ):
+        """
+        Only float32 weights are supported, precision is there so callers can pass it
+        like to babbler1900.
+        """
+        check_full_precision(precision)
+        self._precision = precision
         self._rnn_size = 256
         self._vocab_size = 26
         self._embed_dim = 10
@@ -604,13 +1107,18 @@ class babbler256(babbler1900):
         # Lengths of the input sequence batch. Used to index into
         # The final_hidden output and select the stop codon -1
         # final hidden for the graph operation.
-        self._seq_length_placeholder = tf.placeholder(
-            tf.int32, shape=[None], name="seq_len")
+        # Defaults to the full padded length. Feeding it for a batch of mixed lengths
+        # also stops the rnn at the end of every sequence (outputs past it are zero).
+        self._seq_length_placeholder = tf.placeholder_with_default(
+            tf.fill([tf.shape(self._minibatch_x_placeholder)[0]],
+                    tf.shape(self._minibatch_x_placeholder)[1]),
+            shape=[None], name="seq_len")
         self._temp_placeholder = tf.placeholder(tf.float32, shape=[], name="temp")
         rnn = mLSTMCellStackNPY(num_units=self._rnn_size,
                             num_layers=self._num_layers,
                             model_path=model_path,
-                            wn=self._wn)
+                            wn=self._wn,
+                            emit_cell_state=cell_states)
         zero_state = rnn.zero_state(self._batch_size, tf.float32)
         single_zero = rnn.zero_state(1, tf.float32)
         mask = tf.sign(self._minibatch_y_placeholder)  # 1 for nonpad, zero for pad
@@ -624,13 +1132,21 @@ class babbler256(babbler1900):
             "embed_matrix", dtype=tf.float32, initializer=np.load(os.path.join(self._model_path, "embed_matrix:0.npy"))
         )
         embed_cell = tf.nn.embedding_lookup(embed_matrix, self._minibatch_x_placeholder)
-        self._output, self._final_state = tf.nn.dynamic_rnn(
+        outputs, self._final_state = tf.nn.dynamic_rnn(
             rnn,
             embed_cell,
             initial_state=self._initial_state_placeholder,
+            sequence_length=self._seq_length_placeholder,
             swap_memory=True,
             parallel_iterations=1
         )
+        # With cell_states the cell emits [hidden, cell] at every step
+        if cell_states:
+            self._output = outputs[:, :, :self._rnn_size]
+            self._cell_output = outputs[:, :, self._rnn_size:]
+        else:
+            self._output = outputs
+            self._cell_output = None
 
         # If we are training a model on top of the rep model, we need to access
         # the final_hidden rep from output. Recall we are padding these sequences
@@ -648,7 +1164,8 @@ class babbler256(babbler1900):
             weights_initializer=tf.constant_initializer(np.load(os.path.join(self._model_path, "fully_connected_weights:0.npy"))),
             biases_initializer=tf.constant_initializer(np.load(os.path.join(self._model_path, "fully_connected_biases:0.npy"))))
         self._logits = tf.reshape(
-            logits_flat, [batch_size, tf_get_shape(self._minibatch_x_placeholder)[1], self._vocab_size - 1])
+            logits_flat, tf_get_shape(self._minibatch_x_placeholder) + [self._vocab_size - 1])
+        self._last_logits = last_position_logits(self._top_final_hidden, logits_flat)
         batch_losses = tf.contrib.seq2seq.sequence_loss(
             self._logits,
             tf.cast(pad_adjusted_targets, tf.int32),
@@ -656,10 +1173,17 @@ class babbler256(babbler1900):
             average_across_batch=False
         )
         self._loss = tf.reduce_mean(batch_losses)
+        # Log-likelihood of every target token, zero at padding
+        self._token_log_likelihood = -tf.nn.sparse_softmax_cross_entropy_with_logits(
+            labels=tf.cast(pad_adjusted_targets, tf.int32), logits=self._logits
+        ) * tf.cast(mask, tf.float32)
         self._sample = sample_with_temp(self._logits, self._temp_placeholder)
         with tf.Session() as sess:
             self._zero_state = sess.run(zero_state)
             self._single_zero = sess.run(single_zero)
+        self._graph = tf.get_default_graph()
+        self._sess = None
+        self._trace_dir = None
 
     def get_rep(self,seq):
         """
@@ -670,18 +1194,16 @@ class babbler256(babbler1900):
         Unfortunately, this method accepts one sequence at a time and is as such quite
         slow.
         """
-        with tf.Session() as sess:
-            initialize_uninitialized(sess)
-            # Strip any whitespace and convert to integers with the correct coding
-            int_seq = aa_seq_to_int(seq.strip())[:-1]
-            # Final state is a cell_state, hidden_state tuple. Output is
-            # all hidden states
-            final_state_, hs = sess.run(
-                [self._final_state, self._output], feed_dict={
-                    self._batch_size_placeholder: 1,
-                    self._minibatch_x_placeholder: [int_seq],
-                    self._initial_state_placeholder: self._zero_state}
-            )
+        # Strip any whitespace and convert to integers with the correct coding
+        int_seq = aa_seq_to_int(seq.strip())[:-1]
+        # Final state is a cell_state, hidden_state tuple. Output is
+        # all hidden states
+        final_state_, hs = self._run(
+            [self._final_state, self._output], feed_dict={
+                self._batch_size_placeholder: 1,
+                self._minibatch_x_placeholder: [int_seq],
+                self._initial_state_placeholder: self._single_zero}
+        )
 
         final_cell, final_hidden = final_state_
         # Because this is a deep model, each of final hidden and final cell is tuple of num_layers
@@ -699,8 +1221,15 @@ class babbler64(babbler256):
 
     def __init__(self,
                  model_path="./64_weights/",
-                 batch_size=256
+                 batch_size=256,
+                 cell_states=False,
+                 precision="float32"
                  ):
+        """
+        Only float32 weights are supported, see babbler256.
+        """
+        check_full_precision(precision)
+        self._precision = precision
         self._rnn_size = 64
         self._vocab_size = 26
         self._embed_dim = 10
@@ -722,13 +1251,18 @@ class babbler64(babbler256):
         # Lengths of the input sequence batch. Used to index into
         # The final_hidden output and select the stop codon -1
         # final hidden for the graph operation.
-        self._seq_length_placeholder = tf.placeholder(
-            tf.int32, shape=[None], name="seq_len")
+        # Defaults to the full padded length. Feeding it for a batch of mixed lengths
+        # also stops the rnn at the end of every sequence (outputs past it are zero).
+        self._seq_length_placeholder = tf.placeholder_with_default(
+            tf.fill([tf.shape(self._minibatch_x_placeholder)[0]],
+                    tf.shape(self._minibatch_x_placeholder)[1]),
+            shape=[None], name="seq_len")
         self._temp_placeholder = tf.placeholder(tf.float32, shape=[], name="temp")
         rnn = mLSTMCellStackNPY(num_units=self._rnn_size,
                             num_layers=self._num_layers,
                             model_path=model_path,
-                            wn=self._wn)
+                            wn=self._wn,
+                            emit_cell_state=cell_states)
         zero_state = rnn.zero_state(self._batch_size, tf.float32)
         single_zero = rnn.zero_state(1, tf.float32)
         mask = tf.sign(self._minibatch_y_placeholder)  # 1 for nonpad, zero for pad
@@ -742,13 +1276,21 @@ class babbler64(babbler256):
             "embed_matrix", dtype=tf.float32, initializer=np.load(os.path.join(self._model_path, "embed_matrix:0.npy"))
         )
         embed_cell = tf.nn.embedding_lookup(embed_matrix, self._minibatch_x_placeholder)
-        self._output, self._final_state = tf.nn.dynamic_rnn(
+        outputs, self._final_state = tf.nn.dynamic_rnn(
             rnn,
             embed_cell,
             initial_state=self._initial_state_placeholder,
+            sequence_length=self._seq_length_placeholder,
             swap_memory=True,
             parallel_iterations=1
         )
+        # With cell_states the cell emits [hidden, cell] at every step
+        if cell_states:
+            self._output = outputs[:, :, :self._rnn_size]
+            self._cell_output = outputs[:, :, self._rnn_size:]
+        else:
+            self._output = outputs
+            self._cell_output = None
 
         # If we are training a model on top of the rep model, we need to access
         # the final_hidden rep from output. Recall we are padding these sequences
@@ -766,7 +1308,8 @@ class babbler64(babbler256):
             weights_initializer=tf.constant_initializer(np.load(os.path.join(self._model_path, "fully_connected_weights:0.npy"))),
             biases_initializer=tf.constant_initializer(np.load(os.path.join(self._model_path, "fully_connected_biases:0.npy"))))
         self._logits = tf.reshape(
-            logits_flat, [batch_size, tf_get_shape(self._minibatch_x_placeholder)[1], self._vocab_size - 1])
+            logits_flat, tf_get_shape(self._minibatch_x_placeholder) + [self._vocab_size - 1])
+        self._last_logits = last_position_logits(self._top_final_hidden, logits_flat)
         batch_losses = tf.contrib.seq2seq.sequence_loss(
             self._logits,
             tf.cast(pad_adjusted_targets, tf.int32),
@@ -774,7 +1317,41 @@ class babbler64(babbler256):
             average_across_batch=False
         )
         self._loss = tf.reduce_mean(batch_losses)
+        # Log-likelihood of every target token, zero at padding
+        self._token_log_likelihood = -tf.nn.sparse_softmax_cross_entropy_with_logits(
+            labels=tf.cast(pad_adjusted_targets, tf.int32), logits=self._logits
+        ) * tf.cast(mask, tf.float32)
         self._sample = sample_with_temp(self._logits, self._temp_placeholder)
         with tf.Session() as sess:
             self._zero_state = sess.run(zero_state)
             self._single_zero = sess.run(single_zero)
+        self._graph = tf.get_default_graph()
+        self._sess = None
+        self._trace_dir = None
+
+
+def frozen_dir(model_path, precision="float32", cell_states=False):
+    """
+    Where export_graph.py puts the frozen graph of the weights in model_path.
+    """
+    name = "frozen_{}{}_v{}".format(precision, "_cells" if cell_states else "", FROZEN_VERSION)
+    return os.path.join(model_path, name)
+
+
+def load_frozen(path, batch_size=None):
+    """
+    Babbler of the right size restored from a graph written by export_frozen, in its
+    own graph. Every inference method works as on a freshly built babbler.
+    """
+    with open(os.path.join(path, FROZEN_ENDPOINTS), "r") as f:
+        meta = json.load(f)
+    graph_def = tf.GraphDef()
+    with open(os.path.join(path, FROZEN_GRAPH), "rb") as f:
+        graph_def.ParseFromString(f.read())
+    graph = tf.Graph()
+    with graph.as_default():
+        tf.import_graph_def(graph_def, name="")
+    babblers = {64: babbler64, 256: babbler256, 1900: babbler1900}
+    b = babblers[meta["model_size"]].__new__(babblers[meta["model_size"]])
+    b._bind_frozen(graph, meta, batch_size)
+    return b
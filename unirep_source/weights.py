@@ -0,0 +1,87 @@
+"""
+Conversion of jax-unirep params to the npy weight directories the TF babblers load.
+
+Only numpy is needed, so the workflow can convert uploaded or evotuned params without
+the unirep env. The params files the workflow writes (see save_params) are dicts
+tagged with PARAMS_FORMAT, anything else is taken to be a bare params list as written
+by jax_unirep.utils.dump_params.
+"""
+import os
+import pickle
+from pathlib import Path
+from tempfile import mkdtemp
+
+import numpy as np
+
+PARAMS_FILE = "model_weights.pkl"
+PARAMS_FORMAT = "unirep_latch.params.v1"
+
+
+def save_params(directory, params, **info):
+    """
+    Write params to {directory}/model_weights.pkl as {"format": PARAMS_FORMAT,
+    "params": params, **info}, e.g. with the step and holdout loss they came from.
+    The file is replaced atomically. Returns its path.
+    """
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    path = directory / PARAMS_FILE
+    tmp_path = path.with_suffix(".tmp")
+    with open(tmp_path, "wb") as f:
+        pickle.dump(dict(info, format=PARAMS_FORMAT, params=params), f)
+    os.replace(tmp_path, path)
+    return path
+
+
+def unwrap_params(loaded):
+    """
+    The params of an unpickled params file: the "params" of a file written by
+    save_params, anything else as it is.
+    """
+    if isinstance(loaded, dict) and loaded.get("format") == PARAMS_FORMAT:
+        return loaded["params"]
+    return loaded
+
+
+def pkl_to_model(pkl_path):
+    # Unpickle model
+    with open(pkl_path, "rb") as f:
+        model = unwrap_params(pickle.load(f))
+    return params_to_model(model)
+
+
+def params_to_model(model):
+    """
+    Write jax-unirep params (as loaded from a model_weights.pkl, or straight from
+    evotuning) to the npy files the TF babblers load, in a new temporary
+    {model_size}_weights directory. Returns its path.
+    """
+    # Get the true model size from fully_connected_weights
+    model_size = model[-2][0].shape[0]
+
+    root = Path(mkdtemp())
+    model_path = root / f"{model_size}_weights"
+    os.mkdir(model_path)
+
+    # Save embed matrix, fully connected biases, weights
+    # Embed matrix is always model[0], fcb, fcw are model[-2][1] and model[-2][0] respectively
+    np.save(model_path / "embed_matrix:0.npy", np.asarray(model[0]))
+    np.save(model_path / "fully_connected_biases:0.npy", np.asarray(model[-2][1]))
+    np.save(model_path / "fully_connected_weights:0.npy", np.asarray(model[-2][0]))
+
+    params = ["wx", "wh", "wmx", "wmh", "b", "gx", "gh", "gmx", "gmh"]
+    if int(model_size) in [64, 256]:
+        # # will be replaced by the stack number, and N will be replaced by the parameter name
+        file_skeleton = "rnn_mlstm_stack_mlstm_stack#_mlstm_stack#_N:0.npy"
+        for n, label in [(1, 0), (3, 1), (5, 2), (7, 3)]:
+            for p in params:
+                file_name = model_path / file_skeleton.replace(
+                    "#", str(label)
+                ).replace("N", p)
+                np.save(file_name, np.asarray(model[n][p]))
+    else:
+        file_skeleton = "rnn_mlstm_mlstm_N:0.npy"
+        for p in params:
+            file_name = model_path / file_skeleton.replace("N", p)
+            np.save(file_name, np.asarray(model[1][p]))
+    return model_path
@@ -2,15 +2,17 @@
 from enum import Enum
 from pathlib import Path
 import os
-from Bio import SeqIO
-import jax_unirep
+import sys
+
 import numpy as np
 from datetime import date
+from itertools import islice
 import subprocess
 import hashlib
 import pickle as pkl
-import shutil
 import time
+import json
+import csv
 
 from latch import (
     large_task,
@@ -20,10 +22,20 @@ from latch import (
     workflow,
     create_conditional_section,
 )
+from flytekit import workflow as flyte_workflow
 from latch.types import LatchDir, LatchFile
 from latch.resources.launch_plan import LaunchPlan
 from latch.functions.messages import message
-from typing import Optional, List, Union, Tuple
+from typing import Iterable, Optional, List, Union, Tuple
+
+from wf.fasta import file_stem, format_suffix, is_fasta, open_text, read_fasta
+from unirep_source.metrics import (
+    METRICS_FILE,
+    SCRIPT_METRICS_FILE,
+    StageTimer,
+    format_summary,
+    load_metrics,
+)
 
 # Allow extended amino acids: https://en.wikipedia.org/wiki/FASTA_format#Sequence_representation
 aas = [
@@ -57,12 +69,53 @@ aas = [
     "-",
 ]
 
+# Byte lookup table for the characters in aas, in either case
+aa_lookup = np.zeros(256, dtype=bool)
+for aa in aas:
+    aa_lookup[ord(aa)] = aa_lookup[ord(aa.lower())] = True
+
+
+def invalid_seqs(seqs: List[str]) -> List[str]:
+    """
+    Return the sequences in seqs that contain characters outside of aas. The whole batch
+    is checked with a single numpy lookup over the concatenated sequences.
+    """
+    lengths = np.array([len(seq) for seq in seqs], dtype=np.int64)
+    offsets = np.concatenate([[0], np.cumsum(lengths)])
+    codes = np.frombuffer("".join(seqs).encode("ascii", "replace"), dtype=np.uint8)
+    invalid_cumsum = np.concatenate([[0], np.cumsum(~aa_lookup[codes])])
+    n_invalid = invalid_cumsum[offsets[1:]] - invalid_cumsum[offsets[:-1]]
+    return [seq for seq, n in zip(seqs, n_invalid) if n > 0]
+
+
+# Model runs between two traced ones when profiling is on
+PROFILE_EVERY = 50
+
+
+# CPUs requested by evotune_task, which exposes one XLA host device per CPU so the
+# training step can be split across all of them (see use_host_devices)
+EVOTUNE_CPUS = 8
+
+
+def use_host_devices(n: int):
+    """
+    Make XLA expose n host devices in this process. XLA reads the flag when jax sets
+    up its backend, so this has to run before jax is imported; only evotune_task calls
+    it, every other task (and anything importing wf) keeps the default single device.
+    """
+    if "jax" in sys.modules:
+        print("jax is already imported, XLA keeps its host devices")
+    flags = os.environ.get("XLA_FLAGS", "")
+    if "xla_force_host_platform_device_count" not in flags:
+        os.environ["XLA_FLAGS"] = f"{flags} --xla_force_host_platform_device_count={n}".strip()
+
 
 class Application(Enum):
     protein_rep = "UniRep/UniRep Fusion"
     babble = "Babble"
     evotune = "Evotune"
-    # variant_prediction = "Variant Fitness Prediction"
+    score = "Log-Likelihood Scoring"
+    variant_prediction = "Variant Fitness Prediction"
 
 
 class ModelSize(Enum):
@@ -71,35 +124,61 @@ class ModelSize(Enum):
     large = "1900"
 
 
+class Precision(Enum):
+    # Reduced precision inference, only supported by the 1900 model
+    float32 = "float32"
+    float16 = "float16"
+    int8 = "int8"
+
+
+class SamplingStrategy(Enum):
+    # How babble picks the next amino acid, see unirep_source/sampling.py
+    temperature = "temperature"
+    top_k = "top_k"
+    top_p = "top_p"
+
+
+class EvotuneOutput(Enum):
+    # What evotune_task runs with the evotuned params once training is done
+    none = "None"
+    protein_rep = "UniRep/UniRep Fusion"
+    babble = "Babble"
+
+
+class ResidueStates(Enum):
+    # Which per-residue states rep_task streams to {run_name}/residue_states/
+    none = "none"
+    hidden = "hidden"
+    hidden_and_cell = "hidden_and_cell"
+
+
 @small_task
 def check_enum(
     application: Application,
-) -> Tuple[bool, bool, bool]:
+) -> Tuple[bool, bool, bool, bool, bool]:
     return tuple([application == a for a in Application])
 
 
-@small_task
-def get_seqs_from_inputs(
+def iter_seqs_from_inputs(
     sequence: Optional[List[Union[str, LatchFile, LatchDir]]],
-) -> List[List[str]]:
+):
     """
-    Return a list of tuple (sequence, sequence_name) from the assorted str/LatchFile inputs.
+    Yield [sequence, sequence_name] pairs from the assorted str/LatchFile inputs one at a
+    time, so fasta and txt files are never fully loaded. Files can be gzip or bgzip
+    compressed, large fasta files are parsed in parallel (see wf/fasta.py).
     If the input is just a string then it is assigned a truncated hash of its contents.
+    The string inputs are validated before anything is yielded.
     """
     seqs = []
     latchfile_paths = []
     if sequence is None:
-        return []
+        return
     # for seq in sequence, print string if str or print local_path if latchfile
     for seq in sequence:
         try:
             if isinstance(seq, str):
                 print("found a string input")
-                # Make sure the sequence is valid
-                if not set(seq.upper()).issubset(set(aas)):
-                    raise ValueError(f"Invalid sequence: {seq}")
-
-                # Give unnamed sequence a hash
+                # Give unnamed sequence a hash (validated below, all at once)
                 seq_name = hashlib.sha256(seq.encode("utf-8")).hexdigest()[:10]
                 seqs.append([seq, seq_name])
 
@@ -110,64 +189,443 @@ def get_seqs_from_inputs(
             elif isinstance(seq, LatchDir):
                 print("found a LatchDir input")
                 local_path = Path(seq).resolve()
-                fasta_files = [
-                    f.resolve() for f in local_path.iterdir() if f.suffix == ".fasta"
-                ]
+                fasta_files = [f.resolve() for f in local_path.iterdir() if is_fasta(f)]
                 latchfile_paths.extend(fasta_files)
         except Exception as e:
             print(e)
             raise e
 
+    # Make sure the string sequences are valid
+    invalid = invalid_seqs([seq for seq, _ in seqs])
+    if len(invalid) > 0:
+        raise ValueError(f"Invalid sequence: {invalid[0]}")
+    yield from seqs
+
     print(f"unrolling {len(latchfile_paths)} latchfiles")
     for latchfile_path in latchfile_paths:
-        output_filename = latchfile_path.stem
+        output_filename = file_stem(latchfile_path)
 
-        # Fasta file
-        if latchfile_path.suffix == ".fasta":
-            for record in SeqIO.parse(latchfile_path, "fasta"):
-                seqs.append([str(record.seq), output_filename + "_" + str(record.id)])
+        # Fasta file (.fasta, .fa or .faa, optionally gzip/bgzip compressed)
+        if is_fasta(latchfile_path):
+            for record_id, seq in read_fasta(latchfile_path):
+                yield [seq, output_filename + "_" + record_id]
 
         # Text file
-        elif latchfile_path.suffix == ".txt":
-            with open(latchfile_path, "r") as f:
+        elif format_suffix(latchfile_path) == ".txt":
+            with open_text(latchfile_path) as f:
                 for line in f:
                     seq = line.strip()
                     seq_name = hashlib.sha256(seq.encode("utf-8")).hexdigest()[:10]
-                    seqs.append([seq, output_filename + "_" + seq_name])
+                    yield [seq, output_filename + "_" + seq_name]
 
         # CSV file
-    return seqs
 
 
 @small_task
-def get_holdouts(
+def get_seqs_from_inputs(
     sequence: Optional[List[Union[str, LatchFile, LatchDir]]],
-) -> Optional[List[str]]:
+    application: Optional[Application] = None,
+) -> List[List[str]]:
     """
-    A wrapper around get_seqs_from_inputs to account for holdout sequences being optional,
-    and working with Type.Optional.
-    If no sequences are returned, return None rather than an empty list.
+    Return a list of tuple (sequence, sequence_name) from the assorted str/LatchFile inputs.
+    If the input is just a string then it is assigned a truncated hash of its contents.
+    Evotuning streams its inputs to disk itself (see inputs_to_token_dataset), so for
+    application evotune nothing is returned and no sequences go through the task outputs.
+    """
+    if application == Application.evotune:
+        return []
+    return list(iter_seqs_from_inputs(sequence))
+
 
-    # [TODO] Figure out how to get beneath the @task wrappers to test tasks. Since
-    # get_holdout calls get_seqs_from_inputs, for now I just made it call the underlying
-    # function directly. This might also be better so it doesn't spin up a new node for such
-    # a small function.
+def inputs_to_token_dataset(
+    sequence: Optional[List[Union[str, LatchFile, LatchDir]]], path: Path
+) -> List[str]:
     """
-    if sequence is not None:
-        seqs = get_seqs_from_inputs.__wrapped__(sequence=sequence)
-        if len(seqs) > 0:
-            return seqs
-    return None
+    Stream the sequences of the inputs into the token dataset at path (see
+    unirep_source.data_utils.write_token_dataset) and return their names. Only the names
+    are kept in memory. Gaps and stop codons are dropped and residues upper cased, which
+    is what the evotuning models see.
+    """
+    from unirep_source.data_utils import write_token_dataset
 
+    names = []
 
-@custom_task(8, 32)
+    def residues():
+        for seq, name in iter_seqs_from_inputs(sequence):
+            names.append(name)
+            yield seq.upper().replace("-", "").replace("*", "")
+
+    write_token_dataset(residues(), str(path))
+    return names
+
+
+def sync_to_remote(local_path: Path, remote_path: str):
+    """
+    Upload a local directory to latch in the middle of a task, so it survives the node
+    being preempted. Failures are reported but never interrupt the task.
+    """
+    from flytekit.core.context_manager import FlyteContextManager
+
+    try:
+        ctx = FlyteContextManager.current_context()
+        ctx.file_access.put_data(str(local_path), remote_path, is_multipart=True)
+    except Exception as e:
+        print(f"Could not sync {local_path} to {remote_path}: {e}")
+
+
+def sync_from_remote(remote_path: str, local_path: Path) -> bool:
+    """
+    Download a directory from latch if it exists. Returns True on success.
+    """
+    from flytekit.core.context_manager import FlyteContextManager
+
+    try:
+        ctx = FlyteContextManager.current_context()
+        ctx.file_access.get_data(remote_path, str(local_path), is_multipart=True)
+        return True
+    except Exception:
+        return False
+
+
+def script_env(profile: bool) -> dict:
+    """
+    Environment for the conda scripts. With profile, every PROFILE_EVERY-th model run
+    is traced to {run_name}/traces/.
+    """
+    env = dict(os.environ)
+    if profile:
+        env["UNIREP_TRACE_EVERY"] = str(PROFILE_EVERY)
+    return env
+
+
+def report_metrics(timer: StageTimer, local_dir: Path, title: str):
+    """
+    Merge the metrics written by the conda script (if any) into the task's, write them
+    to {local_dir}/metrics.json and summarize them in the task's messages. The part of
+    the "script" stage the script did not time itself is conda run and interpreter
+    startup.
+    """
+    script_metrics_path = Path(local_dir) / SCRIPT_METRICS_FILE
+    script = load_metrics(script_metrics_path)
+    if script is not None:
+        script_stages = [r for r in timer.stages if r["name"] == "script"]
+        if len(script_stages) > 0:
+            startup = script_stages[-1]["wall_s"] - script["wall_s"]
+            timer.add("conda_run_startup", max(startup, 0.0))
+        script_metrics_path.unlink()
+    summary = timer.summary()
+    summary["script"] = script
+    with open(Path(local_dir) / METRICS_FILE, "w") as f:
+        json.dump(summary, f, indent=2)
+    body = format_summary(summary)
+    if script is not None:
+        body += "\n\nInside the script:\n" + format_summary(script)
+    message(typ="info", data={"title": f"{title}: Timings", "body": body})
+
+
+# Unix socket of a running inference daemon (scripts/serve.py). rep, babble and score
+# use it when it is there and otherwise start their own worker (scripts/worker.py).
+UNIREP_SOCKET = os.environ.get("UNIREP_SOCKET", "/tmp/unirep.sock")
+# Sequences per request to the daemon or worker. Outputs are written as each batch
+# comes back, so memory does not grow with the library.
+INFERENCE_BATCH = 1000
+
+
+def send_request(
+    stream,
+    op: str,
+    model_size: ModelSize,
+    model_path: str,
+    precision: Precision,
+    seqs: List[str],
+    params: dict,
+) -> Tuple[dict, dict]:
+    """
+    Send one framing request to a daemon or worker on stream and return its response
+    (header, arrays). A failed request has header["ok"] False and header["error"].
+    """
+    from unirep_source.framing import pack_strings, read_message, write_message
+
+    data, lengths = pack_strings(seqs)
+    header = {
+        "op": op,
+        "model_size": int(model_size.value),
+        "model_path": str(model_path),
+        "precision": precision.value,
+        "params": params,
+    }
+    write_message(stream, header, {"seqs": data, "seq_lengths": lengths})
+    response = read_message(stream)
+    if response is None:
+        raise RuntimeError("The inference process closed the connection.")
+    return response
+
+
+def connect_server():
+    """
+    Socket connected to the inference daemon, or None if none is listening.
+    """
+    import socket
+
+    if not os.path.exists(UNIREP_SOCKET):
+        return None
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(UNIREP_SOCKET)
+    except OSError:
+        sock.close()
+        return None
+    return sock
+
+
+class OutputWriter:
+    """
+    Writes the files of the rep, babble and score applications from the result arrays
+    of successive batches.
+    """
+
+    def __init__(self, op: str, local_dir: str, params: dict):
+        from unirep_source import outputs
+
+        self.outputs = outputs
+        self.op = op
+        self.local_dir = local_dir
+        self.params = params
+        self.store = None
+        self.scores = None
+        if op == "score":
+            self.store = outputs.position_store(local_dir)
+            self.scores = open(Path(local_dir) / "scores.csv", "w")
+            self.scores.write(outputs.SCORES_HEADER)
+
+    def write(self, seqs_and_names: List[List[str]], header: dict, arrays: dict):
+        from unirep_source.framing import split_ragged
+
+        outputs = self.outputs
+        residue = {
+            name: split_ragged(arrays[name], arrays["lengths"])
+            for name in header["residue_arrays"]
+        }
+        valid = arrays["valid"]
+        if self.op == "rep":
+            if self.store is None and len(residue) > 0:
+                self.store = outputs.residue_state_store(
+                    self.local_dir, list(residue), arrays["reps"].shape[-1]
+                )
+            for i, ((seq, name), is_valid) in enumerate(zip(seqs_and_names, valid)):
+                if not is_valid:
+                    continue
+                outputs.write_rep(self.local_dir, name, *arrays["reps"][i])
+                if self.store is not None:
+                    self.store.append(name, **{kind: residue[kind][i] for kind in residue})
+        elif self.op == "babble":
+            outputs.write_babbles(
+                self.local_dir,
+                self.params["length"],
+                [
+                    [seq, name, [b.decode("ascii") for b in babbles]]
+                    for (seq, name), babbles in zip(seqs_and_names, arrays["babbles"])
+                ],
+            )
+        elif self.op == "score":
+            for i, ((seq, name), is_valid) in enumerate(zip(seqs_and_names, valid)):
+                ll = residue["position_log_likelihood"][i] if is_valid else None
+                self.scores.write(outputs.score_row(name, seq, ll))
+                if is_valid:
+                    self.store.append(name, log_likelihood=ll[:, None])
+                    if "substitutions" in residue:
+                        outputs.write_substitutions(
+                            self.local_dir, name, seq, residue["substitutions"][i]
+                        )
+
+    def close(self):
+        if self.store is not None:
+            self.store.close()
+        if self.scores is not None:
+            self.scores.close()
+
+
+class WorkerStream:
+    """
+    The worker's stdin and stdout as one binary stream for framing.
+    """
+
+    def __init__(self, process: subprocess.Popen):
+        self.process = process
+
+    def write(self, data: bytes):
+        self.process.stdin.write(data)
+
+    def flush(self):
+        self.process.stdin.flush()
+
+    def read(self, n: int) -> bytes:
+        return self.process.stdout.read(n)
+
+    def close(self):
+        self.process.stdin.close()
+
+
+def run_inference(
+    op: str,
+    seqs_and_names: Iterable[List[str]],
+    model_size: ModelSize,
+    model_path: str,
+    precision: Precision,
+    params: dict,
+    local_dir: str,
+    timer: StageTimer,
+    profile: bool = False,
+    batch_size: int = 256,
+    writer=None,
+):
+    """
+    Run op on seqs_and_names in the inference daemon if there is one, otherwise in a
+    worker started in the unirep env (batch_size caps the rows of its batches there).
+    seqs_and_names is read a batch of INFERENCE_BATCH pairs at a time, so it can be a
+    generator like iter_seqs_from_inputs. The batches are sent over a binary stream and the
+    outputs written to local_dir as the results come back, or handed to writer (an
+    object with OutputWriter's write and close) instead.
+    """
+    if precision != Precision.float32 and model_size != ModelSize.large:
+        raise ValueError(
+            f"Only the {ModelSize.large.value} model supports {precision.value} weights."
+        )
+    if writer is None:
+        writer = OutputWriter(op, local_dir, params)
+    sock = connect_server()
+    worker = None
+    if sock is not None:
+        stream = sock.makefile("rwb")
+        stage = "server"
+    else:
+        # --no-capture-output so stdin and stdout are passed straight through
+        worker = subprocess.Popen(
+            [
+                "conda",
+                "run",
+                "--no-capture-output",
+                "-n",
+                "unirep",
+                "scripts/worker.py",
+                local_dir,
+                str(batch_size),
+            ],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            env=script_env(profile),
+        )
+        stream = WorkerStream(worker)
+        stage = "script"
+    try:
+        with timer.stage(stage):
+            pairs = iter(seqs_and_names)
+            for batch in iter(lambda: list(islice(pairs, INFERENCE_BATCH)), []):
+                with timer.stage("batch", residues=sum(len(seq) for seq, _ in batch)):
+                    response = send_request(
+                        stream,
+                        op,
+                        model_size,
+                        model_path,
+                        precision,
+                        [seq for seq, _ in batch],
+                        params,
+                    )
+                if not response[0]["ok"]:
+                    if worker is None:
+                        raise RuntimeError(f"Inference failed: {response[0]['error']}")
+                    # The worker exits after a failed request, like the scripts did
+                    stream.close()
+                    raise subprocess.CalledProcessError(
+                        worker.wait(), worker.args, output=response[0]["error"]
+                    )
+                with timer.stage("write_outputs"):
+                    writer.write(batch, *response)
+            stream.close()
+            if worker is not None and worker.wait() != 0:
+                raise subprocess.CalledProcessError(worker.returncode, worker.args)
+    finally:
+        writer.close()
+        if sock is not None:
+            sock.close()
+        if worker is not None and worker.poll() is None:
+            worker.kill()
+
+
+def babble_params(
+    length: Optional[int],
+    temp: Optional[float],
+    sampling: SamplingStrategy,
+    top_k: int,
+    top_p: float,
+    num_samples: int,
+) -> dict:
+    """
+    Request params of the babble op for the workflow's babble inputs.
+    """
+    return {
+        "length": length,
+        "temp": temp,
+        "top_k": top_k if sampling == SamplingStrategy.top_k else 0,
+        "top_p": top_p if sampling == SamplingStrategy.top_p else 1.0,
+        "num_samples": num_samples,
+    }
+
+
+@custom_task(EVOTUNE_CPUS, 32)
 def evotune_task(
-    seqs_and_names: List[List[str]],
+    sequence: Optional[List[Union[str, LatchFile, LatchDir]]],
     model_size: ModelSize,
     model_params: Optional[LatchFile],
     run_name: str,
-    holdouts: Optional[List[str]],
+    holdout: Optional[List[Union[str, LatchFile, LatchDir]]],
+    epochs: int = 20,
+    cluster_identity: float = 1.0,
+    weight_clusters: bool = True,
+    then: EvotuneOutput = EvotuneOutput.none,
+    precision: Precision = Precision.float32,
+    residue_states: ResidueStates = ResidueStates.none,
+    length: Optional[int] = 250,
+    temp: Optional[float] = 1.0,
+    sampling: SamplingStrategy = SamplingStrategy.temperature,
+    top_k: int = 10,
+    top_p: float = 0.9,
+    num_samples: int = 1,
+    profile: bool = False,
 ) -> LatchDir:
+    """
+    The input sequences are first clustered at cluster_identity (see wf/dedup.py) and
+    only one representative per cluster is trained on, weighted by its cluster size if
+    weight_clusters. The default of 1.0 only drops (near) exact duplicates.
+    Params, optimizer state and the position in the data order are checkpointed to
+    latch:///unirep/{run_name}/checkpoints/ while training. Rerunning with the same
+    run_name resumes from the latest checkpoint, and the best params on the holdout
+    set so far are kept in latch:///unirep/{run_name}/best/.
+    Each batch is split across EVOTUNE_CPUS XLA host devices with the gradients
+    all-reduced, so an epoch takes roughly 1/EVOTUNE_CPUS of the single device time.
+    The sequence and holdout inputs are read here and streamed to token datasets on
+    local disk, and training reads its batches from there, so neither the sequences nor
+    their one-hot encodings are ever all held in memory.
+    With then set to rep or babble, the input sequences are then embedded or babbled
+    with the evotuned params in this same task, as rep_task or babble_task would with
+    the dumped params as model_params. The params are handed to the model straight
+    from memory, the remaining inputs are those of rep_task and babble_task.
+    """
+    # Before anything below imports jax
+    use_host_devices(EVOTUNE_CPUS)
+    from jax_unirep.utils import load_params
+    from unirep_source.weights import params_to_model, save_params, unwrap_params
+    from wf.dedup import cluster_sequences, cluster_weights, representatives
+    from wf.evotuning import (
+        BEST_DIR,
+        CHECKPOINT_DIR,
+        TokenSequences,
+        compile_cache_dir,
+        enable_compile_cache,
+        fit,
+        to_host,
+    )
+
     message(
         typ="info",
         data={
@@ -176,42 +634,151 @@ def evotune_task(
         },
     )
     # Parameters
-    local_dir = Path("/root/outputs/")
-    local_dir.mkdir(exist_ok=True)
-    local_dir = str(local_dir)
+    local_dir = Path(f"/root/outputs/{run_name}/")
+    local_dir.mkdir(exist_ok=True, parents=True)
     remote_dir = "latch:///unirep/" + run_name + "/"
+    timer = StageTimer()
 
     mlstm_size = int(model_size.value)
-    if model_size == 64:
+    if mlstm_size == 64:
         from jax_unirep.evotuning_models import mlstm64 as mlstm
-    elif model_size == 256:
+    elif mlstm_size == 256:
         from jax_unirep.evotuning_models import mlstm256 as mlstm
-    elif model_size == 1900:
+    elif mlstm_size == 1900:
         from jax_unirep.evotuning_models import mlstm1900 as mlstm
     else:
         raise ValueError(f"Invalid model size: {mlstm_size}")
 
     # Get parameters
     init_func, model_func = mlstm()
-    if model_params is not None:
-        with open(model_params.local_path, "rb") as f:
-            params = pkl.load(f)
-    else:
-        params = jax_unirep.utils.load_params(paper_weights=mlstm_size)
+    with timer.stage("load_params"):
+        if model_params is not None:
+            with open(model_params.local_path, "rb") as f:
+                params = unwrap_params(pkl.load(f))
+        else:
+            params = load_params(paper_weights=mlstm_size)[1]
 
-    params = params[1]
-    # Evotuning
-    _, evotuned_params = jax_unirep.evotune(
-        sequences=[s[0] for s in seqs_and_names],
-        model_func=model_func,
-        params=params,
-        n_splits=min(len(seqs_and_names), 5),
-        out_dom_seqs=holdouts,
+    # Stream the inputs to disk, outside of local_dir so they are not uploaded
+    data_dir = Path(f"/root/evotune_data/{run_name}/")
+    data_dir.mkdir(exist_ok=True, parents=True)
+    with timer.stage("read_inputs") as record:
+        names = inputs_to_token_dataset(sequence, data_dir / "train.tokens")
+        seqs = TokenSequences(str(data_dir / "train.tokens"))
+        holdout_seqs = None
+        if holdout is not None:
+            inputs_to_token_dataset(holdout, data_dir / "holdout.tokens")
+            holdout_seqs = TokenSequences(str(data_dir / "holdout.tokens"))
+        lengths = seqs.lengths
+        record["n_sequences"] = len(seqs)
+        record["residues"] = int(lengths.sum())
+
+    # Train on one representative per cluster of near duplicates
+    with timer.stage("cluster", residues=int(lengths.sum())) as record:
+        assignment = cluster_sequences(seqs, identity=cluster_identity)
+        reps, sizes = representatives(assignment)
+        record["n_sequences"] = len(seqs)
+        record["n_representatives"] = len(reps)
+    with open(local_dir / "clusters.csv", "w", newline="") as f:
+        writer = csv.writer(f, lineterminator="\n")
+        writer.writerow(["name", "representative", "cluster_size"])
+        cluster_size = dict(zip(reps, sizes))
+        for name, rep in zip(names, assignment):
+            writer.writerow([name, names[rep], cluster_size[rep]])
+    train_residues = int(lengths[reps].sum())
+    message(
+        typ="info",
+        data={
+            "title": "Evotune: Redundancy Reduction",
+            "body": f"Clustered {len(seqs)} sequences at {cluster_identity:.0%} identity "
+            f"into {len(reps)} representatives ({1 - len(reps) / max(len(seqs), 1):.1%} "
+            f"fewer sequences, {train_residues} of "
+            f"{int(lengths.sum())} residues kept).",
+        },
     )
 
+    # Pick up the checkpoints and best params of a previous (preempted) attempt of this
+    # run. fit only resumes a checkpoint written for the same inputs and settings.
+    sync_from_remote(remote_dir + BEST_DIR, local_dir / BEST_DIR)
+    if sync_from_remote(remote_dir + CHECKPOINT_DIR, local_dir / CHECKPOINT_DIR):
+        message(
+            typ="info",
+            data={
+                "title": "Resuming Evotune",
+                "body": f"Found checkpoints for {run_name}, resuming training.",
+            },
+        )
+
+    # Reuse the training steps compiled by earlier evotunes of this model size
+    cache_dir = compile_cache_dir(mlstm_size)
+    remote_cache_dir = f"latch:///unirep/.compile_cache/{cache_dir.name}/"
+    with timer.stage("compile_cache_download"):
+        sync_from_remote(remote_cache_dir, cache_dir)
+        compile_cache = enable_compile_cache(cache_dir)
+    cached_entries = len(list(cache_dir.iterdir())) if compile_cache else 0
+
+    # Evotuning
+    with timer.stage("fit"):
+        evotuned_params = fit(
+            sequences=TokenSequences(seqs.dataset, reps),
+            model_func=model_func,
+            params=params,
+            run_dir=local_dir,
+            holdout_seqs=holdout_seqs,
+            n_epochs=epochs,
+            on_checkpoint=lambda run_dir: sync_to_remote(run_dir, remote_dir),
+            sample_weights=cluster_weights(sizes) if weight_clusters else None,
+            timer=timer,
+        )
+    compile_s = sum(r["wall_s"] for r in timer.stages if r["name"] == "compile")
+    if compile_cache:
+        new_entries = len(list(cache_dir.iterdir())) - cached_entries
+        message(
+            typ="info",
+            data={
+                "title": "Evotune: Compilation",
+                "body": f"{compile_s:.1f}s compiling (or loading from the cache) the "
+                f"training steps, {cached_entries} cached compilations found and "
+                f"{new_entries} added.",
+            },
+        )
+        if new_entries > 0:
+            with timer.stage("compile_cache_upload"):
+                sync_to_remote(cache_dir, remote_cache_dir)
+
     # Save the evotuned parameters
-    jax_unirep.utils.dump_params(evotuned_params, local_dir)
-    return LatchDir(local_dir, remote_dir)
+    with timer.stage("dump_params"):
+        save_params(local_dir, to_host(evotuned_params))
+
+    # Run the follow-up application on the tuned params without leaving the node
+    if then != EvotuneOutput.none:
+        op = "rep" if then == EvotuneOutput.protein_rep else "babble"
+        message(
+            typ="info",
+            data={
+                "title": f"Evotune: {then.value}",
+                "body": f"Running {then.value} on your input sequences with the evotuned model.",
+            },
+        )
+        with timer.stage("model_conversion"):
+            model_path = str(params_to_model(evotuned_params))
+        if op == "rep":
+            params = {"residue_states": residue_states.value}
+        else:
+            params = babble_params(length, temp, sampling, top_k, top_p, num_samples)
+        # On the inputs as given, not the upper cased and gap stripped training tokens
+        run_inference(
+            op,
+            iter_seqs_from_inputs(sequence),
+            model_size,
+            model_path,
+            precision,
+            params,
+            str(local_dir),
+            timer,
+            profile=profile,
+        )
+    report_metrics(timer, local_dir, "Evotune")
+    return LatchDir(str(local_dir), remote_dir)
 
 
 @custom_task(8, 32)
@@ -220,6 +787,9 @@ def rep_task(
     model_size: ModelSize,
     model_params: Optional[LatchFile],
     run_name: str,
+    precision: Precision = Precision.float32,
+    residue_states: ResidueStates = ResidueStates.none,
+    profile: bool = False,
 ) -> LatchDir:
     message(
         typ="info",
@@ -230,35 +800,30 @@ def rep_task(
     local_dir.mkdir(exist_ok=True)
     local_dir = str(local_dir)
     remote_dir = "latch:///unirep/" + run_name + "/"
-
-    # Write seqs to 'seqs.csv' file
-    with open("seqs.csv", "w") as f:
-        for seq_and_name in seqs_and_names:
-            f.write(f"{seq_and_name[0]},{seq_and_name[1]}\n")
+    timer = StageTimer()
 
     # Extract model parameters from pkl file
-    from scripts.babble import pkl_to_model
+    from unirep_source.weights import pkl_to_model
 
     model_path = "None"
-    if model_params is not None:
-        model_path = pkl_to_model(model_params.local_path)
-
-    # Run babble
-    script_path = "scripts/rep.py"
-    subprocess.run(
-        [
-            "conda",
-            "run",
-            "-n",
-            "unirep",
-            script_path,
-            model_size.value,
-            local_dir,
-            "seqs.csv",
-            model_path,
-        ],
-        check=True,
+    with timer.stage("model_conversion"):
+        if model_params is not None:
+            model_path = pkl_to_model(model_params.local_path)
+
+    # In the warm daemon if there is one, otherwise in a worker of our own
+    params = {"residue_states": residue_states.value}
+    run_inference(
+        "rep",
+        seqs_and_names,
+        model_size,
+        model_path,
+        precision,
+        params,
+        local_dir,
+        timer,
+        profile=profile,
     )
+    report_metrics(timer, local_dir, "Rep")
     return LatchDir(local_dir, remote_dir)
 
 
@@ -270,12 +835,18 @@ def babble_task(
     run_name: str,
     length: Optional[int],
     temp: Optional[float],
+    precision: Precision = Precision.float32,
+    sampling: SamplingStrategy = SamplingStrategy.temperature,
+    top_k: int = 10,
+    top_p: float = 0.9,
+    num_samples: int = 1,
+    profile: bool = False,
 ) -> LatchDir:
     """
     The reason we have to run this in a subprocess rather than calling a python function is because
     we're using the native UniRep babbler, which includes a very old version of tensorflow which is
     incompatible with the latch package. So we need to run the babbler in a subprocess, with a separate
-    python interpreter.
+    python interpreter. The sequences and babbles go through its stdin and stdout (see run_inference).
     """
     message(
         typ="info",
@@ -289,41 +860,381 @@ def babble_task(
     local_dir.mkdir(exist_ok=True, parents=True)
     local_dir = str(local_dir)
     remote_dir = "latch:///unirep/" + run_name + "/"
+    timer = StageTimer()
+
+    # Extract model parameters from pkl file
+    from unirep_source.weights import pkl_to_model
+
+    model_path = "None"
+    with timer.stage("model_conversion"):
+        if model_params is not None:
+            model_path = pkl_to_model(model_params.local_path)
 
-    # Write seqs to 'seqs.csv' file
-    with open("seqs.csv", "w") as f:
-        for seq_and_name in seqs_and_names:
-            f.write(f"{seq_and_name[0]},{seq_and_name[1]}\n")
+    # In the warm daemon if there is one, otherwise in a worker of our own
+    params = babble_params(length, temp, sampling, top_k, top_p, num_samples)
+    run_inference(
+        "babble",
+        seqs_and_names,
+        model_size,
+        model_path,
+        precision,
+        params,
+        local_dir,
+        timer,
+        profile=profile,
+    )
+    report_metrics(timer, local_dir, "Babble")
+    return LatchDir(local_dir, remote_dir)
+
+
+@custom_task(8, 32)
+def score_task(
+    seqs_and_names: List[List[str]],
+    model_size: ModelSize,
+    model_params: Optional[LatchFile],
+    run_name: str,
+    precision: Precision = Precision.float32,
+    substitutions: bool = False,
+    profile: bool = False,
+) -> LatchDir:
+    message(
+        typ="info",
+        data={
+            "title": "Application: Scoring",
+            "body": "Scoring sequence log-likelihoods",
+        },
+    )
+    # Parameters
+    local_dir = Path(f"/root/outputs/{run_name}")
+    local_dir.mkdir(exist_ok=True)
+    local_dir = str(local_dir)
+    remote_dir = "latch:///unirep/" + run_name + "/"
+    timer = StageTimer()
 
     # Extract model parameters from pkl file
-    from scripts.babble import pkl_to_model
+    from unirep_source.weights import pkl_to_model
 
     model_path = "None"
-    if model_params is not None:
-        model_path = pkl_to_model(model_params.local_path)
-
-    # Run babble
-    script_path = "scripts/babble.py"
-    # subprocess.run(f"conda run -n unirep '{script_path}' {model_size.value} '{local_dir}' {length} {temp} seqs.csv '{model_path}'".split(), check=True)
-    subprocess.run(
-        [
-            "conda",
-            "run",
-            "-n",
-            "unirep",
-            script_path,
-            model_size.value,
-            local_dir,
-            str(length),
-            str(temp),
-            "seqs.csv",
-            model_path,
-        ],
-        check=True,
+    with timer.stage("model_conversion"):
+        if model_params is not None:
+            model_path = pkl_to_model(model_params.local_path)
+
+    # In the warm daemon if there is one, otherwise in a worker of our own
+    params = {"substitutions": substitutions}
+    run_inference(
+        "score",
+        seqs_and_names,
+        model_size,
+        model_path,
+        precision,
+        params,
+        local_dir,
+        timer,
+        profile=profile,
     )
+    report_metrics(timer, local_dir, "Scoring")
     return LatchDir(local_dir, remote_dir)
 
 
+@custom_task(8, 32)
+def variant_prediction_task(
+    seqs_and_names: List[List[str]],
+    model_size: ModelSize,
+    model_params: Optional[LatchFile],
+    run_name: str,
+    labels: Optional[LatchFile],
+    precision: Precision = Precision.float32,
+) -> LatchDir:
+    message(
+        typ="info",
+        data={
+            "title": "Application: Variant Prediction",
+            "body": "Fitting a ridge top model on UniRep representations",
+        },
+    )
+    from wf.topmodel import RepCollector, fit_ridge_cv, predict, read_labels
+
+    if labels is None:
+        raise ValueError("Variant Fitness Prediction needs a labels csv (sequence,label header).")
+    train_seqs, train_labels = read_labels(Path(labels.local_path))
+
+    # Parameters
+    local_dir = Path(f"/root/outputs/{run_name}")
+    local_dir.mkdir(exist_ok=True)
+    remote_dir = "latch:///unirep/" + run_name + "/"
+    timer = StageTimer()
+
+    # Reps of the labelled sequences and the library in one run of the model, kept in
+    # memory as they come back. Index-based names so nothing collides.
+    seqs = [[seq, f"train_{i}"] for i, seq in enumerate(train_seqs)] + [
+        [seq_and_name[0], f"library_{i}"] for i, seq_and_name in enumerate(seqs_and_names)
+    ]
+
+    # Extract model parameters from pkl file
+    from unirep_source.weights import pkl_to_model
+
+    model_path = "None"
+    with timer.stage("model_conversion"):
+        if model_params is not None:
+            model_path = pkl_to_model(model_params.local_path)
+
+    reps = RepCollector(len(seqs))
+    run_inference(
+        "rep",
+        seqs,
+        model_size,
+        model_path,
+        precision,
+        {"residue_states": ResidueStates.none.value},
+        str(local_dir),
+        timer,
+        writer=reps,
+    )
+
+    # Fit on the labelled sequences with a valid rep
+    n_train = len(train_seqs)
+    found = reps.found[:n_train]
+    if found.sum() < 2:
+        raise ValueError("Need at least two valid labelled sequences to fit a top model.")
+    X = reps.reps[:n_train]
+    with timer.stage("fit_top_model"):
+        model = fit_ridge_cv(X[found], train_labels[found])
+    np.savez(local_dir / "top_model.npz", **model)
+    with open(local_dir / "top_model_cv.csv", "w") as f:
+        f.write("alpha,cv_mse\n")
+        for alpha, mse in zip(model["alphas"], model["cv_mse"]):
+            f.write(f"{alpha},{mse}\n")
+
+    # Predict the whole library in one product
+    with timer.stage("predict", residues=sum(len(s[0]) for s in seqs_and_names)):
+        X, found = reps.reps[n_train:], reps.found[n_train:]
+        predictions = predict(model, X)
+    with open(local_dir / "variant_predictions.csv", "w", newline="") as f:
+        writer = csv.writer(f, lineterminator="\n")
+        writer.writerow(["name", "seq", "predicted_fitness"])
+        for (seq, name), is_found, prediction in zip(seqs_and_names, found, predictions):
+            value = f"{prediction:.6f}" if is_found else "invalid sequence"
+            writer.writerow([name, seq, value])
+
+    report_metrics(timer, local_dir, "Variant Prediction")
+    return LatchDir(str(local_dir), remote_dir)
+
+
+# Fits every application: evotune needs EVOTUNE_CPUS, the other tasks ask for 8
+@custom_task(max(EVOTUNE_CPUS, 8), 32)
+def unirep_task(
+    sequence: Optional[List[Union[str, LatchFile, LatchDir]]],
+    application: Application,
+    run_name: str,
+    model_size: ModelSize,
+    model_params: Optional[LatchFile],
+    length: Optional[int],
+    temp: Optional[float],
+    holdout: Optional[List[Union[str, LatchFile, LatchDir]]],
+    epochs: int,
+    precision: Precision,
+    residue_states: ResidueStates,
+    saturation_mutagenesis: bool,
+    labels: Optional[LatchFile],
+    sampling: SamplingStrategy,
+    top_k: int,
+    top_p: float,
+    num_samples: int,
+    profile: bool,
+    cluster_identity: float,
+    weight_clusters: bool,
+    evotune_then: EvotuneOutput,
+) -> LatchDir:
+    """
+    A whole run in one task: the inputs are parsed and validated here and the selected
+    application's task body is called directly. Compared to running check_enum and
+    get_seqs_from_inputs as nodes of their own and then the application's task, that
+    is one container start and input download instead of three.
+    """
+    if application == Application.evotune:
+        return evotune_task.__wrapped__(
+            sequence=sequence,
+            model_size=model_size,
+            model_params=model_params,
+            run_name=run_name,
+            holdout=holdout,
+            epochs=epochs,
+            cluster_identity=cluster_identity,
+            weight_clusters=weight_clusters,
+            then=evotune_then,
+            precision=precision,
+            residue_states=residue_states,
+            length=length,
+            temp=temp,
+            sampling=sampling,
+            top_k=top_k,
+            top_p=top_p,
+            num_samples=num_samples,
+            profile=profile,
+        )
+
+    seqs_and_names = get_seqs_from_inputs.__wrapped__(sequence=sequence)
+    if application == Application.protein_rep:
+        return rep_task.__wrapped__(
+            seqs_and_names=seqs_and_names,
+            model_size=model_size,
+            model_params=model_params,
+            run_name=run_name,
+            precision=precision,
+            residue_states=residue_states,
+            profile=profile,
+        )
+    elif application == Application.babble:
+        return babble_task.__wrapped__(
+            seqs_and_names=seqs_and_names,
+            model_size=model_size,
+            model_params=model_params,
+            run_name=run_name,
+            length=length,
+            temp=temp,
+            precision=precision,
+            sampling=sampling,
+            top_k=top_k,
+            top_p=top_p,
+            num_samples=num_samples,
+            profile=profile,
+        )
+    elif application == Application.score:
+        return score_task.__wrapped__(
+            seqs_and_names=seqs_and_names,
+            model_size=model_size,
+            model_params=model_params,
+            run_name=run_name,
+            precision=precision,
+            substitutions=saturation_mutagenesis,
+            profile=profile,
+        )
+    elif application == Application.variant_prediction:
+        return variant_prediction_task.__wrapped__(
+            seqs_and_names=seqs_and_names,
+            model_size=model_size,
+            model_params=model_params,
+            run_name=run_name,
+            labels=labels,
+            precision=precision,
+        )
+    raise ValueError(f"Unknown application: {application}")
+
+
+@flyte_workflow
+def unirep_per_task(
+    sequence: Optional[List[Union[str, LatchFile, LatchDir]]],
+    application: Application,
+    run_name: str,
+    model_size: ModelSize,
+    model_params: Optional[LatchFile],
+    length: Optional[int],
+    temp: Optional[float],
+    holdout: Optional[List[Union[str, LatchFile, LatchDir]]],
+    epochs: int,
+    precision: Precision,
+    residue_states: ResidueStates,
+    saturation_mutagenesis: bool,
+    labels: Optional[LatchFile],
+    sampling: SamplingStrategy,
+    top_k: int,
+    top_p: float,
+    num_samples: int,
+    profile: bool,
+    cluster_identity: float,
+    weight_clusters: bool,
+    evotune_then: EvotuneOutput,
+) -> LatchDir:
+    """
+    The inputs are read and the application picked by small tasks of their own, then
+    the application runs in its task, with the resources that application asks for.
+    """
+    seqs_and_names = get_seqs_from_inputs(sequence=sequence, application=application)
+    (rep, babble, evotune, score, variant_prediction) = check_enum(
+        application=application
+    )
+    return (
+        create_conditional_section("application")
+        .if_((rep.is_true()))
+        .then(
+            rep_task(
+                seqs_and_names=seqs_and_names,
+                model_size=model_size,
+                model_params=model_params,
+                run_name=run_name,
+                precision=precision,
+                residue_states=residue_states,
+                profile=profile,
+            )
+        )
+        .elif_((babble.is_true()))
+        .then(
+            babble_task(
+                seqs_and_names=seqs_and_names,
+                model_size=model_size,
+                model_params=model_params,
+                run_name=run_name,
+                length=length,
+                temp=temp,
+                precision=precision,
+                sampling=sampling,
+                top_k=top_k,
+                top_p=top_p,
+                num_samples=num_samples,
+                profile=profile,
+            )
+        )
+        .elif_((evotune.is_true()))
+        .then(
+            evotune_task(
+                sequence=sequence,
+                model_size=model_size,
+                model_params=model_params,
+                run_name=run_name,
+                holdout=holdout,
+                epochs=epochs,
+                cluster_identity=cluster_identity,
+                weight_clusters=weight_clusters,
+                then=evotune_then,
+                precision=precision,
+                residue_states=residue_states,
+                length=length,
+                temp=temp,
+                sampling=sampling,
+                top_k=top_k,
+                top_p=top_p,
+                num_samples=num_samples,
+                profile=profile,
+            )
+        )
+        .elif_((score.is_true()))
+        .then(
+            score_task(
+                seqs_and_names=seqs_and_names,
+                model_size=model_size,
+                model_params=model_params,
+                run_name=run_name,
+                precision=precision,
+                substitutions=saturation_mutagenesis,
+                profile=profile,
+            )
+        )
+        .elif_((variant_prediction.is_true()))
+        .then(
+            variant_prediction_task(
+                seqs_and_names=seqs_and_names,
+                model_size=model_size,
+                model_params=model_params,
+                run_name=run_name,
+                labels=labels,
+                precision=precision,
+            )
+        )
+        .else_()
+        .fail("Unknown application.")
+    )
+
+
 @workflow
 def unirep(
     sequence: Optional[List[Union[str, LatchFile, str]]],
@@ -334,6 +1245,20 @@ def unirep(
     length: Optional[int] = int(250),
     temp: Optional[float] = 1.0,
     holdout: Optional[List[Union[str, LatchFile, LatchDir]]] = None,
+    epochs: int = 20,
+    precision: Precision = Precision.float32,
+    residue_states: ResidueStates = ResidueStates.none,
+    saturation_mutagenesis: bool = False,
+    labels: Optional[LatchFile] = None,
+    sampling: SamplingStrategy = SamplingStrategy.temperature,
+    top_k: int = 10,
+    top_p: float = 0.9,
+    num_samples: int = 1,
+    profile: bool = False,
+    cluster_identity: float = 1.0,
+    weight_clusters: bool = True,
+    evotune_then: EvotuneOutput = EvotuneOutput.none,
+    single_node: bool = False,
 ) -> LatchDir:
     """
     UniRep
@@ -354,28 +1279,59 @@ def unirep(
     - generating protein representations from the mLSTM model
     - "babbling": using generative modeling to synthesize sequences from a seed
     - "evotuning": further tuning the UniRep model on user-provided sequences
+    - "scoring": per-sequence and per-residue log-likelihoods of large variant libraries
+
+    With `single_node`, a run is a single task: the inputs are read and checked on the same node that runs the selected application.
 
     ## Inputs
     - `run_name`: Name of the run. The files will be stored in latch:///unirep/{run_name}/. If None, run_name will default to the current date and time.
-    - `sequence`: Multiple strings or FASTA files containing a protein sequence.
+    - `sequence`: Multiple strings or FASTA files containing a protein sequence. FASTA files can end in .fasta, .fa or .faa and be gzip or bgzip compressed (.gz), as can .txt files of one sequence per line.
     - `model_size`: Choice between using the 64, 256, or 1900-dimensional model.
     - `model_params`: If not None, this is a LatchFile containing the model parameters in a model_weights.pkl file. If None, the model parameters will be the default UniRep model.
     - `application`: A dropdown indicating which application to use.
         - `UniRep/UniRep Fusion`: Generate a protein representation.
         - `Babble`: Synthesize sequences from a seed.
         - `Evotuning`: Further tune the UniRep model on user-provided sequences.
+        - `Log-Likelihood Scoring`: Score every sequence (e.g. a variant library) under the model, a zero-shot fitness proxy.
+        - `Variant Fitness Prediction`: Fit a ridge regression top model on the UniRep representations of labelled sequences and predict the fitness of the input sequences.
     - `length`: (Default 250) An integer indicating the length of the sequence to generate (including the original protein length).
     - `temperature`: (Default 1) A float between 0 and 1 indicating how noisy the babble should be. 1 is the noisiest.
+    - `sampling`: (Default temperature) How Babble picks each amino acid: from the full temperature-scaled distribution, from the `top_k` most likely ones, or from the most likely ones adding up to probability `top_p` (nucleus sampling).
+    - `top_k`: (Default 10) Number of amino acids kept by top_k sampling.
+    - `top_p`: (Default 0.9) Probability mass kept by top_p sampling.
+    - `num_samples`: (Default 1) Number of babbles per input sequence. Every sample is reproducible on its own, whatever else is in the run.
+    - `profile`: (Default False) Record TensorFlow op-level traces of a sample of the model runs for UniRep, Babble and Scoring.
     - `holdout`: (Optional) Strings/LatchFiles containing holdout sequences for Evotuning.
+    - `precision`: (Default float32) Storage precision of the 1900 model's weights for UniRep, Babble and Scoring. A memory-only option: float16 and int8 store the weights in less memory between runs and in smaller exported graphs, but every run works on float32 copies, so inference is no faster and its peak memory is unchanged, and the representations drift slightly (measure it with `scripts/rep_drift.py`). The 64 and 256 models only support float32.
+    - `residue_states`: (Default none) Also save the per-residue hidden states (and optionally cell states) for UniRep, for structure or contact models.
+    - `saturation_mutagenesis`: (Default False) For Log-Likelihood Scoring, also score every single substitution of every input sequence, from one forward pass per sequence.
+    - `labels`: (Variant Fitness Prediction) A csv with a `sequence,label` header row and one row per measured fitness value to train the top model on. Fields may be quoted.
+    - `epochs`: (Default 20) Number of passes over the input sequences during Evotuning. Evotuning checkpoints as it goes, and rerunning with the same `run_name` resumes from the latest checkpoint.
+    - `cluster_identity`: (Default 1.0) Evotuning trains on one representative per cluster of input sequences at this identity (estimated from k-mer MinHash sketches). Lower it, e.g. to 0.9, to drop redundant homologs from JackHMMer sets. 1.0 only drops (near) exact duplicates.
+    - `weight_clusters`: (Default True) Weight every representative by the size of its cluster during Evotuning.
+    - `evotune_then`: (Default None) After Evotuning, run UniRep/UniRep Fusion or Babble on the input sequences with the evotuned model in the same task, using the UniRep and Babble inputs above. Saves downloading `model_weights.pkl` and starting a second run with it as `model_params`.
+    - `single_node`: (Default False) Read the inputs and run the application in one task, rather than in small tasks of their own before the application's task. Saves several container starts, which dominate short interactive runs. The task always asks for the largest resources any application needs.
 
     ## Outputs
     [TODO] update outputs to reflect the new workflow
     - `unirep/{run_name}/{protein_name}/unirep.np`: A numpy array containing the UniRep representation of the protein.
     - `unirep/{run_name}/{protein_name}/unirep_fusion.np`: A numpy array containing the UniRep Fusion representation of the protein.
+    - `unirep/{run_name}/residue_states/`: Per-residue states of all proteins. `{kind}.bin` holds the rows of every protein back to back, protein i is rows `offsets.npy[i]:offsets.npy[i+1]` and `names.txt` gives the protein names. Read one protein without loading the rest with `unirep_source.rep_store.RaggedStore`.
     - `unirep/{run_name}/{protein_name}/babble{LENGTH}.txt`: A text file containing the babble from a seed protein.
     - `unirep/{run_name}/{protein_name}/original_seq.txt`: A text file containing the original protein sequence.
     - `unirep/{run_name}/babble_results.csv`: A csv containing aggregated babble results.
+    - `unirep/{run_name}/scores.csv`: Per-sequence log-likelihood (sum and per-residue mean) from Log-Likelihood Scoring.
+    - `unirep/{run_name}/position_log_likelihoods/`: Per-residue log-likelihoods of the valid scored sequences, in the same ragged format as `residue_states/`.
+    - `unirep/{run_name}/{protein_name}/substitutions.csv`: Log-probability of each amino acid at each position of the protein given the residues before it (saturation mutagenesis).
+    - `unirep/{run_name}/variant_predictions.csv`: Predicted fitness of every input sequence.
+    - `unirep/{run_name}/top_model.npz`: The fitted ridge top model (coef, intercept, alpha) and `top_model_cv.csv` with the cross-validated error of every alpha.
+    - `unirep/{run_name}/metrics.json`: Wall time, CPU time and peak memory of every stage of the task (and of the model script it ran), with residues/sec for inference.
+    - `unirep/{run_name}/traces/`: With `profile`, Chrome traces (open in chrome://tracing) of sampled model runs and `op_summary.json` with the time spent per op type.
     - `unirep/{run_name}/model_params.pkl`: A pickle file containing the model parameters.
+    - `unirep/{run_name}/checkpoints/`: Evotuning checkpoints, used to resume a preempted run with the same inputs and settings.
+    - `unirep/{run_name}/best/`: The evotuned parameters with the lowest holdout loss so far, with their step and holdout loss. Evotuned `model_weights.pkl` files hold a dict with the parameters under `params`, and can be passed as `model_params` as they are.
+    - `unirep/{run_name}/clusters.csv`: The representative and cluster size of every Evotuning input sequence.
+    - `unirep/.compile_cache/mlstm{size}/`: Compiled Evotuning training steps shared by all runs of a model size, so later runs skip most of the compilation. Safe to delete.
 
     ## License
     #### UniRep
@@ -432,47 +1388,120 @@ def unirep(
             How noisy the babble should be. Default: 1
             __metadata__:
                 display_name: (Babble) Temperature
+        sampling:
+            Sampling strategy for babbling. Default: temperature
+            __metadata__:
+                display_name: (Babble) Sampling Strategy
+        top_k:
+            Number of most likely amino acids to sample from with top_k sampling. Default: 10
+            __metadata__:
+                display_name: (Babble) Top k
+        top_p:
+            Probability mass to sample from with top_p sampling. Default: 0.9
+            __metadata__:
+                display_name: (Babble) Top p
+        num_samples:
+            Number of babbles to generate per input sequence. Default: 1
+            __metadata__:
+                display_name: (Babble) Samples per Sequence
+        profile:
+            Record op-level traces of a sample of the model runs. Default: False
+            __metadata__:
+                display_name: Profile
         holdout:
             Holdout sequences for evotuning.
             __metadata__:
                 display_name: (Evotuning) Holdout
+        precision:
+            Storage precision of the 1900 model's weights (memory-only, not faster). Default: float32
+            __metadata__:
+                display_name: (1900 model) Precision
+        residue_states:
+            Per-residue states to save alongside the representations. Default: none
+            __metadata__:
+                display_name: (UniRep) Per-Residue States
+        saturation_mutagenesis:
+            Score every single substitution of the input sequences. Default: False
+            __metadata__:
+                display_name: (Scoring) Saturation Mutagenesis
+        labels:
+            Csv of sequence,label rows to train the top model on.
+            __metadata__:
+                display_name: (Variant Prediction) Labels
+        epochs:
+            Number of passes over the input sequences during evotuning. Default: 20
+            __metadata__:
+                display_name: (Evotuning) Epochs
+        cluster_identity:
+            Sequence identity at which evotuning inputs are clustered. Default: 1.0
+            __metadata__:
+                display_name: (Evotuning) Cluster Identity
+        weight_clusters:
+            Weight cluster representatives by cluster size. Default: True
+            __metadata__:
+                display_name: (Evotuning) Weight Clusters
+        evotune_then:
+            Application to run with the evotuned model right after evotuning. Default: None
+            __metadata__:
+                display_name: (Evotuning) Then Run
+        single_node:
+            Run the whole workflow in a single task. Default: False
+            __metadata__:
+                display_name: Single Node
 
     """
-    seqs_and_names = get_seqs_from_inputs(sequence=sequence)
-    (rep, babble, evotune) = check_enum(application=application)
-    holdouts = get_holdouts(sequence=holdout)
     return (
-        create_conditional_section("application")
-        .if_((rep.is_true()))
+        create_conditional_section("single_node")
+        .if_(single_node.is_true())
         .then(
-            rep_task(
-                seqs_and_names=seqs_and_names,
-                model_size=model_size,
-                model_params=model_params,
+            unirep_task(
+                sequence=sequence,
+                application=application,
                 run_name=run_name,
-            )
-        )
-        .elif_((babble.is_true()))
-        .then(
-            babble_task(
-                seqs_and_names=seqs_and_names,
                 model_size=model_size,
                 model_params=model_params,
-                run_name=run_name,
                 length=length,
                 temp=temp,
+                holdout=holdout,
+                epochs=epochs,
+                precision=precision,
+                residue_states=residue_states,
+                saturation_mutagenesis=saturation_mutagenesis,
+                labels=labels,
+                sampling=sampling,
+                top_k=top_k,
+                top_p=top_p,
+                num_samples=num_samples,
+                profile=profile,
+                cluster_identity=cluster_identity,
+                weight_clusters=weight_clusters,
+                evotune_then=evotune_then,
             )
         )
-        .elif_((evotune.is_true()))
+        .else_()
         .then(
-            evotune_task(
-                seqs_and_names=seqs_and_names,
+            unirep_per_task(
+                sequence=sequence,
+                application=application,
+                run_name=run_name,
                 model_size=model_size,
                 model_params=model_params,
-                run_name=run_name,
-                holdouts=holdouts,
+                length=length,
+                temp=temp,
+                holdout=holdout,
+                epochs=epochs,
+                precision=precision,
+                residue_states=residue_states,
+                saturation_mutagenesis=saturation_mutagenesis,
+                labels=labels,
+                sampling=sampling,
+                top_k=top_k,
+                top_p=top_p,
+                num_samples=num_samples,
+                profile=profile,
+                cluster_identity=cluster_identity,
+                weight_clusters=weight_clusters,
+                evotune_then=evotune_then,
             )
         )
-        .else_()
-        .fail("Variant Prediction isn't implemented yet.")
     )
@@ -0,0 +1,142 @@
+"""
+Near-duplicate clustering of evotuning inputs with k-mer MinHash sketches.
+
+Every sequence is reduced to a signature of num_hashes minimum hash values over its
+k-mers. The fraction of equal entries in two signatures estimates the Jaccard
+similarity of their k-mer sets, which for two sequences of identity p is about
+p^k / (2 - p^k). The k-mers of all sequences are hashed together with numpy, a
+block of sequences at a time, and per-sequence minima taken with one reduceat.
+
+Clustering is greedy, longest first, as in CD-HIT: a sequence joins the first
+representative it is similar enough to, or becomes a representative itself.
+Candidate representatives are found by locality-sensitive hashing (signature bands
+that hash the same), so each sequence is only compared with a handful of them.
+"""
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+# Number of k-mers hashed at once, bounds the [kmers, num_hashes] block in memory
+KMER_BLOCK = 1 << 18
+
+
+def jaccard_threshold(identity: float, k: int) -> float:
+    """
+    Expected k-mer Jaccard similarity of two sequences with the given identity.
+    """
+    shared = identity**k
+    return shared / (2 - shared)
+
+
+def mix64(z: np.ndarray) -> np.ndarray:
+    """
+    splitmix64 finalizer, a cheap and well mixed hash of uint64 arrays.
+    """
+    z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return z ^ (z >> np.uint64(31))
+
+
+def kmer_codes(seqs: List[str], k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Integer code of every k-mer of every sequence (its k bytes, base 256), and the
+    number of k-mers of each sequence. Sequences shorter than k count as one k-mer
+    of their own, padded with zeros.
+    """
+    padded = [seq.upper() + "\0" * max(k - len(seq), 0) for seq in seqs]
+    lengths = np.array([len(seq) for seq in padded], dtype=np.int64)
+    codes = np.frombuffer("".join(padded).encode("ascii", "replace"), dtype=np.uint8)
+    counts = lengths - k + 1
+    # Position of the first residue of every k-mer in the joined buffer
+    seq_starts = np.concatenate([[0], np.cumsum(lengths)[:-1]])
+    kmer_starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+    first = np.repeat(seq_starts - kmer_starts, counts) + np.arange(counts.sum())
+    kmers = np.zeros(len(first), dtype=np.uint64)
+    for j in range(k):
+        kmers = (kmers << np.uint64(8)) | codes[first + j].astype(np.uint64)
+    return kmers, counts
+
+
+def minhash_signatures(
+    seqs: List[str], k: int = 3, num_hashes: int = 64, seed: int = 42
+) -> np.ndarray:
+    """
+    [len(seqs), num_hashes] MinHash signatures of the k-mer sets of seqs.
+    """
+    # Hash function i is mix64 of the k-mer code xor a random salt
+    salts = np.random.RandomState(seed).randint(0, 1 << 62, size=num_hashes).astype(np.uint64)
+    signatures = np.zeros((len(seqs), num_hashes), dtype=np.uint64)
+    start = 0
+    while start < len(seqs):
+        # A block of whole sequences with about KMER_BLOCK k-mers
+        end = start + 1
+        n_kmers = max(len(seqs[start]) - k + 1, 1)
+        while end < len(seqs) and n_kmers + len(seqs[end]) <= KMER_BLOCK:
+            n_kmers += max(len(seqs[end]) - k + 1, 1)
+            end += 1
+        kmers, counts = kmer_codes(seqs[start:end], k)
+        hashes = mix64(kmers[:, None] ^ salts)
+        offsets = np.concatenate([[0], np.cumsum(counts)[:-1]])
+        signatures[start:end] = np.minimum.reduceat(hashes, offsets, axis=0)
+        start = end
+    return signatures
+
+
+def cluster_sequences(
+    seqs: List[str],
+    identity: float = 0.9,
+    k: int = 3,
+    num_hashes: int = 64,
+    bands: int = 32,
+    seed: int = 42,
+) -> np.ndarray:
+    """
+    Greedy clustering of seqs at about the given sequence identity.
+    Returns the index of every sequence's representative (a representative points to
+    itself). Representatives are the longest sequence of their cluster.
+    """
+    n = len(seqs)
+    assignment = np.arange(n)
+    if n == 0:
+        return assignment
+    signatures = minhash_signatures(seqs, k=k, num_hashes=num_hashes, seed=seed)
+    threshold = jaccard_threshold(identity, k)
+    rows = num_hashes // bands
+    buckets: List[Dict[bytes, List[int]]] = [{} for _ in range(bands)]
+
+    def band_keys(i):
+        return [signatures[i, j * rows : (j + 1) * rows].tobytes() for j in range(bands)]
+
+    lengths = np.array([len(seq) for seq in seqs])
+    for i in np.argsort(-lengths, kind="stable"):
+        keys = band_keys(i)
+        candidates = set()
+        for band, key in zip(buckets, keys):
+            candidates.update(band.get(key, []))
+        if len(candidates) > 0:
+            candidates = np.array(sorted(candidates))
+            similarity = (signatures[candidates] == signatures[i]).mean(axis=1)
+            best = int(np.argmax(similarity))
+            if similarity[best] >= threshold:
+                assignment[i] = candidates[best]
+                continue
+        for band, key in zip(buckets, keys):
+            band.setdefault(key, []).append(int(i))
+    return assignment
+
+
+def representatives(assignment: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Indices of the representatives (in input order) and the size of their clusters.
+    """
+    reps, sizes = np.unique(assignment, return_counts=True)
+    return reps, sizes
+
+
+def cluster_weights(sizes: np.ndarray) -> np.ndarray:
+    """
+    Sample weights for the representatives that keep the total weight of every
+    cluster: proportional to cluster size, with mean one.
+    """
+    sizes = np.asarray(sizes, dtype=np.float64)
+    return (sizes / sizes.mean()).astype(np.float32)
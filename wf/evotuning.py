@@ -0,0 +1,550 @@
+"""
+Checkpointed evotuning loop built on the jax-unirep 2.x building blocks.
+
+`jax_unirep.evotune` runs an optuna search and only hands back params at the very
+end, so a preempted node loses the whole run. This module drives the same loss and
+optimizer one step at a time, and periodically writes params, optimizer state and
+the position in the data order to `{run_dir}/checkpoints/` so a restarted task can
+pick up where it left off. Checkpoints are dicts tagged with CHECKPOINT_FORMAT and
+record the run they belong to (see run_config), and only a checkpoint of the same run
+is resumed. The best params on the holdout set are written with
+unirep_source.weights.save_params.
+
+Each batch is split across all local XLA devices and the gradients are all-reduced,
+so with `--xla_force_host_platform_device_count` set (see wf.use_host_devices) every CPU
+core of the task works on the training step.
+
+XLA compilations of the training step (one per batch shape) can be kept in a
+persistent on-disk cache, see enable_compile_cache, so a repeated evotune of the same
+model size starts training without recompiling.
+
+The training and holdout sequences can be a list of strings or a TokenSequences view of
+an on-disk token dataset, which is decoded a batch at a time. The one-hot batches are
+built on a background thread a few steps ahead of the training step.
+"""
+import hashlib
+import os
+import pickle as pkl
+import queue
+import threading
+import time
+from functools import partial
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Union
+
+import numpy as np
+import jax
+from jax import grad, jit, lax, pmap, vmap
+from jax import numpy as jnp
+from jax.experimental.optimizers import pack_optimizer_state, unpack_optimizer_state
+from jax_unirep.optimizers import adamW
+from jax_unirep.utils import input_output_pairs
+
+from unirep_source.data_utils import TokenDataset
+from unirep_source.weights import PARAMS_FILE, save_params
+
+CHECKPOINT_DIR = "checkpoints"
+BEST_DIR = "best"
+CHECKPOINT_PREFIX = "ckpt_"
+CHECKPOINT_FORMAT = "unirep_latch.checkpoint.v1"
+# Training batches built ahead of the one being trained on
+PREFETCH_BATCHES = 4
+# Root of the persistent compilation cache, one subdirectory per model size. Point it
+# into the image to ship precompiled steps with it.
+COMPILE_CACHE_DIR = Path(os.environ.get("UNIREP_JAX_CACHE", "/root/.cache/unirep_jax"))
+
+
+def compile_cache_dir(model_size: int) -> Path:
+    return COMPILE_CACHE_DIR / f"mlstm{model_size}"
+
+
+def enable_compile_cache(cache_dir: Path) -> bool:
+    """
+    Keep every XLA compilation in a persistent cache in cache_dir. Entries are keyed by
+    the computation and its input shapes, so each batch length is compiled once and
+    reused by any later run that uses the same directory. Returns True only if a test
+    compilation actually landed in the cache: older jax versions accept a cache
+    directory but only use it on TPU, so on CPU nothing would be cached.
+    """
+    cache_dir = Path(cache_dir)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    try:
+        jax.config.update("jax_compilation_cache_dir", str(cache_dir))
+        # By default only slow compilations are cached, the mLSTM steps all are worth it
+        for option in [
+            "jax_persistent_cache_min_compile_time_secs",
+            "jax_persistent_cache_min_entry_size_bytes",
+        ]:
+            try:
+                jax.config.update(option, 0)
+            except Exception:
+                pass
+    except Exception:
+        # Before the config option, the cache was set up through its module
+        try:
+            from jax.experimental.compilation_cache import compilation_cache
+
+            compilation_cache.initialize_cache(str(cache_dir))
+        except Exception as e:
+            print(f"No persistent compilation cache: {e}")
+            return False
+    if not compile_cache_works(cache_dir):
+        print(f"The compilation cache is not used on {jax.default_backend()}, compiling uncached")
+        return False
+    return True
+
+
+def compile_cache_works(cache_dir: Path) -> bool:
+    """
+    Compile a computation no earlier run can have cached (it holds a random constant)
+    and check that it added an entry to cache_dir.
+    """
+    before = len(list(Path(cache_dir).rglob("*")))
+    salt = float(np.random.RandomState().rand())
+    block_until_ready(jit(lambda x: x * salt + 1.0)(jnp.ones(3)))
+    return len(list(Path(cache_dir).rglob("*"))) > before
+
+
+def compiled_call(timer, compiled: Dict[Any, Callable], key, fn: Callable, *args, **extra):
+    """
+    Return fn(*args), compiling fn ahead of time the first time key comes up. The
+    lowering and compilation (or the load from the compilation cache) are timed on their
+    own, without running fn, and recorded as a "compile" stage with extra if there is a
+    timer. The compiled executable is kept in compiled and reused for every later call
+    with the same key, so key has to capture the shapes of args. On jax versions
+    without ahead-of-time lowering fn is called as it is and no stage is recorded.
+    """
+    if key not in compiled:
+        lower = getattr(fn, "lower", None)
+        if lower is None:
+            compiled[key] = fn
+        else:
+            start = time.time()
+            compiled[key] = lower(*args).compile()
+            if timer is not None:
+                timer.add("compile", time.time() - start, **extra)
+    return compiled[key](*args)
+
+
+def block_until_ready(tree):
+    return jax.tree_map(lambda x: x.block_until_ready(), tree)
+
+
+class TokenSequences:
+    """
+    The amino acid strings of a token dataset (see unirep_source.data_utils), or of the
+    subset idxs of it, decoded only when indexed.
+    """
+
+    def __init__(self, dataset: Union[TokenDataset, str], idxs: Optional[Sequence[int]] = None):
+        if isinstance(dataset, str):
+            dataset = TokenDataset(dataset)
+        self.dataset = dataset
+        self.idxs = np.arange(len(dataset)) if idxs is None else np.asarray(idxs)
+
+    def __len__(self):
+        return len(self.idxs)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self.dataset.seq(j) for j in self.idxs[i]]
+        return self.dataset.seq(self.idxs[i])
+
+    @property
+    def lengths(self) -> np.ndarray:
+        """
+        Residue count of every sequence, read from the offsets only.
+        """
+        return self.dataset.lengths[self.idxs] - 2
+
+
+SequenceSource = Union[List[str], TokenSequences]
+
+
+def sequence_lengths(sequences: SequenceSource) -> np.ndarray:
+    if isinstance(sequences, TokenSequences):
+        return sequences.lengths
+    return np.array([len(seq) for seq in sequences], dtype=np.int64)
+
+
+def length_groups(lengths: np.ndarray) -> List[np.ndarray]:
+    """
+    Indices of the sequences of every length, shortest length first.
+    """
+    lengths = np.asarray(lengths)
+    order = np.argsort(lengths, kind="stable")
+    bounds = np.flatnonzero(np.diff(lengths[order])) + 1
+    return np.split(order, bounds) if len(order) > 0 else []
+
+
+def prefetch(iterable: Iterable, size: int = PREFETCH_BATCHES) -> Iterator:
+    """
+    Iterate over iterable on a background thread, keeping up to size items ready.
+    An exception raised by iterable is raised again here, and the thread stops when
+    the returned iterator is closed or garbage collected.
+    """
+    items = queue.Queue(maxsize=size)
+    stop = threading.Event()
+    end = object()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                items.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def produce():
+        try:
+            for item in iterable:
+                if not put((item, None)):
+                    return
+        except BaseException as e:
+            put((None, e))
+            return
+        put((end, None))
+
+    thread = threading.Thread(target=produce, daemon=True)
+    thread.start()
+    try:
+        while True:
+            item, error = items.get()
+            if error is not None:
+                raise error
+            if item is end:
+                return
+            yield item
+    finally:
+        stop.set()
+
+
+def epoch_batches(
+    sequences: SequenceSource, batch_size: int, seed: int, epoch: int
+) -> List[List[int]]:
+    """
+    Return the batches (lists of indices into sequences) for one epoch.
+
+    Sequences are grouped by length so no padding is needed, each length group is
+    shuffled and chunked into batches of at most batch_size, and the batch order is
+    shuffled. The order only depends on (seed, epoch), so a resumed run replays the
+    exact same batches.
+    """
+    rng = np.random.RandomState([seed, epoch])
+    batches = []
+    for idxs in length_groups(sequence_lengths(sequences)):
+        idxs = rng.permutation(idxs)
+        for start in range(0, len(idxs), batch_size):
+            batches.append([int(i) for i in idxs[start : start + batch_size]])
+    order = rng.permutation(len(batches))
+    return [batches[i] for i in order]
+
+
+def weighted_loss(params, predict, inputs, targets, weights, tol=1e-10):
+    """
+    Sum over sequences of the per-sequence jax-unirep evotuning loss times weights.
+
+    With all weights equal to one and divided by the number of sequences this is
+    exactly `jax_unirep.evotuning.evotune_loss`. Zero weights let us pad a batch so
+    it splits evenly across devices without the filler affecting the gradient.
+    """
+    predictions = vmap(partial(predict, params))(inputs)
+    xent = -(
+        targets * jnp.log(jnp.maximum(tol, predictions))
+        + (1 - targets) * jnp.log(jnp.maximum(tol, 1 - predictions))
+    )
+    return jnp.sum(jnp.mean(xent, axis=(1, 2)) * weights)
+
+
+def shard_batch(
+    xs: np.ndarray, ys: np.ndarray, n_devices: int, weights: Optional[np.ndarray] = None
+):
+    """
+    Reshape a batch to [n_devices, per_device, ...], padding with zero-weight copies
+    of the first sequence. weights are the sample weights of the batch (default all
+    ones). Returns the sharded xs, ys and weights.
+    """
+    n = len(xs)
+    per_device = -(-n // n_devices)
+    pad = per_device * n_devices - n
+    idxs = np.concatenate([np.arange(n), np.zeros(pad, dtype=np.int64)])
+    if weights is None:
+        weights = np.ones(n)
+    weights = np.concatenate([weights, np.zeros(pad)]).astype(np.float32)
+    return (
+        xs[idxs].reshape((n_devices, per_device) + xs.shape[1:]),
+        ys[idxs].reshape((n_devices, per_device) + ys.shape[1:]),
+        weights.reshape((n_devices, per_device)),
+    )
+
+
+def fixed_batches(lengths: np.ndarray, batch_size: int) -> List[List[int]]:
+    """
+    Batches of at most batch_size same-length sequences, in a fixed order (for
+    evaluation, see epoch_batches for training).
+    """
+    batches = []
+    for idxs in length_groups(lengths):
+        for start in range(0, len(idxs), batch_size):
+            batches.append([int(i) for i in idxs[start : start + batch_size]])
+    return batches
+
+
+def holdout_pairs(sequences: SequenceSource, batches: List[List[int]]):
+    """
+    Yield the one-hot (xs, ys) of every batch in batches.
+    """
+    for batch in batches:
+        yield input_output_pairs([sequences[j] for j in batch])
+
+
+def training_batches(
+    sequences: SequenceSource,
+    batches: List[List[int]],
+    n_devices: int,
+    sample_weights: Optional[np.ndarray] = None,
+):
+    """
+    Yield the sharded (xs, ys, weights) of every batch in batches, see shard_batch.
+    """
+    for batch in batches:
+        x, y = input_output_pairs([sequences[j] for j in batch])
+        w = None if sample_weights is None else sample_weights[batch]
+        yield shard_batch(x, y, n_devices, w)
+
+
+def replicate(tree, n_devices: int):
+    return jax.tree_map(lambda x: jnp.stack([x] * n_devices), tree)
+
+
+def unreplicate(tree):
+    return jax.tree_map(lambda x: x[0], tree)
+
+
+def checkpoint_path(ckpt_dir: Path, step: int) -> Path:
+    return Path(ckpt_dir) / f"{CHECKPOINT_PREFIX}{step:08d}.pkl"
+
+
+def latest_checkpoint(ckpt_dir: Path) -> Optional[Path]:
+    """
+    Return the most recent checkpoint in ckpt_dir, or None if there are none.
+    """
+    ckpt_dir = Path(ckpt_dir)
+    if not ckpt_dir.is_dir():
+        return None
+    ckpts = sorted(ckpt_dir.glob(f"{CHECKPOINT_PREFIX}*.pkl"))
+    if len(ckpts) == 0:
+        return None
+    return ckpts[-1]
+
+
+def save_checkpoint(ckpt_dir: Path, state: Dict[str, Any], keep: int = 2) -> Path:
+    """
+    Atomically write a checkpoint (state tagged with CHECKPOINT_FORMAT) and prune all
+    but the newest `keep` of them.
+    """
+    ckpt_dir = Path(ckpt_dir)
+    ckpt_dir.mkdir(parents=True, exist_ok=True)
+    path = checkpoint_path(ckpt_dir, state["step"])
+    tmp_path = path.with_suffix(".tmp")
+    with open(tmp_path, "wb") as f:
+        pkl.dump(dict(state, format=CHECKPOINT_FORMAT), f)
+    os.replace(tmp_path, path)
+
+    for old in sorted(ckpt_dir.glob(f"{CHECKPOINT_PREFIX}*.pkl"))[:-keep]:
+        old.unlink()
+    return path
+
+
+def load_checkpoint(path: Path) -> Dict[str, Any]:
+    with open(path, "rb") as f:
+        ckpt = pkl.load(f)
+    if not isinstance(ckpt, dict) or ckpt.get("format") != CHECKPOINT_FORMAT:
+        raise ValueError(
+            f"{path} is not a checkpoint this version can resume, "
+            "use a new run_name to start over."
+        )
+    return ckpt
+
+
+def digest(a: np.ndarray) -> str:
+    return hashlib.sha1(np.ascontiguousarray(a).tobytes()).hexdigest()
+
+
+def run_config(
+    sequences: SequenceSource,
+    params: Any,
+    seed: int,
+    batch_size: int,
+    step_size: float,
+    sample_weights: Optional[np.ndarray] = None,
+) -> Dict[str, Any]:
+    """
+    What a checkpoint has to match to be resumed: the training set (its size and the
+    lengths of its sequences), the model (the shapes of its params), the sample
+    weights, the seed and the batch settings. The number of epochs can change.
+    """
+    return {
+        "n_sequences": len(sequences),
+        "lengths": digest(sequence_lengths(sequences).astype(np.int64)),
+        "param_shapes": [list(np.shape(x)) for x in jax.tree_leaves(params)],
+        "sample_weights": None if sample_weights is None
+        else digest(np.asarray(sample_weights, dtype=np.float64)),
+        "seed": seed,
+        "batch_size": batch_size,
+        "step_size": step_size,
+    }
+
+
+def to_host(tree):
+    return jax.tree_map(np.asarray, tree)
+
+
+def fit(
+    sequences: SequenceSource,
+    model_func: Callable,
+    params: Any,
+    run_dir: Path,
+    holdout_seqs: Optional[SequenceSource] = None,
+    n_epochs: int = 20,
+    batch_size: int = 25,
+    step_size: float = 1e-4,
+    checkpoint_every: int = 100,
+    seed: int = 42,
+    on_checkpoint: Optional[Callable[[Path], None]] = None,
+    n_devices: Optional[int] = None,
+    sample_weights: Optional[np.ndarray] = None,
+    timer: Optional[Any] = None,
+) -> Any:
+    """
+    Evotune params on sequences, checkpointing to run_dir as it goes.
+
+    If run_dir/checkpoints already holds a checkpoint, training resumes from it
+    (same step count, optimizer moments and data order), after checking it was written
+    for the same run_config. A checkpoint is written
+    every `checkpoint_every` steps and at the end of every epoch. At the end of each
+    epoch the holdout loss (the mean loss per holdout sequence, streamed in batches of
+    batch_size like the training data) is computed if holdouts are given, and the best
+    params so far are saved to run_dir/best with their step and holdout loss. on_checkpoint(run_dir) is called after
+    every write, e.g. to sync the directory to remote storage.
+    Every batch is split over n_devices (default: all local devices). Each device
+    computes the gradient of its shard and the gradients are summed across devices,
+    so the update is the same as for the whole batch on a single device and a fixed
+    seed gives the same result on every run.
+    With sample_weights (one per sequence, e.g. the cluster sizes of deduplicated
+    inputs, see wf/dedup.py) each batch's loss is the weighted mean over its sequences.
+    sequences and holdout_seqs can be TokenSequences, then only the batches being built
+    are decoded, PREFETCH_BATCHES steps ahead on a background thread. Neither set is
+    ever one-hot encoded as a whole.
+    With a timer (unirep_source.metrics.StageTimer), the compile time of the training
+    step and the holdout loss for every batch shape is recorded as a "compile" stage,
+    see compiled_call.
+    Returns the final params.
+    """
+    run_dir = Path(run_dir)
+    ckpt_dir = run_dir / CHECKPOINT_DIR
+    model_func = jit(model_func)
+    if n_devices is None:
+        n_devices = jax.local_device_count()
+
+    init, update, get_params = adamW(step_size=step_size)
+
+    @partial(pmap, axis_name="devices", in_axes=(None, 0, 0, 0, 0))
+    def step(i, x, y, w, opt_state):
+        g = grad(partial(weighted_loss, predict=model_func))(
+            get_params(opt_state), inputs=x, targets=y, weights=w
+        )
+        # All-reduce, then normalize by the number of real sequences in the batch
+        n = lax.psum(jnp.sum(w), axis_name="devices")
+        g = jax.tree_map(lambda d: lax.psum(d, axis_name="devices") / n, g)
+        return update(i, g, opt_state)
+
+    # Executables of the training step and holdout loss, by batch shape
+    compiled = {}
+
+    @jit
+    def holdout_batch_loss(params, x, y):
+        return weighted_loss(params, model_func, x, y, jnp.ones(len(x)))
+
+    def holdout_loss(params):
+        """
+        Mean per-sequence loss over the holdout set, streamed batch by batch.
+        """
+        total = 0.0
+        for x, y in prefetch(holdout_pairs(holdout_seqs, holdout)):
+            total += float(compiled_call(
+                timer, compiled, ("holdout",) + x.shape, holdout_batch_loss, params, x, y,
+                step="holdout", shape=list(x.shape),
+            ))
+        return total / len(holdout_seqs)
+
+    # Only the indices of the holdout batches are kept, not their one-hot encodings
+    holdout = []
+    if holdout_seqs is not None and len(holdout_seqs) > 0:
+        holdout = fixed_batches(sequence_lengths(holdout_seqs), batch_size)
+
+    # Start fresh or resume from the newest checkpoint
+    start_epoch, start_batch, i = 0, 0, 0
+    best_loss = None
+    config = run_config(sequences, params, seed, batch_size, step_size, sample_weights)
+    opt_state = init(params)
+    latest = latest_checkpoint(ckpt_dir)
+    if latest is not None:
+        ckpt = load_checkpoint(latest)
+        changed = [k for k, v in config.items() if ckpt["config"].get(k) != v]
+        if changed:
+            raise ValueError(
+                f"Checkpoint {latest} was written for a different run ({', '.join(changed)} "
+                "changed), use a new run_name to start over."
+            )
+        opt_state = pack_optimizer_state(ckpt["opt_state"])
+        start_epoch, start_batch, i = ckpt["epoch"], ckpt["batch"], ckpt["step"]
+        best_loss = ckpt["best_loss"]
+        if best_loss is not None and not (run_dir / BEST_DIR / PARAMS_FILE).exists():
+            # Without the params, a later epoch has to beat nothing to be saved
+            print(f"The best params of {latest.name} are missing, tracking the best anew")
+            best_loss = None
+        print(f"Resuming from {latest.name}: epoch {start_epoch}, batch {start_batch}")
+    opt_state = replicate(opt_state, n_devices)
+
+    def checkpoint(epoch, batch):
+        save_checkpoint(
+            ckpt_dir,
+            {
+                "config": config,
+                "step": i,
+                "epoch": epoch,
+                "batch": batch,
+                "best_loss": best_loss,
+                "opt_state": unpack_optimizer_state(unreplicate(opt_state)),
+            },
+        )
+        if on_checkpoint is not None:
+            on_checkpoint(run_dir)
+
+    for epoch in range(start_epoch, n_epochs):
+        batches = epoch_batches(sequences, batch_size, seed, epoch)
+        first = start_batch if epoch == start_epoch else 0
+        sharded = prefetch(
+            training_batches(sequences, batches[first:], n_devices, sample_weights)
+        )
+        for b, (x, y, w) in enumerate(sharded, start=first):
+            opt_state = compiled_call(
+                timer, compiled, ("train",) + x.shape, step, i, x, y, w, opt_state,
+                step="train", shape=list(x.shape),
+            )
+            i += 1
+            if i % checkpoint_every == 0:
+                checkpoint(epoch, b + 1)
+
+        if holdout:
+            params = get_params(unreplicate(opt_state))
+            loss = holdout_loss(params)
+            print(f"Epoch {epoch + 1}/{n_epochs}: holdout loss {loss:.4f}")
+            if best_loss is None or loss < best_loss:
+                best_loss = loss
+                save_params(run_dir / BEST_DIR, to_host(params), step=i, holdout_loss=loss)
+        checkpoint(epoch + 1, 0)
+
+    return get_params(unreplicate(opt_state))
@@ -0,0 +1,154 @@
+"""
+Streaming FASTA reading for the workflow inputs.
+
+.fasta, .fa and .faa files are read, optionally gzip or bgzip compressed (bgzip is
+multi-member gzip, which the gzip module reads as one stream). Compressed files are
+decompressed and parsed as a stream. Large uncompressed files are split into byte
+ranges that start at a record header and parsed by a process pool, with only a few
+ranges in flight at a time so memory stays bounded while the records are yielded in
+file order.
+"""
+import gzip
+import io
+import os
+from multiprocessing import Pool
+from pathlib import Path
+from typing import Iterator, List, Optional, Tuple
+
+FASTA_SUFFIXES = [".fasta", ".fa", ".faa"]
+COMPRESSED_SUFFIXES = [".gz", ".bgz"]
+# Bytes per range parsed by one pool task, and the smallest file worth splitting
+CHUNK_BYTES = 32 << 20
+MIN_PARALLEL_BYTES = 64 << 20
+# How every path decodes the files, so names never depend on which path read them
+ENCODING = "utf-8"
+ERRORS = "replace"
+
+
+def is_compressed(path: Path) -> bool:
+    return Path(path).suffix.lower() in COMPRESSED_SUFFIXES
+
+
+def format_suffix(path: Path) -> str:
+    """
+    The suffix that says what the file holds, behind any compression suffix.
+    """
+    path = Path(path)
+    if is_compressed(path):
+        path = path.with_suffix("")
+    return path.suffix.lower()
+
+
+def is_fasta(path: Path) -> bool:
+    return format_suffix(path) in FASTA_SUFFIXES
+
+
+def file_stem(path: Path) -> str:
+    """
+    The file name without its format and compression suffixes, e.g. seqs for
+    seqs.fa.gz.
+    """
+    path = Path(path)
+    if is_compressed(path):
+        path = path.with_suffix("")
+    return path.stem
+
+
+def open_text(path: Path):
+    """
+    Open path for reading text, decompressing it on the fly if it is compressed.
+    """
+    if is_compressed(path):
+        return gzip.open(path, "rt", encoding=ENCODING, errors=ERRORS)
+    return open(path, "r", encoding=ENCODING, errors=ERRORS)
+
+
+def parse_records(lines) -> Iterator[Tuple[str, str]]:
+    """
+    Yield (id, sequence) for every record in the lines of a FASTA file. The id is the
+    header up to the first whitespace, as Bio.SeqIO gives it. Lines before the first
+    header are skipped.
+    """
+    record_id = None
+    seq = []
+    for line in lines:
+        if line.startswith(">"):
+            if record_id is not None:
+                yield record_id, "".join(seq)
+            words = line[1:].split(None, 1)
+            record_id = words[0] if words else ""
+            seq = []
+        elif record_id is not None:
+            seq.append("".join(line.split()))
+    if record_id is not None:
+        yield record_id, "".join(seq)
+
+
+def record_ranges(path: Path, chunk_bytes: int = CHUNK_BYTES) -> List[Tuple[int, int]]:
+    """
+    Split the uncompressed file at path into (start, end) byte ranges of about
+    chunk_bytes, every one starting at a record header (or at the start of the file).
+    """
+    size = os.path.getsize(path)
+    starts = [0]
+    with open(path, "rb") as f:
+        target = chunk_bytes
+        while target < size:
+            # The first header that starts after target
+            f.seek(target - 1)
+            f.readline()
+            position = f.tell()
+            line = f.readline()
+            while line and not line.startswith(b">"):
+                position = f.tell()
+                line = f.readline()
+            if not line:
+                break
+            if position > starts[-1]:
+                starts.append(position)
+            target = position + chunk_bytes
+    return list(zip(starts, starts[1:] + [size]))
+
+
+def parse_range(args: Tuple[str, int, int]) -> List[Tuple[str, str]]:
+    """
+    The records of the byte range (start, end) of path, see record_ranges.
+    """
+    path, start, end = args
+    with open(path, "rb") as f:
+        f.seek(start)
+        data = f.read(end - start)
+    # Decoded and split into lines exactly as open_text does
+    with io.TextIOWrapper(io.BytesIO(data), encoding=ENCODING, errors=ERRORS) as text:
+        return list(parse_records(text))
+
+
+def read_fasta(
+    path: Path,
+    processes: Optional[int] = None,
+    chunk_bytes: int = CHUNK_BYTES,
+    min_parallel_bytes: int = MIN_PARALLEL_BYTES,
+) -> Iterator[Tuple[str, str]]:
+    """
+    Yield (id, sequence) for every record of the FASTA file at path, in file order.
+    Uncompressed files of at least min_parallel_bytes are parsed in ranges of
+    chunk_bytes by a pool of processes (default: one per CPU).
+    """
+    path = Path(path)
+    processes = processes or os.cpu_count() or 1
+    if is_compressed(path) or processes < 2 or os.path.getsize(path) < min_parallel_bytes:
+        with open_text(path) as f:
+            yield from parse_records(f)
+        return
+
+    ranges = [(str(path), start, end) for start, end in record_ranges(path, chunk_bytes)]
+    with Pool(processes) as pool:
+        # Keep a couple of ranges per process queued, not the whole file
+        window = 2 * processes
+        pending = [pool.apply_async(parse_range, (r,)) for r in ranges[:window]]
+        for i in range(len(ranges)):
+            records = pending[i].get()
+            pending[i] = None
+            if i + window < len(ranges):
+                pending.append(pool.apply_async(parse_range, (ranges[i + window],)))
+            yield from records
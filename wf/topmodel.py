@@ -0,0 +1,138 @@
+"""
+Ridge regression top models on UniRep representations.
+
+Reps are collected into a single contiguous [n, d] matrix as they come back. The ridge solution for
+every regularization strength comes from one SVD of the (centered) training matrix:
+with X = U S V^T, the coefficients for alpha are V diag(S / (S^2 + alpha)) U^T y, so
+the whole path is a couple of matrix products. k-fold cross-validation does one SVD
+per fold and scores all alphas at once.
+"""
+import csv
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+DEFAULT_ALPHAS = np.logspace(-4, 4, 17)
+# Columns the header row of a labels csv must name
+LABEL_COLUMNS = ["sequence", "label"]
+
+
+class RepCollector:
+    """
+    Output writer for wf.run_inference that keeps the avg_hidden rep of every sequence
+    of a rep run in one [n, d] float32 matrix instead of writing files, so a top model
+    is fitted on the arrays the worker returned. found marks the valid sequences
+    (invalid ones are left as zero rows). Batches arrive in order.
+    """
+
+    def __init__(self, n: int):
+        self.reps: Optional[np.ndarray] = None
+        self.found = np.zeros(n, dtype=bool)
+        self.count = 0
+
+    def write(self, seqs_and_names: List[List[str]], header: dict, arrays: dict):
+        if self.reps is None:
+            self.reps = np.zeros((len(self.found), arrays["reps"].shape[-1]), dtype=np.float32)
+        end = self.count + len(seqs_and_names)
+        self.found[self.count : end] = arrays["valid"]
+        self.reps[self.count : end] = np.where(arrays["valid"][:, None], arrays["reps"][:, 0], 0)
+        self.count = end
+
+    def close(self):
+        pass
+
+
+def ridge_path(X: np.ndarray, y: np.ndarray, alphas: np.ndarray) -> Dict[str, np.ndarray]:
+    """
+    Fit ridge regression for all alphas from a single SVD of X.
+    Returns coefficients [n_alphas, d] and intercepts [n_alphas].
+    """
+    X = np.asarray(X, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    alphas = np.asarray(alphas, dtype=np.float64)
+    x_mean, y_mean = X.mean(axis=0), y.mean()
+    U, S, Vt = np.linalg.svd(X - x_mean, full_matrices=False)
+    Uty = U.T @ (y - y_mean)
+    # [n_alphas, k] shrinkage factors applied to the singular directions
+    d = S / (S ** 2 + alphas[:, None])
+    coefs = (d * Uty) @ Vt
+    return {"coefs": coefs, "intercepts": y_mean - coefs @ x_mean}
+
+
+def kfold_indices(n: int, n_folds: int, seed: int = 42) -> List[np.ndarray]:
+    return np.array_split(np.random.RandomState(seed).permutation(n), n_folds)
+
+
+def cross_validate(
+    X: np.ndarray,
+    y: np.ndarray,
+    alphas: np.ndarray = DEFAULT_ALPHAS,
+    n_folds: int = 5,
+    seed: int = 42,
+) -> np.ndarray:
+    """
+    k-fold cross-validated mean squared error of every alpha, shape [n_alphas].
+    """
+    n_folds = max(2, min(n_folds, len(y)))
+    sq_errors = np.zeros(len(alphas))
+    for test in kfold_indices(len(y), n_folds, seed):
+        train = np.setdiff1d(np.arange(len(y)), test)
+        path = ridge_path(X[train], y[train], alphas)
+        # [n_test, n_alphas] predictions of every alpha
+        preds = X[test] @ path["coefs"].T + path["intercepts"]
+        sq_errors += ((preds - y[test][:, None]) ** 2).sum(axis=0)
+    return sq_errors / len(y)
+
+
+def fit_ridge_cv(
+    X: np.ndarray,
+    y: np.ndarray,
+    alphas: np.ndarray = DEFAULT_ALPHAS,
+    n_folds: int = 5,
+    seed: int = 42,
+) -> Dict[str, np.ndarray]:
+    """
+    Choose alpha by k-fold cross-validation and refit on all of X, y.
+    Returns a dict with coef, intercept, alpha, and the cv_mse of every alpha.
+    """
+    alphas = np.asarray(alphas, dtype=np.float64)
+    cv_mse = cross_validate(X, y, alphas, n_folds, seed)
+    best = int(np.argmin(cv_mse))
+    path = ridge_path(X, y, alphas[best : best + 1])
+    return {
+        "coef": path["coefs"][0],
+        "intercept": path["intercepts"][0],
+        "alpha": alphas[best],
+        "alphas": alphas,
+        "cv_mse": cv_mse,
+    }
+
+
+def predict(model: Dict[str, np.ndarray], X: np.ndarray) -> np.ndarray:
+    return X @ model["coef"] + model["intercept"]
+
+
+def read_labels(path: Path) -> Tuple[List[str], np.ndarray]:
+    """
+    Read a csv whose header row names a sequence and a label column (in any order,
+    other columns are ignored) into sequences and labels.
+    """
+    seqs, labels = [], []
+    with open(path, "r", newline="") as f:
+        reader = csv.DictReader(f)
+        reader.fieldnames = [name.strip().lower() for name in reader.fieldnames or []]
+        missing = [c for c in LABEL_COLUMNS if c not in reader.fieldnames]
+        if missing:
+            raise ValueError(
+                f"The labels csv needs a header row naming the columns {', '.join(LABEL_COLUMNS)} "
+                f"(missing: {', '.join(missing)})."
+            )
+        for row in reader:
+            label = (row["label"] or "").strip()
+            try:
+                labels.append(float(label))
+            except ValueError:
+                raise ValueError(f"Invalid label on line {reader.line_num}: {label}")
+            seqs.append((row["sequence"] or "").strip().upper())
+    return seqs, np.array(labels)